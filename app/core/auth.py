@@ -1,49 +1,30 @@
-from fastapi import Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer
-from app.core.security import decode_token
+from fastapi import Depends, HTTPException
+from app.core.cache import TTLCache
+from app.core.config import settings
 from app.db.supabase import supabase
+# Guardas de rol: solo con los claims del token, sin leer la fila del usuario
+from app.middlewares.role_guard import (  # noqa: F401
+    oauth2_scheme, verify_token, get_claims, require_medico, require_admin, require_paciente,
+)
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/users/login")
+# Filas de `users` por id (sub del JWT); invalidar al modificar un usuario
+user_cache = TTLCache(maxsize=settings.USER_CACHE_MAXSIZE, ttl=settings.USER_CACHE_TTL_SECONDS)
 
-def get_current_user(token: str = Depends(oauth2_scheme)):
-    payload = decode_token(token)
-    if payload is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token inválido o expirado",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    user_id = payload.get("id")
+def invalidate_user(user_id: str):
+    user_cache.invalidate(str(user_id))
+
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+    payload = verify_token(token)
+    user_id = str(payload.get("id"))
+    user = user_cache.get(user_id)
+    if user is not None:
+        return dict(user)
     try:
-        user = supabase.table("users").select("*").eq("id", user_id).single().execute().data
+        res = await supabase.table("users").select("*").eq("id", user_id).limit(1).execute()
+        user = res.data[0] if res.data else None
     except Exception:
         raise HTTPException(status_code=500, detail="Error consultando usuario en Supabase")
     if not user:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
-    return user
-
-# ---- Roles ----
-
-def require_medico(current_user: dict = Depends(get_current_user)):
-    if current_user["rol"] != "medico":
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Acceso solo para médicos",
-        )
-    return current_user
-
-def require_admin(current_user: dict = Depends(get_current_user)):
-    if current_user["rol"] != "admin":
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Acceso solo para administrador",
-        )
-    return current_user
-
-def require_paciente(current_user: dict = Depends(get_current_user)):
-    if current_user["rol"] != "paciente":
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Acceso solo para pacientes",
-        )
-    return current_user
+    user_cache.set(user_id, user)
+    return dict(user)
@@ -0,0 +1,190 @@
+"""
+Caché en proceso con TTL y expulsión LRU, y caché LRU de archivos en disco.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+class TTLCache:
+    """
+    Caché LRU acotada a `maxsize` entradas que caducan a los `ttl` segundos.
+    Segura entre hilos; lleva contadores de aciertos y fallos. `on_evict`
+    recibe cada valor que sale de la caché (caducado, expulsado, sustituido o
+    invalidado), fuera del lock, p. ej. para cerrar recursos.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, on_evict: Optional[Callable[[Any], None]] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _evicted(self, values: list) -> None:
+        if self.on_evict:
+            for value in values:
+                self.on_evict(value)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] >= time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            if item is not None:
+                del self._data[key]  # caducada
+            self.misses += 1
+        if item is not None:
+            self._evicted([item[1]])
+        return None
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            old = self._data.get(key)
+            salen = [old[1]] if old is not None and old[1] is not value else []
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                salen.append(self._data.popitem(last=False)[1][1])
+        self._evicted(salen)
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            item = self._data.pop(key, None)
+        if item is not None:
+            self._evicted([item[1]])
+
+    def clear(self) -> None:
+        with self._lock:
+            salen = [v for _, v in self._data.values()]
+            self._data.clear()
+        self._evicted(salen)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class DiskLRUCache:
+    """
+    Caché LRU de archivos en un directorio, acotada a `max_bytes` en total.
+
+    Pensada para objetos inmutables (la clave identifica el contenido). Se
+    escribe a un temporal del propio directorio y `put` lo publica con un
+    rename atómico. El orden LRU sobrevive a reinicios vía mtime.
+    """
+
+    _SUFFIX = ".bin"
+    # Los temporales son de cualquier worker que comparta el directorio: solo
+    # se borran los abandonados (sin tocar desde hace más que esto)
+    _TMP_MAX_AGE = 24 * 3600
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, int] = OrderedDict()  # nombre -> bytes
+        self._bytes = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        found = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".tmp"):
+                self._reap(entry)
+            elif entry.name.endswith(self._SUFFIX):
+                st = entry.stat()
+                found.append((st.st_mtime, entry.name, st.st_size))
+        for _, name, size in sorted(found):
+            self._entries[name] = size
+            self._bytes += size
+        self._loaded = True
+        self._evict()
+
+    def _reap(self, entry: os.DirEntry) -> None:
+        try:
+            if time.time() - entry.stat().st_mtime > self._TMP_MAX_AGE:
+                os.remove(entry.path)  # escritura a medias de un proceso que murió
+        except FileNotFoundError:
+            pass  # publicado o borrado por otro worker mientras tanto
+
+    def _name(self, key: str) -> str:
+        return hashlib.sha256(key.encode("utf-8")).hexdigest() + self._SUFFIX
+
+    def get(self, key: str) -> Optional[tuple[str, int]]:
+        """Ruta y tamaño del archivo cacheado, o None."""
+        name = self._name(key)
+        path = os.path.join(self.directory, name)
+        with self._lock:
+            self._load()
+            size = self._entries.get(name)
+            if size is None or not os.path.exists(path):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(name)
+            self.hits += 1
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return path, size
+
+    def temp_path(self) -> str:
+        with self._lock:
+            self._load()
+        fd, path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        os.close(fd)
+        return path
+
+    def put(self, key: str, temp_path: str) -> None:
+        """Publica `temp_path` (de `temp_path()`) como el contenido de `key`."""
+        size = os.path.getsize(temp_path)
+        if size > self.max_bytes:
+            os.remove(temp_path)
+            return
+        name = self._name(key)
+        with self._lock:
+            os.replace(temp_path, os.path.join(self.directory, name))
+            self._bytes += size - self._entries.pop(name, 0)
+            self._entries[name] = size
+            self._evict()
+
+    def _evict(self) -> None:
+        while self._bytes > self.max_bytes and self._entries:
+            name, size = self._entries.popitem(last=False)
+            self._bytes -= size
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
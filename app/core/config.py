@@ -3,6 +3,8 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 class Settings(BaseSettings):
     APP_ENV: str = "dev"
     APP_PORT: int = 8080
+    LOG_LEVEL: str = "INFO"
+    LOG_JSON: bool = True
     FRONTEND_ORIGIN: str = "http://localhost:8030"
 
     JWT_SECRET: str
@@ -10,6 +12,12 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 15
     REFRESH_TOKEN_EXPIRE_DAYS: int = 7
 
+    TOKEN_REVOCATION_DB_PATH: str = ".cache/revoked_tokens.sqlite3"
+
+    BCRYPT_ROUNDS: int = 12
+    BCRYPT_WORKERS: int = 4
+    BCRYPT_MAX_QUEUE: int = 64
+
     SUPABASE_URL: str
     SUPABASE_ANON_KEY: str
     SUPABASE_SERVICE_ROLE_KEY: str
@@ -22,6 +30,61 @@ class Settings(BaseSettings):
     OPENAI_MODEL_CHATBOT: str
 
     PDF_LOGO_PATH: str
+    PDF_WORKERS: int = 2
+    REPORT_BATCH_MAX_ITEMS: int = 200
+    REPORT_UPLOAD_CONCURRENCY: int = 8
+    REPORT_CACHE_DIR: str = ".cache/reportes"
+    REPORT_CACHE_MAX_BYTES: int = 512 * 1024 * 1024
+    REPORT_SIGNED_URL_TTL_SECONDS: int = 60
+
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE: int = 20
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    HTTP_TIMEOUT: float = 30.0
+    OPENAI_TIMEOUT: float = 60.0
+
+    USER_CACHE_MAXSIZE: int = 10000
+    USER_CACHE_TTL_SECONDS: int = 60
+
+    RBAC_INDEX_TTL_SECONDS: int = 300
+
+    # Búsqueda de usuarios: índice de trigramas en memoria, recargado cada TTL
+    USER_SEARCH_TTL_SECONDS: int = 600
+    USER_SEARCH_LIMIT_MAX: int = 100
+
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_PATH: str = ".cache/llm_cache.sqlite3"
+    LLM_CACHE_TTL_SECONDS: int = 7 * 24 * 3600
+    LLM_CACHE_MAX_ENTRIES: int = 5000
+    LLM_CACHE_MAX_BYTES: int = 50 * 1024 * 1024
+
+    CHAT_CONTEXT_TOKENS: int = 1500
+    PATIENT_CONTEXT_CACHE_SIZE: int = 5000
+    PATIENT_CONTEXT_TTL_SECONDS: int = 600
+
+    PAGE_SIZE_DEFAULT: int = 50
+    PAGE_SIZE_MAX: int = 200
+
+    GENOTYPE_CACHE_DIR: str = ".cache/genotipos"
+    GENOTYPE_CACHE_MAX_BYTES: int = 1024 * 1024 * 1024
+
+    # Asignaciones médico–paciente en bloque (API y CSV)
+    ASSIGN_BATCH_SIZE: int = 200  # ids por filtro `in_` (van en la URL)
+    ASSIGN_MAX_PAIRS: int = 10000
+    ASSIGN_MAX_INCIDENCIAS: int = 1000  # incidencias detalladas en la respuesta
+
+    # Ingesta de cohortes: muestras por VCF y filas por inserción
+    COHORT_MAX_SAMPLES: int = 5000
+    COHORT_BATCH_SIZE: int = 500
+    COHORT_LOOKUP_BATCH_SIZE: int = 200  # ids por filtro `in_` (van en la URL)
+
+    UPLOAD_PART_SIZE: int = 8 * 1024 * 1024
+    UPLOAD_PART_MAX_BYTES: int = 64 * 1024 * 1024
+    UPLOAD_MAX_PARTS: int = 10000
+    UPLOAD_ASSEMBLY_TIMEOUT_SECONDS: int = 3600  # `ensamblando` más tiempo: se da por abandonado
+
+    JOB_WORKERS: int = 4
+    JOB_RETENTION_SECONDS: int = 3600
 
     model_config = SettingsConfigDict(
         env_file=".env",
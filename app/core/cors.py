@@ -1,5 +1,7 @@
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
+from app.core.logging import REQUEST_ID_HEADER
+from app.utils.pagination import NEXT_CURSOR_HEADER
 
 origins = [
     "http://localhost:8030",  # Vite
@@ -14,4 +16,5 @@ def setup_cors(app):
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=[NEXT_CURSOR_HEADER, REQUEST_ID_HEADER],
     )
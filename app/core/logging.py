@@ -0,0 +1,249 @@
+"""
+Observabilidad: logs JSON con request id, latencia por ruta y tiempos de
+las llamadas a servicios externos (Supabase, Storage, OpenAI, PDF).
+
+- `RequestContextMiddleware` asigna un request id (o reutiliza la cabecera
+  `X-Request-ID`), mide la petición y escribe una línea de log con el
+  desglose de tiempo por servicio externo.
+- `span(servicio, operación)` mide un bloque; `instrument_transport` envuelve
+  el transporte httpx de un cliente para medir cada llamada HTTP, cuerpo
+  incluido.
+- Todo se publica como histogramas de Prometheus en `/metrics`.
+"""
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+import httpx
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess, REGISTRY,
+)
+
+from app.core.config import settings
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+# Segundos acumulados por servicio externo durante la petición en curso
+_upstream_var: ContextVar[Optional[dict]] = ContextVar("upstream", default=None)
+
+logger = logging.getLogger("app.request")
+
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "Latencia de las peticiones HTTP por ruta",
+    ["method", "route", "status"],
+)
+UPSTREAM_LATENCY = Histogram(
+    "upstream_duration_seconds", "Duración de las llamadas a servicios externos",
+    ["service", "operation"],
+)
+UPSTREAM_ERRORS = Counter(
+    "upstream_errors_total", "Llamadas a servicios externos fallidas (excepción o status >= 500)",
+    ["service", "operation"],
+)
+
+
+# ---------------- Logs JSON ----------------
+
+class JsonFormatter(logging.Formatter):
+    _RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "request_id": request_id_var.get(),
+        }
+        # Campos pasados con `extra=`
+        for key, value in vars(record).items():
+            if key not in self._RESERVED and not key.startswith("_"):
+                data[key] = value
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+def setup_logging():
+    handler = logging.StreamHandler(sys.stdout)
+    if settings.LOG_JSON:
+        handler.setFormatter(JsonFormatter())
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(settings.LOG_LEVEL)
+    # httpx registra cada petición en INFO; eso ya lo cubren los spans
+    for name in ("httpx", "httpcore"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+
+# ---------------- Spans de servicios externos ----------------
+
+def _record(service: str, operation: str, seconds: float, error: bool, bucket: Optional[dict]):
+    UPSTREAM_LATENCY.labels(service, operation).observe(seconds)
+    if error:
+        UPSTREAM_ERRORS.labels(service, operation).inc()
+    if bucket is not None:
+        bucket[service] = bucket.get(service, 0.0) + seconds
+
+
+@contextmanager
+def span(service: str, operation: str):
+    """Mide el bloque como una llamada a `service` (vale dentro de código async)."""
+    bucket = _upstream_var.get()
+    start = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        _record(service, operation, time.perf_counter() - start, error, bucket)
+
+
+def upstream_breakdown() -> dict:
+    """Milisegundos por servicio externo acumulados en el contexto actual."""
+    return {k: round(v * 1000, 1) for k, v in (_upstream_var.get() or {}).items()}
+
+
+@contextmanager
+def upstream_context():
+    """Abre un acumulador de tiempos propio (p. ej. para un job en segundo plano)."""
+    token = _upstream_var.set({})
+    try:
+        yield
+    finally:
+        _upstream_var.reset(token)
+
+
+class _TimedStream(httpx.AsyncByteStream):
+    def __init__(self, stream, on_close):
+        self._stream = stream
+        self._on_close = on_close
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            self._on_close()
+
+
+def _operation(service: str, request: httpx.Request) -> str:
+    # Etiquetas acotadas: método + tabla / tipo de operación, nunca ids
+    parts = [p for p in request.url.path.split("/") if p]
+    if service == "supabase_rest":
+        return f"{request.method} {parts[2] if len(parts) > 2 else '-'}"
+    if service == "supabase_storage":
+        kind = parts[2] if len(parts) > 2 else "-"
+        if kind != "object":
+            return f"{request.method} {kind}"
+        if len(parts) > 3 and parts[3] in ("sign", "move", "copy", "list"):
+            return parts[3]
+        return {"GET": "download", "HEAD": "info", "DELETE": "remove"}.get(request.method, "upload")
+    return f"{request.method} {'/'.join(parts[-2:])}"
+
+
+class _InstrumentedTransport(httpx.AsyncBaseTransport):
+    def __init__(self, service: str, transport: httpx.AsyncBaseTransport):
+        self._service = service
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        operation = _operation(self._service, request)
+        bucket = _upstream_var.get()
+        start = time.perf_counter()
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            _record(self._service, operation, time.perf_counter() - start, True, bucket)
+            raise
+
+        def done():
+            _record(self._service, operation, time.perf_counter() - start, response.status_code >= 500, bucket)
+
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_TimedStream(response.stream, done),
+            extensions=response.extensions,
+            request=request,
+        )
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+def instrument_transport(service: str, transport: httpx.AsyncBaseTransport) -> httpx.AsyncBaseTransport:
+    """Envuelve un transporte httpx: cada llamada (hasta cerrar el cuerpo) cuenta como span."""
+    return _InstrumentedTransport(service, transport)
+
+
+# ---------------- Middleware y /metrics ----------------
+
+class RequestContextMiddleware:
+    """Middleware ASGI: request id, histograma por ruta y log de acceso JSON."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope.get("headers") or [])
+        request_id = headers.get(REQUEST_ID_HEADER.lower().encode(), b"").decode("latin-1")[:64] or uuid.uuid4().hex
+        rid_token = request_id_var.set(request_id)
+        up_token = _upstream_var.set({})
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [
+                    (REQUEST_ID_HEADER.lower().encode(), request_id.encode("latin-1"))
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "sin_ruta"
+            HTTP_LATENCY.labels(scope["method"], route_path, str(status)).observe(elapsed)
+            logger.info(
+                "%s %s %s", scope["method"], scope["path"], status,
+                extra={
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "route": route_path,
+                    "status": status,
+                    "duration_ms": round(elapsed * 1000, 1),
+                    "upstream_ms": upstream_breakdown(),
+                },
+            )
+            _upstream_var.reset(up_token)
+            request_id_var.reset(rid_token)
+
+
+def metrics_payload() -> tuple[bytes, str]:
+    """Exposición de Prometheus; con PROMETHEUS_MULTIPROC_DIR agrega todos los workers."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,102 @@
+"""
+Hash y verificación de contraseñas fuera del event loop y del threadpool.
+
+bcrypt es CPU puro (y libera el GIL), así que se ejecuta en un executor
+propio de `BCRYPT_WORKERS` hilos: una ráfaga de logins no ocupa el
+threadpool que usan el resto de endpoints. La cola está acotada
+(`BCRYPT_MAX_QUEUE`); si se llena se responde 503 en vez de acumular
+latencia.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+from app.core.config import settings
+from app.core import security
+
+_executor: ThreadPoolExecutor | None = None
+_pending = 0  # tareas enviadas y no terminadas (solo se toca desde el event loop)
+_lock = threading.Lock()
+_metrics = {"completed": 0, "rejected": 0, "rehashed": 0, "wait_s": 0.0, "run_s": 0.0}
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.BCRYPT_WORKERS, thread_name_prefix="bcrypt")
+    return _executor
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+    _executor = None
+
+
+async def _run(fn, *args):
+    global _pending
+    if _pending >= settings.BCRYPT_WORKERS + settings.BCRYPT_MAX_QUEUE:
+        _metrics["rejected"] += 1
+        raise HTTPException(status_code=503, detail="Servidor ocupado, inténtalo de nuevo en unos segundos",
+                            headers={"Retry-After": "1"})
+    enviado = time.perf_counter()
+
+    def job():
+        inicio = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            fin = time.perf_counter()
+            with _lock:
+                _metrics["completed"] += 1
+                _metrics["wait_s"] += inicio - enviado
+                _metrics["run_s"] += fin - inicio
+
+    _pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_get_executor(), job)
+    finally:
+        _pending -= 1
+
+
+async def hash_password(password: str) -> str:
+    return await _run(security.hash_password, password)
+
+
+async def verify_password(password: str, hashed: str) -> bool:
+    return await _run(security.verify_password, password, hashed)
+
+
+async def verify_and_update(password: str, hashed: str) -> tuple[bool, str | None]:
+    """
+    Verifica la contraseña y, si es correcta pero el hash se generó con otro
+    coste que `BCRYPT_ROUNDS`, devuelve también el hash nuevo para guardarlo.
+    """
+    if not await verify_password(password, hashed):
+        return False, None
+    if not security.needs_rehash(hashed):
+        return True, None
+    nuevo = await hash_password(password)
+    _metrics["rehashed"] += 1
+    return True, nuevo
+
+
+def stats() -> dict:
+    with _lock:
+        completed = _metrics["completed"]
+        return {
+            "workers": settings.BCRYPT_WORKERS,
+            "rounds": settings.BCRYPT_ROUNDS,
+            "max_queue": settings.BCRYPT_MAX_QUEUE,
+            "in_flight": _pending,
+            "queued": max(_pending - settings.BCRYPT_WORKERS, 0),
+            "completed": completed,
+            "rejected": _metrics["rejected"],
+            "rehashed": _metrics["rehashed"],
+            "avg_wait_ms": round(1000 * _metrics["wait_s"] / completed, 2) if completed else 0.0,
+            "avg_hash_ms": round(1000 * _metrics["run_s"] / completed, 2) if completed else 0.0,
+        }
@@ -0,0 +1,74 @@
+"""
+Lista de revocación de tokens JWT (SQLite local).
+
+Guarda los `jti` revocados hasta que caducan y, por usuario, un instante
+"no antes de": los tokens emitidos antes quedan invalidados (cambio de
+contraseña, cierre de todas las sesiones). Una consulta por clave primaria
+en SQLite local cuesta microsegundos, así que se puede hacer en cada
+petición sin ir a Supabase.
+"""
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from app.core.config import settings
+
+
+class RevocationStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS revoked_tokens (jti TEXT PRIMARY KEY, expires_at REAL NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS user_not_before (user_id TEXT PRIMARY KEY, not_before REAL NOT NULL)")
+            self._conn = conn
+        return self._conn
+
+    def revoke(self, jti: Optional[str], expires_at: Optional[float]) -> None:
+        if not jti:
+            return
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute("INSERT OR REPLACE INTO revoked_tokens (jti, expires_at) VALUES (?, ?)",
+                       (jti, expires_at or now + settings.REFRESH_TOKEN_EXPIRE_DAYS * 86400))
+            db.execute("DELETE FROM revoked_tokens WHERE expires_at < ?", (now,))
+            db.commit()
+
+    def revoke_user(self, user_id: str) -> None:
+        """Invalida todos los tokens del usuario emitidos hasta ahora."""
+        with self._lock:
+            db = self._db()
+            db.execute("INSERT OR REPLACE INTO user_not_before (user_id, not_before) VALUES (?, ?)",
+                       (str(user_id), time.time()))
+            db.commit()
+
+    def is_revoked(self, jti: Optional[str], user_id: Optional[str], issued_at: Optional[float]) -> bool:
+        with self._lock:
+            db = self._db()
+            if jti and db.execute("SELECT 1 FROM revoked_tokens WHERE jti = ?", (jti,)).fetchone():
+                return True
+            if user_id is None or issued_at is None:
+                return False
+            row = db.execute("SELECT not_before FROM user_not_before WHERE user_id = ?", (str(user_id),)).fetchone()
+        # `iat` y `not_before` en segundos con fracción: un token emitido en el mismo
+        # segundo pero antes de la revocación también cae (los anteriores traían
+        # `iat` entero, que queda por debajo)
+        return row is not None and float(issued_at) < row[0]
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+revocation_store = RevocationStore(settings.TOKEN_REVOCATION_DB_PATH)
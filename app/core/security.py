@@ -1,20 +1,38 @@
 import bcrypt
+import time
 from datetime import datetime, timedelta
+from uuid import uuid4
 import jwt
 from app.core.config import settings
 
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+def hash_password(password: str, rounds: int = None) -> str:
+    salt = bcrypt.gensalt(rounds=rounds or settings.BCRYPT_ROUNDS)
+    return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
 
 def verify_password(password: str, hashed: str) -> bool:
     return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
 
-def create_access_token(data: dict, expires_delta: int = None):
+def needs_rehash(hashed: str) -> bool:
+    # Formato bcrypt: $2b$<coste>$<salt+hash>
+    try:
+        return int(hashed.split("$")[2]) != settings.BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+def _encode(data: dict, tipo: str, expire: datetime) -> str:
     to_encode = data.copy()
+    # `iat` con fracción de segundo (NumericDate lo admite): la revocación por
+    # usuario compara con la misma precisión
+    to_encode.update({"exp": expire, "iat": time.time(), "jti": uuid4().hex, "type": tipo})
+    return jwt.encode(to_encode, settings.JWT_SECRET, algorithm=settings.JWT_ALGORITHM)
+
+def create_access_token(data: dict, expires_delta: int = None):
     expire = datetime.utcnow() + timedelta(minutes=expires_delta or settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, settings.JWT_SECRET, algorithm=settings.JWT_ALGORITHM)
-    return encoded_jwt
+    return _encode(data, "access", expire)
+
+def create_refresh_token(data: dict):
+    expire = datetime.utcnow() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
+    return _encode(data, "refresh", expire)
 
 def decode_token(token: str):
     try:
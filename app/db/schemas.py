@@ -21,8 +21,12 @@ class UserOut(UserBase):
 
 class Token(BaseModel):
     access_token: str
+    refresh_token: Optional[str] = None
     token_type: str = "bearer"
 
+class RefreshInput(BaseModel):
+    refresh_token: str
+
 class TokenData(BaseModel):
     id: Optional[str] = None
     rol: Optional[str] = None
@@ -31,15 +35,110 @@ class GeneticProfileOut(BaseModel):
     id: str
     user_id: str
     archivo_vcf: str
+    content_hash: Optional[str] = None
+    muestra: Optional[str] = None  # columna del paciente en un VCF de cohorte
     fecha_subida: datetime
 
+class UploadJobOut(BaseModel):
+    job_id: str
+    status: str
+    profile: GeneticProfileOut
+
+class CohortUploadOut(BaseModel):
+    job_id: str
+    status: str
+    content_hash: str
+    muestras: int
+
+class UploadSessionInput(BaseModel):
+    paciente_id: str
+    filename: Optional[str] = None
+
+class UploadPartOut(BaseModel):
+    numero: int
+    sha256: str
+    size: int
+
+class UploadSessionOut(BaseModel):
+    upload_id: str
+    paciente_id: str
+    filename: Optional[str] = None
+    status: str
+    part_size: int
+    partes: list[UploadPartOut]
+
+class UploadCommitInput(BaseModel):
+    partes: Optional[int] = None
+    sha256: Optional[str] = None
+
+class UploadCommitOut(BaseModel):
+    job_id: str
+    status: str
+    upload_id: str
+
+class JobStageOut(BaseModel):
+    nombre: str
+    status: str
+    inicio: Optional[str] = None
+    fin: Optional[str] = None
+    duracion_ms: Optional[float] = None
+    error: Optional[str] = None
+
+class JobOut(BaseModel):
+    id: str
+    tipo: str
+    status: str
+    created_at: str
+    etapas: list[JobStageOut]
+    resultado: Optional[dict] = None
+    error: Optional[str] = None  # fallo al finalizar, fuera de las etapas
+
+class ReportItem(BaseModel):
+    paciente_id: str
+    evaluacion_id: str
+
+class ReportBatchInput(BaseModel):
+    items: list[ReportItem]
+
+class ReportBatchItemOut(ReportItem):
+    ok: bool
+    informe: Optional[dict] = None
+    error: Optional[str] = None
+
+class ReportBatchOut(BaseModel):
+    total: int
+    generados: int
+    errores: int
+    resultados: list[ReportBatchItemOut]
+
 class AssignInput(BaseModel):
     medico_id: str
     paciente_id: str
 
+class AssignBulkInput(BaseModel):
+    # Ids o emails de médico y paciente
+    asignaciones: list[AssignInput]
+
+class AssignBulkItemOut(BaseModel):
+    fila: Optional[int] = None
+    medico: str
+    paciente: str
+    resultado: str
+    motivo: str
+
+class AssignBulkOut(BaseModel):
+    total: int
+    creados: int
+    omitidos: int
+    fallidos: int
+    incidencias: list[AssignBulkItemOut]  # las primeras ASSIGN_MAX_INCIDENCIAS
+    incidencias_no_listadas: int = 0
+
 class AnalyzeInput(BaseModel):
     paciente_id: str
     genetic_profile_id: str
+    # Comentario redactado por el LLM a partir del resultado (opcional, más lento)
+    narrativa: bool = False
 
 class EvaluacionOut(BaseModel):
     id: str
@@ -50,6 +149,8 @@ class EvaluacionOut(BaseModel):
 class AnalyzeInput(BaseModel):
     paciente_id: str
     genetic_profile_id: str
+    # Comentario redactado por el LLM a partir del resultado (opcional, más lento)
+    narrativa: bool = False
 
 class EvaluacionOut(BaseModel):
     id: str
@@ -57,3 +158,17 @@ class EvaluacionOut(BaseModel):
     resultado_json: dict
     fecha_evaluacion: str
 
+
+class RecomendacionOut(BaseModel):
+    farmaco: str
+    gen: str
+    fenotipo: str
+    accion: str
+    recomendacion: str
+    fuerza: str
+    guia: str
+
+class RecomendacionesOut(BaseModel):
+    version: str
+    fenotipos: dict[str, str]
+    recomendaciones: list[RecomendacionOut]
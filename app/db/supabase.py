@@ -1,4 +1,124 @@
-from supabase import create_client
+"""
+Cliente async de Supabase (PostgREST + Storage).
+
+Cada servicio usa un único `httpx.AsyncClient` por proceso, con keep-alive y
+HTTP/2, que se abre y se cierra en el lifespan de la app (`main.py`).
+"""
+import httpx
+from postgrest import AsyncPostgrestClient
+from postgrest.constants import DEFAULT_POSTGREST_CLIENT_HEADERS
+from storage3 import AsyncStorageClient
+
 from app.core.config import settings
+from app.core.logging import instrument_transport
+
+
+# Transportes sustitutos por servicio (benchmarks y tests sin red)
+_transport_overrides: dict[str, httpx.AsyncBaseTransport] = {}
+
+
+def override_transport(service: str, transport: httpx.AsyncBaseTransport | None):
+    """
+    Sustituye la red de `service` ("supabase_rest", "supabase_storage",
+    "openai") por otro transporte, p. ej. un doble en proceso. Se aplica a los
+    clientes que se abran después; `None` restaura la red.
+    """
+    if transport is None:
+        _transport_overrides.pop(service, None)
+    else:
+        _transport_overrides[service] = transport
+
+
+def pooled_transport(service: str, verify=True) -> httpx.AsyncBaseTransport:
+    """Transporte HTTP/2 con pool keep-alive, instrumentado como `service`."""
+    if service in _transport_overrides:
+        return instrument_transport(service, _transport_overrides[service])
+    return instrument_transport(service, httpx.AsyncHTTPTransport(
+        verify=verify,
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+        ),
+    ))
+
+
+def _pooled_client(service, base_url, headers, timeout, verify=True) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        base_url=base_url,
+        headers=headers,
+        timeout=timeout,
+        follow_redirects=True,
+        transport=pooled_transport(service, verify),
+    )
+
+
+class _PostgrestClient(AsyncPostgrestClient):
+    def create_session(self, base_url, headers, timeout, verify=True):
+        return _pooled_client("supabase_rest", base_url, headers, timeout, verify)
+
+
+class _StorageClient(AsyncStorageClient):
+    def _create_session(self, base_url, headers, timeout, verify=True):
+        return _pooled_client("supabase_storage", base_url, headers, timeout, verify)
+
+
+class SupabaseClient:
+    """
+    Fachada con la misma forma que el cliente de supabase-py
+    (`supabase.table(...)`, `supabase.storage.from_(...)`), pero async.
+    """
+
+    def __init__(self):
+        self._rest = None
+        self._storage = None
+
+    async def open(self):
+        if self._rest is not None:
+            return
+        key = settings.SUPABASE_SERVICE_ROLE_KEY
+        headers = {"apikey": key, "Authorization": f"Bearer {key}"}
+        self._rest = _PostgrestClient(
+            f"{settings.SUPABASE_URL}/rest/v1",
+            headers={**DEFAULT_POSTGREST_CLIENT_HEADERS, **headers},
+            timeout=settings.HTTP_TIMEOUT,
+        )
+        self._storage = _StorageClient(
+            f"{settings.SUPABASE_URL}/storage/v1",
+            headers,
+            settings.HTTP_TIMEOUT,
+        )
+
+    async def close(self):
+        if self._rest is not None:
+            await self._rest.aclose()
+            await self._storage.session.aclose()
+        self._rest = None
+        self._storage = None
+
+    def _require_open(self):
+        if self._rest is None:
+            raise RuntimeError("Cliente Supabase no inicializado (lifespan de la app)")
+
+    def table(self, name: str):
+        self._require_open()
+        return self._rest.from_(name)
+
+    @property
+    def storage(self) -> AsyncStorageClient:
+        self._require_open()
+        return self._storage
+
+    async def open_object(self, bucket: str, path: str, headers: dict | None = None) -> httpx.Response:
+        """
+        GET de un objeto de Storage en streaming (sin cargarlo en memoria).
+        El llamante debe cerrar la respuesta con `aclose()`.
+        """
+        self._require_open()
+        session = self._storage.session
+        request = session.build_request("GET", f"object/{bucket}/{path}", headers=headers or {})
+        return await session.send(request, stream=True)
+
 
-supabase = create_client(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_ROLE_KEY)
+supabase = SupabaseClient()
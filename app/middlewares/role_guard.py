@@ -0,0 +1,57 @@
+"""
+Guardas de rol a partir de los claims del JWT.
+
+El token ya lleva `id` y `rol` firmados, así que aceptar o rechazar una
+petición por rol no necesita leer la fila del usuario: basta con verificar
+la firma, el tipo de token y que no esté revocado. Los endpoints que además
+necesitan datos del perfil (nombre, email...) usan `get_current_user`.
+"""
+from fastapi import Depends, HTTPException, status
+from fastapi.security import OAuth2PasswordBearer
+
+from app.core.revocation import revocation_store
+from app.core.security import decode_token
+
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/users/login")
+
+
+def _credenciales_invalidas() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Token inválido o expirado",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+def verify_token(token: str, tipo: str = "access") -> dict:
+    """Payload de un token válido del tipo pedido y no revocado; si no, 401."""
+    payload = decode_token(token)
+    # Los tokens anteriores a los refresh tokens no llevan `type`: son de acceso
+    if payload is None or payload.get("type", "access") != tipo or payload.get("id") is None:
+        raise _credenciales_invalidas()
+    if revocation_store.is_revoked(payload.get("jti"), payload.get("id"), payload.get("iat")):
+        raise _credenciales_invalidas()
+    return payload
+
+
+async def get_claims(token: str = Depends(oauth2_scheme)) -> dict:
+    payload = verify_token(token)
+    return {
+        "id": str(payload["id"]),
+        "rol": payload.get("rol"),
+        "jti": payload.get("jti"),
+        "exp": payload.get("exp"),
+    }
+
+
+def require_role(*roles: str, detail: str = "Acceso no permitido para este rol"):
+    async def guard(claims: dict = Depends(get_claims)):
+        if claims["rol"] not in roles:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=detail)
+        return claims
+    return guard
+
+
+require_medico = require_role("medico", detail="Acceso solo para médicos")
+require_admin = require_role("admin", detail="Acceso solo para administrador")
+require_paciente = require_role("paciente", detail="Acceso solo para pacientes")
@@ -1,13 +1,53 @@
-from fastapi import APIRouter, Depends, HTTPException
-from app.core.auth import require_admin
-from app.services.admin_service import assign_patient_to_medico
-from app.db.schemas import AssignInput
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from app.core.auth import require_admin, user_cache
+from app.services.llm_cache import llm_cache
+from app.services import patient_context
+from app.services.report_files import report_cache
+from app.services import genotypes_service
+from app.core import passwords
+from app.core.config import settings
+from app.services.admin_service import assign_patient_to_medico, assign_bulk, import_assignments_csv
+from app.db.schemas import AssignInput, AssignBulkInput, AssignBulkOut
 
 router = APIRouter()
 
 @router.post("/assign_patient", tags=["Admin"])
-def assign_patient(
+async def assign_patient(
     input: AssignInput,
     current_user: dict = Depends(require_admin)
 ):
-    return assign_patient_to_medico(input.medico_id, input.paciente_id)
+    return await assign_patient_to_medico(input.medico_id, input.paciente_id)
+
+@router.post("/assign_patients", response_model=AssignBulkOut, tags=["Admin"])
+async def assign_patients(
+    input: AssignBulkInput,
+    current_user: dict = Depends(require_admin)
+):
+    if len(input.asignaciones) > settings.ASSIGN_MAX_PAIRS:
+        raise HTTPException(status_code=400,
+                            detail=f"Como mucho {settings.ASSIGN_MAX_PAIRS} asignaciones por petición; usa la importación CSV")
+    return await assign_bulk((a.medico_id, a.paciente_id) for a in input.asignaciones)
+
+@router.post("/assign_patients/import", response_model=AssignBulkOut, tags=["Admin"])
+async def import_assignments(
+    file: UploadFile = File(..., description="CSV con columnas medico_id|medico_email y paciente_id|paciente_email"),
+    current_user: dict = Depends(require_admin)
+):
+    return await import_assignments_csv(file)
+
+@router.get("/cache/stats", tags=["Admin"])
+async def cache_stats(current_user: dict = Depends(require_admin)):
+    # Contadores de aciertos/fallos de las cachés en proceso
+    return {
+        "users": user_cache.stats(),
+        "llm": llm_cache.stats(),
+        "patient_context": patient_context.stats(),
+        "reportes": report_cache.stats(),
+        "genotipos": genotypes_service.stats(),
+    }
+
+
+@router.get("/passwords/stats", tags=["Admin"])
+async def password_stats(current_user: dict = Depends(require_admin)):
+    # Executor de bcrypt: ocupación de la cola y tiempos medios
+    return passwords.stats()
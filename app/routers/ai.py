@@ -1,68 +1,63 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query, HTTPException, Response
+from pydantic import BaseModel
 from app.core.auth import require_medico, get_current_user
+from app.core.config import settings
+from app.utils.pagination import PageParams, page_params, with_cursor
+from app.services import llm_service
 from app.services.ai_service import analyze_vcf_file, get_mis_evaluaciones, get_evaluaciones_paciente
+from app.services.patient_context import get_patient_context
+from app.services.rbac import can_access
+from app.utils.sse import sse_response
 from app.db.schemas import AnalyzeInput, EvaluacionOut
-from app.db.supabase import supabase
-import os
-import openai
-from pydantic import BaseModel
 
 router = APIRouter()
 
 @router.post("/analyze", response_model=EvaluacionOut)
-def analyze(
+async def analyze(
     input: AnalyzeInput,
     current_user: dict = Depends(require_medico)
 ):
-    return analyze_vcf_file(current_user, input)
+    return await analyze_vcf_file(current_user, input)
 
 @router.get("/mine", response_model=list[EvaluacionOut])
-def get_my_evaluations(current_user: dict = Depends(get_current_user)):
-    return get_mis_evaluaciones(current_user)
+async def get_my_evaluations(
+    response: Response,
+    page: PageParams = Depends(page_params),
+    current_user: dict = Depends(get_current_user)
+):
+    return with_cursor(response, await get_mis_evaluaciones(current_user, page))
 
 @router.get("/patient/{paciente_id}", response_model=list[EvaluacionOut])
-def get_patient_evaluations(
+async def get_patient_evaluations(
     paciente_id: str,
+    response: Response,
+    page: PageParams = Depends(page_params),
     current_user: dict = Depends(require_medico)
 ):
-    return get_evaluaciones_paciente(current_user, paciente_id)
-
-from pydantic import BaseModel
-from fastapi import APIRouter, Depends
-import os
-import openai
-from app.core.auth import get_current_user
-from app.db.supabase import supabase
-
-router = APIRouter()
-
+    return with_cursor(response, await get_evaluaciones_paciente(current_user, paciente_id, page))
 # 1. Define el modelo para el body
 class IAContextualInput(BaseModel):
     paciente_id: str
     pregunta: str
 
 # 2. Cambia la función para aceptar el modelo como parámetro
-@router.post("/ai/contextual")
-def ia_contextual(input: IAContextualInput, user=Depends(get_current_user)):
+@router.post("/contextual")
+# Ruta antigua (/ai/ai/contextual), de cuando este endpoint tenía su propio router
+@router.post("/ai/contextual", include_in_schema=False)
+async def ia_contextual(
+    input: IAContextualInput,
+    stream: bool = Query(False, description="Respuesta en streaming (SSE)"),
+    user=Depends(get_current_user)
+):
     paciente_id = input.paciente_id
     pregunta = input.pregunta
 
-    # Busca el informe genético más reciente de este paciente
-    perfil = supabase.table("genetic_profiles")\
-        .select("*").eq("user_id", paciente_id)\
-        .order("fecha_subida", desc=True).limit(1).execute().data
-    resumen_ia = ""
-    if perfil:
-        informe = supabase.table("informes")\
-            .select("*").eq("user_id", paciente_id)\
-            .order("fecha_generado", desc=True).limit(1).execute().data
-        if informe:
-            resumen_ia = informe[0].get("contenido", "")
+    if not await can_access(user, paciente_id):
+        raise HTTPException(status_code=403, detail="No autorizado")
 
-    contexto = (
-        f"Paciente ID: {paciente_id}\n"
-        f"Resumen IA genética: {resumen_ia if resumen_ia else 'Sin informe genético disponible.'}"
-    )
+    # Contexto compacto del paciente (fenotipos, variantes clave, último informe)
+    modelo = "gpt-4o"  # Usa gpt-4o (si tu cuenta lo permite)
+    contexto = await get_patient_context(paciente_id, settings.CHAT_CONTEXT_TOKENS, modelo)
 
     prompt = (
         f"{contexto}\n\n"
@@ -72,26 +67,26 @@ def ia_contextual(input: IAContextualInput, user=Depends(get_current_user)):
         "- NO digas nunca 'consulta a un médico' ni 'acude a un especialista', ya eres el experto.\n"
         "- Sé preciso, técnico y basado en la evidencia farmacogenómica.\n"
         "- Relaciona variantes genéticas, SNPs o genes del paciente con guías farmacogenómicas (CPIC, FDA, etc) cuando sea posible.\n"
+        "- Si el contexto incluye recomendaciones farmacogenómicas, básate en ellas antes que en tu memoria.\n"
         "- Si falta información clínica/genética relevante, dilo pero orienta profesionalmente según lo disponible.\n"
         "- Sé breve, conciso y directo."
     )
 
-    openai.api_key = os.getenv("OPENAI_API_KEY")
-    response = openai.chat.completions.create(
-        model="gpt-4o",  # Usa gpt-4o (si tu cuenta lo permite)
-        messages=[
-            {
-                "role": "system",
-                "content": (
-                    "Eres una IA clínica de soporte experto en farmacogenómica, solo para médicos. "
-                    "Nunca respondas que consulten a otro médico. Da respuestas precisas, técnicas, útiles y basadas en guías farmacogenómicas. "
-                    "Si falta información, explica qué datos serían necesarios, pero orienta con lo disponible."
-                )
-            },
-            {"role": "user", "content": prompt}
-        ],
+    completion = dict(
+        model=modelo,
+        system=(
+            "Eres una IA clínica de soporte experto en farmacogenómica, solo para médicos. "
+            "Nunca respondas que consulten a otro médico. Da respuestas precisas, técnicas, útiles y basadas en guías farmacogenómicas. "
+            "Si falta información, explica qué datos serían necesarios, pero orienta con lo disponible."
+        ),
+        prompt=prompt,
         max_tokens=500,
-        temperature=0.2
+        temperature=0.2,
+        cache=True,
     )
+    if stream:
+        return sse_response(llm_service.stream_completion(**completion))
+
+    respuesta = await llm_service.chat_completion(**completion)
 
-    return {"respuesta": response.choices[0].message.content.strip()}
+    return {"respuesta": respuesta}
@@ -1,26 +1,81 @@
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Form
+from typing import Optional
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Form, Response, Request, Header
 from app.core.auth import require_medico, get_current_user
-from app.services import genetics_service
-from app.db.schemas import GeneticProfileOut
+from app.services import cohortes_service, genetics_service, uploads_service
+from app.db.schemas import (
+    GeneticProfileOut, UploadJobOut, JobOut, UploadSessionInput, UploadSessionOut, UploadPartOut,
+    UploadCommitInput, UploadCommitOut, CohortUploadOut,
+)
 from app.services.medicos_service import medico_tiene_paciente
+from app.utils.pagination import PageParams, page_params, with_cursor
 
 router = APIRouter()
 
-@router.post("/upload", response_model=GeneticProfileOut)
-def upload_genetic_file(
+@router.post("/upload", response_model=UploadJobOut, status_code=202)
+async def upload_genetic_file(
     file: UploadFile = File(...),
     paciente_id: str = Form(...),
     current_user: dict = Depends(require_medico)
 ):
     # Solo médicos con ese paciente pueden subir
-    if not medico_tiene_paciente(current_user["id"], paciente_id):
+    if not await medico_tiene_paciente(current_user["id"], paciente_id):
         raise HTTPException(status_code=403, detail="No puedes subir archivos para este paciente")
-    return genetics_service.upload_genetic_file(file, paciente_id)
+    return await genetics_service.upload_genetic_file(file, paciente_id, current_user)
+
+@router.post("/cohortes", response_model=CohortUploadOut, status_code=202)
+async def upload_cohort_file(
+    file: UploadFile = File(...),
+    muestras: str = Form(..., description='JSON {"muestra del VCF": "paciente_id"}'),
+    current_user: dict = Depends(require_medico)
+):
+    # VCF multi-muestra: perfiles y evaluaciones de toda la cohorte en un trabajo
+    mapa = cohortes_service.parse_muestras(muestras)
+    return await cohortes_service.upload_cohorte(file, mapa, current_user)
+
+# ---- Subidas por partes (reanudables) para VCFs grandes ----
+
+@router.post("/uploads", response_model=UploadSessionOut, status_code=201)
+async def create_upload(input: UploadSessionInput, current_user: dict = Depends(require_medico)):
+    if not await medico_tiene_paciente(current_user["id"], input.paciente_id):
+        raise HTTPException(status_code=403, detail="No puedes subir archivos para este paciente")
+    return await uploads_service.create_session(input.paciente_id, input.filename, current_user)
+
+@router.get("/uploads/{upload_id}", response_model=UploadSessionOut)
+async def get_upload(upload_id: str, current_user: dict = Depends(require_medico)):
+    # Partes ya recibidas: el cliente reanuda enviando solo las que faltan
+    return await uploads_service.get_session(upload_id, current_user)
+
+@router.put("/uploads/{upload_id}/parts/{numero}", response_model=UploadPartOut)
+async def upload_part(
+    upload_id: str,
+    numero: int,
+    request: Request,
+    x_part_sha256: Optional[str] = Header(None),
+    current_user: dict = Depends(require_medico)
+):
+    return await uploads_service.put_part(upload_id, numero, request, x_part_sha256, current_user)
+
+@router.post("/uploads/{upload_id}/commit", response_model=UploadCommitOut, status_code=202)
+async def commit_upload(upload_id: str, input: UploadCommitInput, current_user: dict = Depends(require_medico)):
+    return await uploads_service.commit(upload_id, input.partes, input.sha256, current_user)
+
+@router.delete("/uploads/{upload_id}")
+async def abort_upload(upload_id: str, current_user: dict = Depends(require_medico)):
+    return await uploads_service.abort(upload_id, current_user)
+
+@router.get("/jobs/{job_id}", response_model=JobOut)
+async def get_upload_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    # Progreso por etapa del análisis lanzado por /upload
+    return genetics_service.get_job_status(job_id, current_user)
 
 @router.get("/mine", response_model=list[GeneticProfileOut])
-def get_my_genetic_files(current_user: dict = Depends(get_current_user)):
-    return genetics_service.get_my_genetic_files(current_user)
+async def get_my_genetic_files(
+    response: Response,
+    page: PageParams = Depends(page_params),
+    current_user: dict = Depends(get_current_user)
+):
+    return with_cursor(response, await genetics_service.get_my_genetic_files(current_user, page))
 
 @router.get("/{id}", response_model=GeneticProfileOut)
-def get_genetic_file_detail(id: str, current_user: dict = Depends(get_current_user)):
-    return genetics_service.get_genetic_file_detail(id, current_user)
+async def get_genetic_file_detail(id: str, current_user: dict = Depends(get_current_user)):
+    return await genetics_service.get_genetic_file_detail(id, current_user)
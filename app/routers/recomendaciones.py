@@ -0,0 +1,31 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from app.core.auth import get_current_user
+from app.db.schemas import RecomendacionesOut
+from app.services import recomendaciones_service
+from app.services.rbac import can_access
+
+router = APIRouter()
+
+@router.get("/farmacos", response_model=list[str])
+async def listar_farmacos(current_user: dict = Depends(get_current_user)):
+    return recomendaciones_service.indice().farmacos
+
+@router.get("/farmacos/{farmaco}", response_model=RecomendacionesOut)
+async def recomendaciones_farmaco(
+    farmaco: str,
+    paciente_id: Optional[str] = Query(None, description="Solo las recomendaciones que aplican a sus fenotipos"),
+    current_user: dict = Depends(get_current_user)
+):
+    if paciente_id and not await can_access(current_user, paciente_id):
+        raise HTTPException(status_code=403, detail="No autorizado")
+    return await recomendaciones_service.recomendaciones_farmaco(farmaco, paciente_id)
+
+@router.get("/paciente/{paciente_id}", response_model=RecomendacionesOut)
+async def recomendaciones_paciente(
+    paciente_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    if not await can_access(current_user, paciente_id):
+        raise HTTPException(status_code=403, detail="No autorizado")
+    return await recomendaciones_service.recomendaciones_paciente(paciente_id)
@@ -1,100 +1,98 @@
-from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from app.core.auth import require_medico, get_current_user
-from app.services.reports_service import generate_report_pdf
+from app.services.reports_service import generate_report_pdf, generate_reports_batch
+from app.db.schemas import ReportBatchInput, ReportBatchOut
 from app.db.supabase import supabase
-import os
-from fastapi.responses import FileResponse, StreamingResponse
-import io
+from app.services.rbac import can_access
+from app.services.report_files import report_download_response
+from app.utils.pagination import PageParams, page_params, paginate, with_cursor
 
 
 router = APIRouter()
 
 @router.get("/generate", tags=["Reports"])
-def generate_report(paciente_id: str, evaluacion_id: str, current_user: dict = Depends(require_medico)):
+async def generate_report(
+    paciente_id: str,
+    evaluacion_id: str,
+    claims: dict = Depends(require_medico),
+    current_user: dict = Depends(get_current_user)  # nombre y email para el PDF
+):
     try:
-        data = generate_report_pdf(paciente_id, evaluacion_id, current_user)
+        data = await generate_report_pdf(paciente_id, evaluacion_id, current_user)
         return {"detail": "Informe generado correctamente", "data": data}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.post("/generate/batch", response_model=ReportBatchOut, tags=["Reports"])
+async def generate_reports(
+    payload: ReportBatchInput,
+    claims: dict = Depends(require_medico),
+    current_user: dict = Depends(get_current_user)  # nombre y email para el PDF
+):
+    """
+    Genera en lote un informe por cada par (paciente_id, evaluacion_id).
+    Los fallos no cortan el lote: cada item trae su propio `ok` / `error`.
+    """
+    resultados = await generate_reports_batch(
+        [(item.paciente_id, item.evaluacion_id) for item in payload.items], current_user
+    )
+    generados = sum(1 for r in resultados if r["ok"])
+    return {
+        "total": len(resultados),
+        "generados": generados,
+        "errores": len(resultados) - generados,
+        "resultados": resultados,
+    }
+
 @router.get("/mine")
-def get_my_reports(current_user: dict = Depends(get_current_user)):
+async def get_my_reports(
+    response: Response,
+    page: PageParams = Depends(page_params),
+    current_user: dict = Depends(get_current_user)
+):
     # Busca informes donde user_id == id del usuario autenticado
-    res = supabase.table("informes").select("*").eq("user_id", current_user["id"]).order("fecha_generado", desc=True).execute()
-    return res.data or []
+    query = supabase.table("informes").select("*").eq("user_id", current_user["id"])
+    return with_cursor(response, await paginate(query, page, "fecha_generado"))
 
 
 @router.get("/download/{id}")
-def download_report(id: str, current_user: dict = Depends(get_current_user)):
+async def download_report(
+    id: str,
+    request: Request,
+    redirect: bool = Query(False, description="Redirigir a una URL firmada de corta duración"),
+    current_user: dict = Depends(get_current_user)
+):
     # 1. Busca el informe por ID
-    res = supabase.table("informes").select("*").eq("id", id).single().execute()
-    report = res.data
+    res = await supabase.table("informes").select("user_id,archivo_pdf").eq("id", id).limit(1).execute()
+    report = res.data[0] if res.data else None
 
     if not report:
         raise HTTPException(status_code=404, detail="Informe no encontrado")
 
-    # 2. Permitir acceso al propio paciente O a un médico asignado
-    es_paciente = str(report["user_id"]).strip() == str(current_user["id"]).strip()
-    es_medico = current_user.get("rol") == "medico"
-
-    autorizado = es_paciente
-
-    # Si es médico, comprobar relación médico-paciente
-    if es_medico and not autorizado:
-        relaciones = supabase.table("medicos_pacientes") \
-            .select("*") \
-            .eq("medico_id", current_user["id"]) \
-            .eq("paciente_id", report["user_id"]) \
-            .eq("status", "activo") \
-            .execute().data
-        autorizado = bool(relaciones)
-
-    if not autorizado:
+    # 2. Permitir acceso al propio paciente, a un médico asignado o a admin
+    if not await can_access(current_user, report["user_id"]):
         raise HTTPException(status_code=403, detail="No tienes permiso para este informe")
 
-    # 3. Descarga el archivo PDF del bucket Supabase
+    # 3. Ruta del PDF en el bucket
     ruta_pdf = report.get("archivo_pdf")
     if not ruta_pdf:
         raise HTTPException(status_code=404, detail="El informe no tiene PDF generado")
 
-    try:
-        file_data = supabase.storage.from_("reportes").download(ruta_pdf)
-    except Exception as e:
-        raise HTTPException(status_code=404, detail=f"No se pudo descargar: {str(e)}")
+    # 4. PDF en streaming (Range / ETag, caché en disco) o redirección firmada
+    return await report_download_response(ruta_pdf, request, redirect)
 
-    filename = os.path.basename(ruta_pdf)
-    from fastapi.responses import StreamingResponse
-    import io
 
-    return StreamingResponse(
-        io.BytesIO(file_data),
-        media_type="application/pdf",
-        headers={
-            "Content-Disposition": f'attachment; filename="{filename}"'
-        }
-    )
-    
 @router.get("/paciente/{paciente_id}")
-def get_informes_paciente(paciente_id: str, current_user: dict = Depends(get_current_user)):
+async def get_informes_paciente(
+    paciente_id: str,
+    response: Response,
+    page: PageParams = Depends(page_params),
+    current_user: dict = Depends(get_current_user)
+):
     """
     Devuelve todos los informes IA de un paciente, accesible por médicos asignados, el propio paciente y admin.
     """
-    is_admin = current_user["rol"] == "admin"
-    is_self = current_user["id"] == paciente_id
-    if not (is_admin or is_self):
-        if current_user["rol"] == "medico":
-            # Verifica relación médico-paciente
-            rel = supabase.table("medicos_pacientes") \
-                .select("*") \
-                .eq("medico_id", current_user["id"]) \
-                .eq("paciente_id", paciente_id) \
-                .eq("status", "activo") \
-                .execute().data
-            if not rel:
-                raise HTTPException(status_code=403, detail="No autorizado")
-        else:
-            raise HTTPException(status_code=403, detail="No autorizado")
-    informes = supabase.table("informes").select("*").eq("user_id", paciente_id).order("fecha_generado", desc=True).execute()
-    if hasattr(informes, "data"):
-        return informes.data or []
-    return []
\ No newline at end of file
+    if not await can_access(current_user, paciente_id):
+        raise HTTPException(status_code=403, detail="No autorizado")
+    query = supabase.table("informes").select("*").eq("user_id", paciente_id)
+    return with_cursor(response, await paginate(query, page, "fecha_generado"))
\ No newline at end of file
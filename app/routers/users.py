@@ -1,46 +1,86 @@
 # app/routers/users.py
 
-from fastapi import APIRouter, Depends, HTTPException, Body
-from app.db.schemas import UserCreate, UserLogin, UserOut
-from app.services import users_service
-from app.core.auth import get_current_user, require_medico, require_admin
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Body, Query, Response
+from app.db.schemas import UserCreate, UserLogin, UserOut, Token, RefreshInput
+from app.services import users_service, user_search
+from app.core.config import settings
+from app.core.auth import get_current_user, get_claims, verify_token, require_medico, require_admin, invalidate_user
+from app.core.revocation import revocation_store
 from app.db.supabase import supabase
-import openai
-import os
+from app.services.rbac import index, can_access
+from app.services import llm_service, patient_context
+from app.utils.pagination import PageParams, page_params, with_cursor
 from datetime import datetime
 
-# Asegúrate de tener OPENAI_API_KEY en tus variables de entorno
-openai.api_key = os.getenv("OPENAI_API_KEY")
-
 router = APIRouter()
 
 
 # --------- Auth: Registro y Login ---------
 @router.post("/register", response_model=UserOut)
-def register(user: UserCreate):
+async def register(user: UserCreate):
     """
     Registra un nuevo usuario (paciente o admin por defecto).
     """
-    return users_service.create_user(user)
+    return await users_service.create_user(user)
 
 
 @router.post("/login")
-def login(login_data: UserLogin):
+async def login(login_data: UserLogin):
     """
     Autentica a un usuario y retorna un JWT.
     """
-    user = users_service.authenticate_user(login_data)
+    user = await users_service.authenticate_user(login_data)
     token = users_service.create_jwt_for_user(user)
     return {
         "access_token": token,
+        "refresh_token": users_service.create_refresh_for_user(user),
         "token_type": "bearer",
         "user": {"id": user["id"], "email": user["email"], "rol": user["rol"]}
     }
 
 
+@router.post("/refresh", response_model=Token)
+async def refresh(data: RefreshInput):
+    """
+    Emite un access token nuevo a partir de un refresh token. El refresh
+    token usado se revoca y se devuelve otro (rotación).
+    """
+    payload = verify_token(data.refresh_token, tipo="refresh")
+    # El rol se lee de la BD: puede haber cambiado desde el login
+    res = await supabase.table("users").select("id, rol").eq("id", payload["id"]).limit(1).execute()
+    if not res.data:
+        raise HTTPException(status_code=401, detail="Token inválido o expirado")
+    user = res.data[0]
+    revocation_store.revoke(payload.get("jti"), payload.get("exp"))
+    return {
+        "access_token": users_service.create_jwt_for_user(user),
+        "refresh_token": users_service.create_refresh_for_user(user),
+        "token_type": "bearer",
+    }
+
+
+@router.post("/logout")
+async def logout(
+    data: RefreshInput | None = None,
+    claims: dict = Depends(get_claims)
+):
+    """
+    Revoca el access token actual y, si se envía, el refresh token.
+    """
+    revocation_store.revoke(claims["jti"], claims["exp"])
+    if data is not None:
+        payload = verify_token(data.refresh_token, tipo="refresh")
+        if str(payload["id"]) != claims["id"]:
+            raise HTTPException(status_code=403, detail="El refresh token no es de este usuario")
+        revocation_store.revoke(payload.get("jti"), payload.get("exp"))
+    return {"detail": "Sesión cerrada"}
+
+
 # --------- Perfil propio ---------
 @router.get("/me", response_model=UserOut)
-def me(current_user: dict = Depends(get_current_user)):
+async def me(current_user: dict = Depends(get_current_user)):
     """
     Obtiene información del usuario autenticado.
     """
@@ -48,7 +88,7 @@ def me(current_user: dict = Depends(get_current_user)):
 
 
 @router.patch("/me", response_model=UserOut, tags=["Profile"])
-def update_my_profile(
+async def update_my_profile(
     data: dict,
     current_user: dict = Depends(get_current_user)
 ):
@@ -58,17 +98,19 @@ def update_my_profile(
     updates = {k: data[k] for k in ("nombre", "apellidos", "email") if k in data}
     if not updates:
         raise HTTPException(status_code=400, detail="Nada que actualizar")
-    res = supabase.table("users") \
+    res = await supabase.table("users") \
         .update(updates) \
         .eq("id", current_user["id"]) \
         .execute()
-    if res.error:
+    if hasattr(res, "error") and res.error:
         raise HTTPException(status_code=500, detail=res.error.message)
+    invalidate_user(current_user["id"])
+    user_search.index.upsert(res.data[0])
     return res.data[0]
 
 
 @router.patch("/change_password")
-def change_password(
+async def change_password(
     data: dict,
     current_user: dict = Depends(get_current_user)
 ):
@@ -80,18 +122,26 @@ def change_password(
     if not old_password or not new_password:
         raise HTTPException(status_code=400, detail="Faltan datos")
     # Verifica la contraseña antigua
-    valid = users_service.authenticate_user(
+    valid = await users_service.authenticate_user(
         UserLogin(email=current_user["email"], password=old_password)
     )
     if not valid:
         raise HTTPException(status_code=401, detail="Contraseña actual incorrecta")
-    users_service.update_password(current_user["id"], new_password)
-    return {"detail": "Contraseña cambiada exitosamente"}
+    await users_service.update_password(current_user["id"], new_password)
+    invalidate_user(current_user["id"])
+    # Cierra las demás sesiones: los tokens emitidos antes dejan de valer
+    revocation_store.revoke_user(current_user["id"])
+    return {
+        "detail": "Contraseña cambiada exitosamente",
+        "access_token": users_service.create_jwt_for_user(current_user),
+        "refresh_token": users_service.create_refresh_for_user(current_user),
+        "token_type": "bearer",
+    }
 
 
 # --------- Usuarios médicos y pacientes ---------
 @router.post("/create_medico", response_model=UserOut)
-def create_medico(
+async def create_medico(
     user: UserCreate,
     current_user: dict = Depends(require_admin)
 ):
@@ -99,60 +149,56 @@ def create_medico(
     Admin crea un usuario con rol de médico.
     """
     user.rol = "medico"
-    return users_service.create_user(user)
+    return await users_service.create_user(user)
 
 
 @router.get("/all", response_model=list[UserOut])
-def get_all_patients(current_user: dict = Depends(require_medico)):
+async def get_all_patients(
+    response: Response,
+    page: PageParams = Depends(page_params),
+    current_user: dict = Depends(require_medico)
+):
     """
-    Lista todos los pacientes registrados (solo para médicos).
+    Lista todos los pacientes registrados (solo para médicos), paginado.
     """
-    return users_service.get_all_patients()
+    return with_cursor(response, await users_service.get_all_patients(page))
 
 
 @router.get("/mis_pacientes", response_model=list[UserOut])
-def get_my_patients(current_user: dict = Depends(require_medico)):
+async def get_my_patients(current_user: dict = Depends(require_medico)):
     """
     Retorna los pacientes activos asignados al médico.
     """
-    rels = supabase.table("medicos_pacientes") \
-        .select("paciente_id") \
-        .eq("medico_id", current_user["id"]) \
-        .eq("status", "activo") \
-        .execute().data
-    if not rels:
+    ids = list(await index.pacientes_de(current_user["id"]))
+    if not ids:
         return []
-    ids = [r["paciente_id"] for r in rels]
-    return supabase.table("users") \
+    res = await supabase.table("users") \
         .select("*") \
         .in_("id", ids) \
-        .execute().data
+        .execute()
+    return res.data
 
 
 @router.get("/mis_medicos", response_model=list[UserOut])
-def get_my_doctors(current_user: dict = Depends(get_current_user)):
+async def get_my_doctors(current_user: dict = Depends(get_current_user)):
     """
     Retorna los médicos activos asignados al paciente.
     """
     if current_user["rol"] != "paciente":
         raise HTTPException(status_code=403, detail="Solo pacientes pueden consultar sus médicos.")
-    rels = supabase.table("medicos_pacientes") \
-        .select("medico_id") \
-        .eq("paciente_id", current_user["id"]) \
-        .eq("status", "activo") \
-        .execute().data
-    if not rels:
+    ids = list(await index.medicos_de(current_user["id"]))
+    if not ids:
         return []
-    ids = [r["medico_id"] for r in rels]
-    return supabase.table("users") \
+    res = await supabase.table("users") \
         .select("id", "email", "rol") \
         .in_("id", ids) \
-        .execute().data
+        .execute()
+    return res.data
 
 
 # --------- Actualizar usuario/paciente ---------
 @router.patch("/users/{paciente_id}/update", response_model=UserOut)
-def update_paciente(
+async def update_paciente(
     paciente_id: str,
     fields: dict = Body(...),
     current_user: dict = Depends(get_current_user)
@@ -163,39 +209,31 @@ def update_paciente(
     - Si incluye 'geneticProfile', guarda perfil y lanza análisis IA.
     """
     # Verificar existencia
-    paciente = supabase.table("users") \
-        .select("*").eq("id", paciente_id).single().execute().data
+    paciente = (await supabase.table("users") \
+        .select("*").eq("id", paciente_id).single().execute()).data
     if not paciente:
         raise HTTPException(status_code=404, detail="Paciente no encontrado")
 
-    # Permisos
-    is_admin = current_user["rol"] == "admin"
-    is_medico = current_user["rol"] == "medico"
-    if is_medico:
-        rel = supabase.table("medicos_pacientes") \
-            .select("*") \
-            .eq("medico_id", current_user["id"]) \
-            .eq("paciente_id", paciente_id) \
-            .eq("status", "activo") \
-            .execute().data
-        if not rel:
-            raise HTTPException(status_code=403, detail="No autorizado")
-    elif not is_admin:
+    # Permisos: solo admin o médico asignado
+    if not await can_access(current_user, paciente_id, allow_self=False):
         raise HTTPException(status_code=403, detail="No autorizado")
 
     # Actualizar usuario
-    res = supabase.table("users") \
+    res = await supabase.table("users") \
         .update(fields) \
         .eq("id", paciente_id) \
         .execute()
-    if res.error:
+    if hasattr(res, "error") and res.error:
         raise HTTPException(status_code=500, detail=res.error.message)
     updated = res.data[0]
+    invalidate_user(paciente_id)
+    patient_context.invalidate(paciente_id)
+    user_search.index.upsert(updated)
 
     # Si se actualiza perfil genético, guardarlo y analizar
     genetic = fields.get("geneticProfile")
     if genetic:
-        supabase.table("genetic_profiles").upsert({
+        await supabase.table("genetic_profiles").upsert({
             "user_id": paciente_id,
             "profile": genetic,
             "updated_at": datetime.utcnow().isoformat()
@@ -207,18 +245,17 @@ def update_paciente(
             f"Analiza este perfil genético y sugiere riesgos o recomendaciones:\n{genetic}"
         )
         try:
-            ia_resp = openai.ChatCompletion.create(
+            ia_resp = await llm_service.chat_completion(
                 model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "Asistente IA farmacogenómico."},
-                    {"role": "user", "content": prompt}
-                ],
+                system="Asistente IA farmacogenómico.",
+                prompt=prompt,
                 max_tokens=400,
-            ).choices[0].message.content.strip()
+                cache=True,
+            )
         except Exception as e:
             ia_resp = f"Error IA: {e}"
 
-        supabase.table("informes").insert({
+        await supabase.table("informes").insert({
             "user_id": paciente_id,
             "contenido": ia_resp,
             "tipo": "análisis automático",
@@ -228,52 +265,40 @@ def update_paciente(
     return updated
 
 
+# --------- Búsqueda de usuarios (solo Admin) ---------
+# Antes de /users/{user_id}: si no, "search" se tomaría por un id
+@router.get("/users/search", response_model=list[UserOut])
+async def search_users(
+    query: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=settings.USER_SEARCH_LIMIT_MAX),
+    rol: Optional[Literal["paciente", "medico", "admin"]] = None,
+    current_user: dict = Depends(require_admin)
+):
+    """
+    Admin busca usuarios por nombre, apellidos o email, ordenados por
+    relevancia. Ignora tildes y mayúsculas y tolera erratas y palabras a
+    medio escribir.
+    """
+    return await user_search.index.search(query, limit=limit, rol=rol)
+
+
 # --------- Obtener usuario por ID ---------
 @router.get("/users/{user_id}", response_model=UserOut)
-def get_user_by_id(
+async def get_user_by_id(
     user_id: str,
     current_user: dict = Depends(get_current_user)
 ):
     """
     Recupera un usuario si es admin, él mismo, o médico asignado.
     """
-    is_admin = current_user["rol"] == "admin"
-    is_self = current_user["id"] == user_id
-    if not (is_admin or is_self):
-        if current_user["rol"] == "medico":
-            rel = supabase.table("medicos_pacientes") \
-                .select("*") \
-                .eq("medico_id", current_user["id"]) \
-                .eq("paciente_id", user_id) \
-                .eq("status", "activo") \
-                .execute().data
-            if not rel:
-                raise HTTPException(status_code=403, detail="No autorizado")
-        else:
-            raise HTTPException(status_code=403, detail="No autorizado")
-
-    data = supabase.table("users") \
+    if not await can_access(current_user, user_id):
+        raise HTTPException(status_code=403, detail="No autorizado")
+
+    data = (await supabase.table("users") \
         .select("*") \
         .eq("id", user_id) \
         .single() \
-        .execute().data
+        .execute()).data
     if not data:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
     return data
-
-
-# --------- Búsqueda de usuarios (solo Admin) ---------
-@router.get("/users/search", response_model=list[UserOut])
-def search_users(
-    query: str,
-    current_user: dict = Depends(get_current_user)
-):
-    """
-    Admin puede buscar usuarios globalmente por nombre.
-    """
-    if current_user["rol"] != "admin":
-        raise HTTPException(status_code=403, detail="Solo administradores pueden buscar usuarios")
-    return supabase.table("users") \
-        .select("*") \
-        .ilike("nombre", f"%{query}%") \
-        .execute().data
@@ -1,8 +1,18 @@
+import codecs
+import csv
+from typing import Iterable, NamedTuple, Optional
+from uuid import UUID
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import settings
 from app.db.supabase import supabase
+from app.services.rbac import ACTIVO, index
 
-def assign_patient_to_medico(medico_id: str, paciente_id: str):
+async def assign_patient_to_medico(medico_id: str, paciente_id: str):
     # Comprueba si ya existe la asignación para evitar duplicados (opcional)
-    exists = supabase.table("medicos_pacientes") \
+    exists = await supabase.table("medicos_pacientes") \
         .select("id") \
         .eq("medico_id", medico_id) \
         .eq("paciente_id", paciente_id) \
@@ -10,28 +20,167 @@ def assign_patient_to_medico(medico_id: str, paciente_id: str):
     if exists.data and len(exists.data) > 0:
         return {"message": "El paciente ya está asignado a este médico"}
 
-    res = supabase.table("medicos_pacientes").insert({
+    res = await supabase.table("medicos_pacientes").insert({
         "medico_id": medico_id,
         "paciente_id": paciente_id,
+        "status": "activo",
     }).execute()
     if hasattr(res, "error") and res.error:
         raise Exception(res.error)
+    await index.invalidate(medico_id, paciente_id)
     return {"message": "Paciente asignado correctamente"}
 
-def assign_patient_to_medico(medico_id: str, paciente_id: str):
-    # Comprueba si ya existe la asignación para evitar duplicados (opcional)
-    exists = supabase.table("medicos_pacientes") \
-        .select("id") \
-        .eq("medico_id", medico_id) \
-        .eq("paciente_id", paciente_id) \
+# ----------- Asignaciones en bloque -----------------
+# Por lotes de ASSIGN_BATCH_SIZE parejas: una consulta de usuarios, una de
+# asignaciones existentes (`in_`) y un upsert con `on_conflict`, en vez de
+# dos peticiones por pareja.
+
+class Pareja(NamedTuple):
+    fila: Optional[int]  # línea del CSV (None en la API JSON)
+    medico: str  # id o email
+    paciente: str
+
+def _nuevo_resumen() -> dict:
+    return {"total": 0, "creados": 0, "omitidos": 0, "fallidos": 0, "incidencias": [], "incidencias_no_listadas": 0}
+
+def _incidencia(resumen: dict, par: Pareja, tipo: str, motivo: str):
+    resumen[tipo] += 1
+    # Solo se detallan las primeras: un CSV grande podría tener millones
+    if len(resumen["incidencias"]) >= settings.ASSIGN_MAX_INCIDENCIAS:
+        resumen["incidencias_no_listadas"] += 1
+        return
+    resumen["incidencias"].append({
+        "fila": par.fila, "medico": par.medico, "paciente": par.paciente, "resultado": tipo, "motivo": motivo,
+    })
+
+def _valido(valor: str) -> bool:
+    # Un id mal formado haría fallar el `in_` entero contra la columna uuid
+    if "@" in valor:
+        return True
+    try:
+        UUID(valor)
+    except ValueError:
+        return False
+    return True
+
+async def _usuarios(valores: set[str]) -> dict[str, dict]:
+    # Ids y emails a usuarios, en una consulta por tipo de clave
+    emails = {v for v in valores if "@" in v}
+    ids = valores - emails
+    encontrados = {}
+    for campo, claves in (("id", ids), ("email", emails)):
+        if claves:
+            res = await supabase.table("users").select("id,email,rol").in_(campo, list(claves)).execute()
+            encontrados.update({str(u[campo]): u for u in res.data or []})
+    return encontrados
+
+def _resolver(valor: str, usuarios: dict[str, dict], rol: str) -> Optional[str]:
+    usuario = usuarios.get(valor)
+    return str(usuario["id"]) if usuario and usuario.get("rol") == rol else None
+
+async def _procesar_lote(lote: list[Pareja], resumen: dict, vistas: set):
+    resumen["total"] += len(lote)
+    usuarios = await _usuarios({v for p in lote for v in (p.medico, p.paciente) if _valido(v)})
+
+    candidatas: dict[tuple[str, str], Pareja] = {}
+    for par in lote:
+        if not _valido(par.medico):
+            _incidencia(resumen, par, "fallidos", "Id de médico no válido")
+            continue
+        if not _valido(par.paciente):
+            _incidencia(resumen, par, "fallidos", "Id de paciente no válido")
+            continue
+        medico_id = _resolver(par.medico, usuarios, "medico")
+        paciente_id = _resolver(par.paciente, usuarios, "paciente")
+        if not medico_id:
+            _incidencia(resumen, par, "fallidos", "Médico no encontrado")
+        elif not paciente_id:
+            _incidencia(resumen, par, "fallidos", "Paciente no encontrado")
+        elif (medico_id, paciente_id) in vistas:
+            _incidencia(resumen, par, "omitidos", "Pareja repetida")
+        else:
+            vistas.add((medico_id, paciente_id))
+            candidatas[(medico_id, paciente_id)] = par
+    if not candidatas:
+        return
+
+    res = await supabase.table("medicos_pacientes") \
+        .select("medico_id,paciente_id,status") \
+        .in_("medico_id", list({m for m, _ in candidatas})) \
+        .in_("paciente_id", list({p for _, p in candidatas})) \
         .execute()
-    if exists.data and len(exists.data) > 0:
-        return {"message": "El paciente ya está asignado a este médico"}
+    for fila in res.data or []:
+        clave = (str(fila["medico_id"]), str(fila["paciente_id"]))
+        # Las inactivas se reactivan con el upsert
+        if clave in candidatas and fila.get("status") == ACTIVO:
+            _incidencia(resumen, candidatas.pop(clave), "omitidos", "Ya estaba asignado")
+    if not candidatas:
+        return
 
-    res = supabase.table("medicos_pacientes").insert({
-        "medico_id": medico_id,
-        "paciente_id": paciente_id,
-    }).execute()
-    if hasattr(res, "error") and res.error:
-        raise Exception(res.error)
-    return {"message": "Paciente asignado correctamente"}
+    filas = [{"medico_id": m, "paciente_id": p, "status": ACTIVO} for m, p in candidatas]
+    try:
+        res = await supabase.table("medicos_pacientes") \
+            .upsert(filas, on_conflict="medico_id,paciente_id") \
+            .execute()
+        if hasattr(res, "error") and res.error:
+            raise Exception(res.error)
+    except Exception as e:
+        for par in candidatas.values():
+            _incidencia(resumen, par, "fallidos", f"Error al guardar: {e}")
+        return
+    resumen["creados"] += len(candidatas)
+    for medico_id, paciente_id in candidatas:
+        index.add(medico_id, paciente_id)
+
+async def assign_bulk(pares: Iterable[tuple[str, str]]) -> dict:
+    resumen, vistas = _nuevo_resumen(), set()
+    pares = [Pareja(None, m.strip(), p.strip()) for m, p in pares]
+    for i in range(0, len(pares), settings.ASSIGN_BATCH_SIZE):
+        await _procesar_lote(pares[i:i + settings.ASSIGN_BATCH_SIZE], resumen, vistas)
+    return resumen
+
+def _columna(cabecera: list[str], *nombres: str) -> int:
+    for nombre in nombres:
+        if nombre in cabecera:
+            return cabecera.index(nombre)
+    raise HTTPException(status_code=400, detail=f"Falta la columna {' o '.join(nombres)} en el CSV")
+
+def _leer_lote(filas, n: int) -> list:
+    lote = []
+    for fila in filas:
+        lote.append(fila)
+        if len(lote) >= n:
+            break
+    return lote
+
+async def import_assignments_csv(file) -> dict:
+    """
+    CSV con cabecera y columnas `medico_id` o `medico_email` y `paciente_id`
+    o `paciente_email`. Se lee por lotes: la memoria no depende del tamaño
+    del archivo (salvo el conjunto de parejas ya vistas).
+    """
+    lector = csv.reader(codecs.iterdecode(file.file, "utf-8-sig"))
+    try:
+        cabecera = [c.strip().lower() for c in await run_in_threadpool(next, lector, [])]
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise HTTPException(status_code=400, detail=f"CSV inválido: {e}")
+    col_medico = _columna(cabecera, "medico_id", "medico_email")
+    col_paciente = _columna(cabecera, "paciente_id", "paciente_email")
+    filas = ((n, fila) for n, fila in enumerate(lector, start=2) if any(c.strip() for c in fila))
+
+    resumen, vistas = _nuevo_resumen(), set()
+    while True:
+        try:
+            lote = await run_in_threadpool(_leer_lote, filas, settings.ASSIGN_BATCH_SIZE)
+        except (UnicodeDecodeError, csv.Error) as e:
+            raise HTTPException(status_code=400, detail=f"CSV inválido (tras {resumen['total']} filas): {e}")
+        if not lote:
+            return resumen
+        pares = []
+        for n, fila in lote:
+            if len(fila) <= max(col_medico, col_paciente):
+                resumen["total"] += 1
+                _incidencia(resumen, Pareja(n, fila[0].strip() if fila else "", ""), "fallidos", "Fila incompleta")
+                continue
+            pares.append(Pareja(n, fila[col_medico].strip(), fila[col_paciente].strip()))
+        await _procesar_lote(pares, resumen, vistas)
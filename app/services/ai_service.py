@@ -1,16 +1,84 @@
 from app.db.supabase import supabase
 from datetime import datetime
 from uuid import uuid4
+import logging
 from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
 from app.services.medicos_service import medico_tiene_paciente
+from app.services.genetics_service import indice_muestra, resumen_archivo_vcf
+from app.services import genotypes_service, llm_service, patient_context, recomendaciones_service
+from app.utils.pagination import paginate
+from app.utils.star_alleles import INDETERMINADO, call_store
+from app.utils.vcf_parser import VcfFormatError
 
-def analyze_vcf_file(current_user, input):
+logger = logging.getLogger(__name__)
+
+# Fenotipos sin implicaciones de dosificación: no se listan como riesgo
+_FENOTIPOS_NORMALES = {"Metabolizador normal", "Función normal"}
+
+def _riesgos(farmacogenes: dict) -> list[str]:
+    return [
+        f"{gen} {r['diplotipo']}: {r['fenotipo']}"
+        for gen, r in farmacogenes.items()
+        if r["diplotipo"] and r["fenotipo"] not in _FENOTIPOS_NORMALES and r["fenotipo"] != INDETERMINADO
+    ]
+
+def _comentario(farmacogenes: dict, riesgos: list[str]) -> str:
+    sin_llamar = [gen for gen, r in farmacogenes.items() if r["fenotipo"] == INDETERMINADO]
+    partes = [f"Fenotipos relevantes: {'; '.join(riesgos)}." if riesgos
+              else "Sin fenotipos metabolizadores alterados en los farmacogenes analizados."]
+    if sin_llamar:
+        partes.append(f"Sin fenotipo determinable para: {', '.join(sin_llamar)}.")
+    return " ".join(partes)
+
+def resultado_evaluacion(farmacogenes: dict, variantes: int) -> dict:
+    """`resultado_json` de una evaluación a partir de los farmacogenes de una muestra."""
+    fenotipos = {
+        gen: f"{r['diplotipo']} ({r['fenotipo']})" if r["diplotipo"] else r["fenotipo"]
+        for gen, r in farmacogenes.items()
+    }
+    riesgos = _riesgos(farmacogenes)
+    resultado = {
+        "fenotipos": fenotipos,
+        "medicamentos_no_recomendados": [],
+        "riesgos": riesgos,
+        "comentario_ia": _comentario(farmacogenes, riesgos),
+        "variantes_analizadas": variantes,
+        "farmacogenes": farmacogenes,
+    }
+    resultado["medicamentos_no_recomendados"] = recomendaciones_service.indice().no_recomendados(
+        recomendaciones_service.fenotipos_de(resultado))
+    return resultado
+
+async def _narrativa(fenotipos: dict, content_hash):
+    # Texto libre opcional sobre el resultado ya calculado; si falla, se usa el comentario fijo
+    lineas = "\n".join(f"- {gen}: {valor}" for gen, valor in fenotipos.items())
+    try:
+        return await llm_service.chat_completion(
+            model="gpt-4o",
+            system="Eres un asistente IA experto en farmacogenómica clínica.",
+            prompt=(
+                "Diplotipos y fenotipos farmacogenómicos del paciente (calculados, no los cambies):\n"
+                f"{lineas}\n\n"
+                "Redacta un comentario clínico breve para el médico con las implicaciones "
+                "de prescripción más relevantes según las guías CPIC."
+            ),
+            max_tokens=300,
+            temperature=0.2,
+            cache=True,
+            content_hash=content_hash,
+        )
+    except Exception as e:
+        logger.warning("No se pudo generar la narrativa del análisis: %s", e)
+        return None
+
+async def analyze_vcf_file(current_user, input):
     # 1. Comprueba si el médico está asignado al paciente
-    if not medico_tiene_paciente(current_user["id"], input.paciente_id):
+    if not await medico_tiene_paciente(current_user["id"], input.paciente_id):
         raise HTTPException(status_code=403, detail="No tienes acceso a este paciente")
 
     # 2. Busca el archivo genético en la tabla genetic_profiles
-    profile_res = supabase.table("genetic_profiles") \
+    profile_res = await supabase.table("genetic_profiles") \
         .select("*") \
         .eq("id", input.genetic_profile_id) \
         .single() \
@@ -20,21 +88,27 @@ def analyze_vcf_file(current_user, input):
     if not profile or profile["user_id"] != input.paciente_id:
         raise HTTPException(status_code=404, detail="Archivo genético no válido o no pertenece al paciente")
 
-    # 3. Descarga el archivo VCF desde Supabase Storage
+    # 3. Resumen y almacén de genotipos del VCF (se genera si aún no existe) y
+    # 4. diplotipos y fenotipos de los farmacogenes (la muestra del paciente en el VCF)
     try:
-        file_res = supabase.storage.from_("vcf-files").download(profile["archivo_vcf"])
-        vcf_content = file_res.decode("utf-8") if hasattr(file_res, "decode") else file_res.text
+        resumen = await resumen_archivo_vcf(profile["archivo_vcf"], muestra=profile.get("muestra"))
+        async with genotypes_service.abierto(profile["archivo_vcf"]) as store:
+            if not store.samples:
+                raise HTTPException(status_code=400, detail="El VCF no tiene columnas de muestra (GT)")
+            i = indice_muestra(store, profile.get("muestra"))
+            llamadas = await run_in_threadpool(call_store, store, [i])
+            farmacogenes = llamadas[store.samples[i]]
+    except HTTPException:
+        raise
+    except VcfFormatError as e:
+        raise HTTPException(status_code=400, detail=f"Archivo VCF inválido: {e}")
     except Exception as e:
-        raise HTTPException(status_code=500, detail="No se pudo descargar el archivo VCF")
-
-    # 4. Llama a OpenAI o IA (aquí simulado)
-    # Aquí pones la llamada real a la IA usando openai.ChatCompletion.create(...)
-    simulated_result = {
-        "medicamentos_no_recomendados": ["ibuprofeno"],
-        "riesgos": ["Riesgo aumentado de reacciones adversas con AINEs"],
-        "comentario_ia": "El paciente tiene una variante CYP2C9 que reduce el metabolismo de ibuprofeno."
-    }
-    resultado_json = simulated_result
+        raise HTTPException(status_code=500, detail="No se pudo leer el archivo VCF")
+    resultado_json = resultado_evaluacion(farmacogenes, resumen["variantes"])
+    if input.narrativa:
+        comentario = await _narrativa(resultado_json["fenotipos"], profile.get("content_hash"))
+        if comentario:
+            resultado_json["comentario_ia"] = comentario
 
     # 5. Guarda la evaluación en la tabla evaluaciones_ia
     data = {
@@ -43,19 +117,20 @@ def analyze_vcf_file(current_user, input):
         "resultado_json": resultado_json,
         "fecha_evaluacion": datetime.utcnow().isoformat()
     }
-    res = supabase.table("evaluaciones_ia").insert(data).execute()
+    res = await supabase.table("evaluaciones_ia").insert(data).execute()
     if hasattr(res, "error") and res.error:
         raise HTTPException(status_code=500, detail=f"Error al guardar la evaluación: {res.error}")
+    patient_context.invalidate(input.paciente_id)
 
     # Devuelve el objeto insertado
     return res.data[0]
 
-def get_mis_evaluaciones(user):
-    res = supabase.table("evaluaciones_ia").select("*").eq("user_id", user["id"]).order("fecha_evaluacion", desc=True).execute()
-    return res.data or []
+async def get_mis_evaluaciones(user, page):
+    query = supabase.table("evaluaciones_ia").select("*").eq("user_id", user["id"])
+    return await paginate(query, page, "fecha_evaluacion")
 
-def get_evaluaciones_paciente(current_user, paciente_id):
-    if not medico_tiene_paciente(current_user["id"], paciente_id):
+async def get_evaluaciones_paciente(current_user, paciente_id, page):
+    if not await medico_tiene_paciente(current_user["id"], paciente_id):
         raise HTTPException(status_code=403, detail="No tienes acceso a este paciente")
-    res = supabase.table("evaluaciones_ia").select("*").eq("user_id", paciente_id).order("fecha_evaluacion", desc=True).execute()
-    return res.data or []
+    query = supabase.table("evaluaciones_ia").select("*").eq("user_id", paciente_id)
+    return await paginate(query, page, "fecha_evaluacion")
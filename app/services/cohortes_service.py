@@ -0,0 +1,180 @@
+"""
+Ingesta de VCF de cohorte: un archivo con una columna por paciente.
+
+El VCF se guarda una sola vez (por su SHA-256) y se convierte una sola vez
+al almacén de genotipos. A partir de ahí todo va por cohorte y no por
+paciente: los alelos estrella de todas las muestras se calculan buscando
+cada sitio una vez, los recuentos de variantes salen de la matriz de
+genotipos entera y los perfiles y evaluaciones se escriben en inserciones
+por lotes de `COHORT_BATCH_SIZE` filas (las búsquedas con `in_`, que van en
+la URL, en lotes de `COHORT_LOOKUP_BATCH_SIZE` ids).
+
+Repetir el trabajo no duplica nada: los perfiles existentes se reutilizan y
+cada evaluación tiene un id derivado del contenido, la muestra, el paciente
+y las versiones de las tablas, así que se sobrescribe en vez de repetirse.
+
+Cada perfil guarda la columna del paciente (`genetic_profiles.muestra`);
+los lectores (`/ai/analyze`, contexto del chat) usan solo esa columna.
+Los informes PDF no se generan en bloque: se piden por paciente.
+"""
+import json
+import os
+from datetime import datetime
+from uuid import NAMESPACE_URL, uuid5
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.db.supabase import supabase
+from app.services import genetics_service, genotypes_service, jobs_service, patient_context, recomendaciones_service
+from app.services.ai_service import resultado_evaluacion
+from app.services.medicos_service import medico_tiene_paciente
+from app.utils.star_alleles import call_store, load_tables
+from app.utils.vcf_parser import VcfReader, VcfFormatError
+
+
+def _lotes(items: list, size: int):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def parse_muestras(muestras: str) -> dict[str, str]:
+    """`{"muestra": "paciente_id"}` enviado como JSON en el formulario."""
+    try:
+        mapa = json.loads(muestras)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="`muestras` debe ser un objeto JSON {muestra: paciente_id}")
+    if not isinstance(mapa, dict) or not mapa or not all(isinstance(v, str) and v for v in mapa.values()):
+        raise HTTPException(status_code=400, detail="`muestras` debe ser un objeto JSON {muestra: paciente_id}")
+    if len(set(mapa.values())) != len(mapa):
+        raise HTTPException(status_code=400, detail="Cada paciente solo puede tener una muestra")
+    if len(mapa) > settings.COHORT_MAX_SAMPLES:
+        raise HTTPException(status_code=400, detail=f"Como mucho {settings.COHORT_MAX_SAMPLES} muestras por cohorte")
+    return mapa
+
+
+def _muestras_vcf(path: str) -> list[str]:
+    with open(path, "rb") as f:
+        try:
+            return VcfReader(f).samples
+        except VcfFormatError as e:
+            raise HTTPException(status_code=400, detail=f"Archivo VCF inválido: {e}")
+
+
+async def upload_cohorte(file, muestras: dict[str, str], current_user) -> dict:
+    sin_acceso = [p for p in muestras.values() if not await medico_tiene_paciente(current_user["id"], p)]
+    if sin_acceso:
+        raise HTTPException(status_code=403,
+                            detail=f"No puedes subir archivos para estos pacientes: {', '.join(sin_acceso[:20])}")
+
+    tmp_path, content_hash = await run_in_threadpool(genetics_service.spool_to_disk, file)
+    try:
+        en_vcf = await run_in_threadpool(_muestras_vcf, tmp_path)
+        faltan = [m for m in muestras if m not in en_vcf]
+        if faltan:
+            raise HTTPException(status_code=400, detail=f"Muestras que no están en el VCF: {', '.join(faltan[:20])}")
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    job = jobs_service.submit(
+        "cohorte_vcf",
+        COHORTE_STAGES,
+        {"vcf_path": tmp_path, "content_hash": content_hash, "muestras": muestras},
+        owner_id=current_user["id"],
+        on_finish=_limpiar_temporal,
+    )
+    return {"job_id": job["id"], "status": job["status"], "content_hash": content_hash, "muestras": len(muestras)}
+
+
+# ----------- Etapas -----------------
+
+async def _etapa_almacen(ctx):
+    # VCF (por contenido) y almacén de genotipos: una vez para toda la cohorte
+    ctx["archivo_vcf"] = await genetics_service.guardar_vcf(ctx["vcf_path"], ctx["content_hash"])
+    ctx["gt_path"] = genotypes_service.temp_path()
+    await run_in_threadpool(genotypes_service.construir, ctx["vcf_path"], ctx["gt_path"])
+    await genotypes_service.publicar(ctx["archivo_vcf"], ctx["gt_path"])
+
+
+async def _etapa_perfiles(ctx):
+    # Por lote: los perfiles que ya existen (mismo contenido y paciente) se reutilizan
+    ahora = datetime.utcnow().isoformat()
+    por_paciente = {p: m for m, p in ctx["muestras"].items()}
+    perfiles = {}
+    for lote in _lotes(list(por_paciente), settings.COHORT_LOOKUP_BATCH_SIZE):
+        res = await supabase.table("genetic_profiles").select("id,user_id,muestra") \
+            .eq("content_hash", ctx["content_hash"]).in_("user_id", lote).execute()
+        perfiles.update({str(r["user_id"]): r for r in res.data or [] if r.get("muestra") == por_paciente[str(r["user_id"])]})
+    nuevos = [{
+        "user_id": p,
+        "archivo_vcf": ctx["archivo_vcf"],
+        "content_hash": ctx["content_hash"],
+        "muestra": m,
+        "fecha_subida": ahora,
+    } for p, m in por_paciente.items() if p not in perfiles]
+    for lote in _lotes(nuevos, settings.COHORT_BATCH_SIZE):
+        res = await supabase.table("genetic_profiles").insert(lote).execute()
+        if hasattr(res, "error") and res.error:
+            raise Exception(f"Error al guardar los perfiles: {res.error}")
+        perfiles.update({str(r["user_id"]): r for r in res.data})
+    ctx["perfiles"] = perfiles
+    ctx["perfiles_nuevos"] = len(nuevos)
+
+
+async def _etapa_genotipado(ctx):
+    async with genotypes_service.abierto(ctx["archivo_vcf"]) as store:
+        indices = {m: store.samples.index(m) for m in ctx["muestras"]}
+        llamadas = await run_in_threadpool(call_store, store, sorted(indices.values()))
+        variantes = await run_in_threadpool(store.variant_counts)
+    ctx["resultados"] = {
+        paciente: resultado_evaluacion(llamadas[m], variantes[indices[m]])
+        for m, paciente in ctx["muestras"].items()
+    }
+
+
+def _id_evaluacion(content_hash: str, muestra: str, paciente: str) -> str:
+    # Mismo VCF, muestra, paciente y tablas -> mismo resultado y mismo id
+    versiones = ",".join(f"{t.gen}:{t.version}" for t in load_tables())
+    clave = f"cohorte:{content_hash}:{muestra}:{paciente}:{versiones}:{recomendaciones_service.indice().version}"
+    return str(uuid5(NAMESPACE_URL, clave))
+
+
+async def _etapa_evaluaciones(ctx):
+    ahora = datetime.utcnow().isoformat()
+    por_paciente = {p: m for m, p in ctx["muestras"].items()}
+    filas = [{
+        "id": _id_evaluacion(ctx["content_hash"], por_paciente[paciente], paciente),
+        "user_id": paciente,
+        "resultado_json": resultado,
+        "fecha_evaluacion": ahora,
+    } for paciente, resultado in ctx.pop("resultados").items()]
+    for lote in _lotes(filas, settings.COHORT_BATCH_SIZE):
+        # Upsert por id: un reintento sobrescribe las filas en vez de duplicarlas
+        res = await supabase.table("evaluaciones_ia").upsert(lote, on_conflict="id").execute()
+        if hasattr(res, "error") and res.error:
+            raise Exception(f"Error al guardar las evaluaciones: {res.error}")
+    for paciente in ctx["muestras"].values():
+        patient_context.invalidate(paciente)
+    ctx["resultado"] = {
+        "archivo_vcf": ctx["archivo_vcf"],
+        "muestras": len(ctx["muestras"]),
+        "perfiles_nuevos": ctx["perfiles_nuevos"],
+        "evaluaciones": len(filas),
+        "perfiles": {p: r["id"] for p, r in ctx["perfiles"].items()},
+    }
+
+
+async def _limpiar_temporal(ctx):
+    for key in ("vcf_path", "gt_path"):
+        if ctx.get(key) and os.path.exists(ctx[key]):
+            os.remove(ctx[key])
+
+
+COHORTE_STAGES = [
+    ("almacen", _etapa_almacen),
+    ("perfiles", _etapa_perfiles),
+    ("genotipado", _etapa_genotipado),
+    ("evaluaciones", _etapa_evaluaciones),
+]
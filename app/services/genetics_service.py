@@ -2,95 +2,344 @@ from app.db.supabase import supabase
 from uuid import uuid4
 from datetime import datetime
 from fastapi import HTTPException
-import openai
+from fastapi.concurrency import run_in_threadpool
+import json
 import os
-from fpdf import FPDF
 import tempfile
+import shutil
+import logging
+from app.core.cache import TTLCache
+from app.services import genotypes_service, jobs_service, llm_service, patient_context, pdf_renderer
+from app.services.rbac import can_access
+from app.utils.pagination import paginate
+from app.utils.genotype_store import GenotypeStoreWriter
+from app.utils.vcf_parser import VcfReader, VcfFormatError, HashingReader, summarize_variants, DEFAULT_CHUNK_SIZE
 
-# Configurar la API key de OpenAI
-openai.api_key = os.getenv("OPENAI_API_KEY")
+logger = logging.getLogger(__name__)
 
-def analyze_vcf_with_ia(vcf_content: bytes) -> str:
+# Los objetos del bucket no se sobrescriben (nombre uuid o hash del contenido),
+# se puede cachear por ruta
+_resumenes_vcf = TTLCache(maxsize=64, ttl=3600)
+
+def _format_resumen(resumen: dict) -> str:
+    lineas = "\n".join(resumen["muestra"])
+    return (
+        f"Registros: {resumen['registros']} | Variantes no referencia: {resumen['variantes']}\n"
+        f"{lineas}"
+    )
+
+def resumir_vcf(stream, max_variants: int = 200) -> dict:
+    """Parsea un VCF (plano o gzip) en streaming y devuelve su resumen compacto."""
+    try:
+        return summarize_variants(VcfReader(stream), max_variants=max_variants)
+    except VcfFormatError as e:
+        raise HTTPException(status_code=400, detail=f"Archivo VCF inválido: {e}")
+
+def indice_muestra(store, muestra: str | None) -> int:
+    """Columna de `muestra` en el VCF; sin muestra (perfil de un paciente), la primera."""
+    if muestra is None:
+        return 0
+    try:
+        return store.samples.index(muestra)
+    except ValueError:
+        raise HTTPException(status_code=404, detail=f"Muestra {muestra} no encontrada en el VCF")
+
+def _registros_muestra(store, i: int):
+    # Registros con solo el GT de la muestra i, para resumir un VCF de cohorte
+    for rec in store.iter_records():
+        yield rec._replace(gts=rec.gts[i:i + 1])
+
+async def resumen_archivo_vcf(archivo_vcf: str, max_variants: int = 50, muestra: str | None = None) -> dict:
+    key = (archivo_vcf, max_variants, muestra)
+    resumen = _resumenes_vcf.get(key)
+    if resumen is None:
+        # Desde el almacén de genotipos (mmap), sin bajar ni parsear el VCF
+        try:
+            async with genotypes_service.abierto(archivo_vcf) as store:
+                registros = store.iter_records() if muestra is None else _registros_muestra(store, indice_muestra(store, muestra))
+                resumen = await run_in_threadpool(summarize_variants, registros, max_variants)
+        except VcfFormatError as e:
+            raise HTTPException(status_code=400, detail=f"Archivo VCF inválido: {e}")
+        _resumenes_vcf.set(key, resumen)
+    return resumen
+
+# Prefijo de los informes que guardaban el error del LLM como contenido
+_ERROR_IA = "Error al analizar archivo VCF con IA"
+
+async def analyze_vcf_with_ia(resumen: dict, content_hash: str | None = None) -> str:
     prompt = (
-        "Eres un asistente IA clínico experto en farmacogenómica. Analiza este archivo VCF de perfil genético "
+        "Eres un asistente IA clínico experto en farmacogenómica. Analiza este resumen del archivo VCF de perfil genético "
         "de un paciente y genera un informe clínico breve para el médico: "
         "\n---\n"
-        f"{vcf_content.decode(errors='ignore')[:5000]}\n---\n"
+        f"{_format_resumen(resumen)}\n---\n"
         "Resume las variantes principales y posibles relevancias clínicas en menos de 350 palabras."
     )
     try:
-        response = openai.chat.completions.create(
+        return await llm_service.chat_completion(
             model="gpt-4o",  # Usa gpt-4o si tienes acceso, si no pon "gpt-3.5-turbo"
-            messages=[
-                {"role": "system", "content": "Eres un asistente IA experto en farmacogenómica clínica."},
-                {"role": "user", "content": prompt}
-            ],
+            system="Eres un asistente IA experto en farmacogenómica clínica.",
+            prompt=prompt,
             max_tokens=400,
+            cache=True,
+            content_hash=content_hash,
         )
-        return response.choices[0].message.content.strip()
     except Exception as e:
-        return f"Error al analizar archivo VCF con IA: {e}"
-
-def _generar_pdf_informe_ia(texto, filename_pdf="informe_temp.pdf"):
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", size=12)
-    pdf.multi_cell(0, 10, texto)
-    # Guardar temporalmente el PDF
-    temp_pdf_path = os.path.join(tempfile.gettempdir(), filename_pdf)
-    pdf.output(temp_pdf_path)
-    with open(temp_pdf_path, "rb") as f:
-        pdf_bytes = f.read()
-    os.remove(temp_pdf_path)
-    return pdf_bytes
-
-def upload_genetic_file(file, paciente_id):
-    content = file.file.read()
-    filename = f"{paciente_id}/{uuid4()}.vcf"
-    # Subir archivo VCF a Supabase Storage
-    res = supabase.storage.from_("vcf-files").upload(filename, content)
-    if hasattr(res, "error") and res.error:
-        raise Exception(res.error)
-    # Guardar perfil genético
-    data = {
-        "user_id": paciente_id,
-        "archivo_vcf": filename,
-        "fecha_subida": datetime.utcnow().isoformat()
-    }
-    result = supabase.table("genetic_profiles").insert(data).execute()
-    profile = result.data[0]
-    # Analizar automáticamente y crear informe en la tabla informes
-    ia_report = analyze_vcf_with_ia(content)
-
-    # ----------- GENERAR PDF CON FPDF -----------------
-    filename_pdf = f"{paciente_id}/{uuid4()}.pdf"
-    pdf_bytes = _generar_pdf_informe_ia(ia_report, "informe_temp.pdf")
+        # Falla la etapa: un error no se guarda como informe (se reutilizaría)
+        raise Exception(f"{_ERROR_IA}: {e}") from e
+
+def spool_to_disk(file) -> tuple[str, str]:
+    # Copia la subida a un temporal por bloques, sin cargarla entera en memoria,
+    # y calcula su SHA-256 en la misma pasada
+    reader = HashingReader(file.file)
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".vcf") as tmp:
+        shutil.copyfileobj(reader, tmp, DEFAULT_CHUNK_SIZE)
+        return tmp.name, reader.hexdigest()
+
+def ruta_por_contenido(content_hash: str) -> str:
+    """Ruta del VCF en el bucket: un único objeto por contenido."""
+    return f"sha256/{content_hash[:2]}/{content_hash}.vcf"
+
+def _ya_existe(e: Exception) -> bool:
+    texto = str(e)
+    return "Duplicate" in texto or "already exists" in texto
+
+async def _guardar_por_partes(ruta: str, partes: list[tuple[str, str]]):
+    # Las partes ya están en Storage: se copian allí mismo (sin volver a
+    # enviarlas) a rutas por su SHA-256 y se escribe el manifiesto al final
+    bucket = supabase.storage.from_("vcf-files")
+    destinos = []
+    for origen, sha256 in partes:
+        destino = f"{ruta}.partes/{sha256}"
+        if destino not in destinos:
+            try:
+                await bucket.copy(origen, destino)
+            except Exception as e:
+                # Misma ruta, mismo contenido: la dejó otra subida
+                if not _ya_existe(e):
+                    raise
+        destinos.append(destino)
+    manifiesto = json.dumps({"partes": destinos}).encode()
+    try:
+        await bucket.upload(genotypes_service.ruta_manifiesto(ruta), manifiesto, {"content-type": "application/json"})
+    except Exception as e:
+        if not _ya_existe(e):
+            raise
+
+async def guardar_vcf(tmp_path: str, content_hash: str, partes: list[tuple[str, str]] | None = None) -> str:
+    """
+    Guarda el VCF en `ruta_por_contenido`. Con `partes` (`(ruta, sha256)` de
+    objetos del bucket que, concatenados, son el VCF) no se sube `tmp_path`:
+    se guardan las partes y su manifiesto (ver `genotypes_service`).
+    """
+    ruta = ruta_por_contenido(content_hash)
+    res = await supabase.table("genetic_profiles").select("id").eq("content_hash", content_hash).limit(1).execute()
+    if res.data:
+        return ruta
+    if partes is not None:
+        await _guardar_por_partes(ruta, partes)
+        return ruta
+    try:
+        # Subir archivo VCF a Supabase Storage (desde disco, en streaming)
+        res = await supabase.storage.from_("vcf-files").upload(ruta, tmp_path)
+        if hasattr(res, "error") and res.error:
+            raise Exception(res.error)
+    except Exception as e:
+        # Otra subida con el mismo contenido llegó antes: el objeto ya está
+        if not _ya_existe(e):
+            raise
+    return ruta
+
+async def _informe_previo(content_hash: str, paciente_id: str) -> dict | None:
+    """Último informe con PDF de este contenido; primero el del propio paciente."""
+    res = await supabase.table("informes") \
+        .select("id,user_id,archivo_pdf,contenido") \
+        .eq("content_hash", content_hash) \
+        .not_.is_("archivo_pdf", "null") \
+        .order("fecha_generado", desc=True) \
+        .limit(20) \
+        .execute()
+    # Los informes de error de antes no cuentan como análisis previo
+    informes = [i for i in res.data or [] if not (i.get("contenido") or "").startswith(_ERROR_IA)]
+    propio = next((i for i in informes if str(i["user_id"]) == str(paciente_id)), None)
+    return propio or (informes[0] if informes else None)
+
+async def registrar_vcf(tmp_path: str, content_hash: str, paciente_id: str,
+                        partes: list[tuple[str, str]] | None = None) -> tuple[dict, dict | None]:
+    """
+    Guarda el VCF (ya en disco) y su perfil genético; devuelve el perfil y el
+    informe previo del mismo contenido, si lo hay.
+
+    El VCF se guarda por su SHA-256: un mismo contenido es un solo objeto en
+    Storage. Si ese contenido ya tiene informe se reutiliza (análisis y PDF)
+    y, si además el paciente ya tenía el perfil, no se crea otro. `partes`
+    es para las subidas por partes (ver `guardar_vcf`).
+    """
+    res = await supabase.table("genetic_profiles").select("*") \
+        .eq("user_id", paciente_id).eq("content_hash", content_hash).limit(1).execute()
+    profile = res.data[0] if res.data else None
+    if profile is None:
+        ruta = await guardar_vcf(tmp_path, content_hash, partes)
+        # Guardar perfil genético
+        data = {
+            "user_id": paciente_id,
+            "archivo_vcf": ruta,
+            "content_hash": content_hash,
+            "fecha_subida": datetime.utcnow().isoformat()
+        }
+        result = await supabase.table("genetic_profiles").insert(data).execute()
+        profile = result.data[0]
+        patient_context.invalidate(paciente_id)
+    return profile, await _informe_previo(content_hash, paciente_id)
+
+async def upload_genetic_file(file, paciente_id, current_user):
+    """
+    Guarda el VCF y su perfil genético y encola el análisis (parseo, IA, PDF,
+    informe). Devuelve el perfil y el id del trabajo sin esperar al análisis.
+    """
+    tmp_path, content_hash = await run_in_threadpool(spool_to_disk, file)
+    try:
+        profile, previo = await registrar_vcf(tmp_path, content_hash, paciente_id)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+    job = jobs_service.submit(
+        "analisis_vcf",
+        ANALISIS_VCF_STAGES,
+        {"paciente_id": paciente_id, "profile": profile, "vcf_path": tmp_path,
+         "content_hash": content_hash, "previo": previo},
+        owner_id=current_user["id"],
+        on_finish=_limpiar_temporal,
+    )
+    return {"job_id": job["id"], "status": job["status"], "profile": profile}
+
+# ----------- Etapas del análisis en segundo plano -----------------
+# Con `previo` (mismo contenido ya analizado) las etapas reutilizan su
+# análisis y su PDF en vez de repetirlos.
+
+def _resumir_archivo_local(path, gt_path):
+    # Una sola pasada: resumen para el prompt + almacén columnar de genotipos
+    with open(path, "rb") as f:
+        try:
+            reader = VcfReader(f)
+            with GenotypeStoreWriter(gt_path, reader.samples) as writer:
+                return summarize_variants(writer.tee(reader))
+        except VcfFormatError as e:
+            raise HTTPException(status_code=400, detail=f"Archivo VCF inválido: {e}")
+
+async def _etapa_parseo(ctx):
+    if ctx["previo"]:
+        return
+    ctx["gt_path"] = genotypes_service.temp_path()
+    ctx["resumen"] = await run_in_threadpool(_resumir_archivo_local, ctx["vcf_path"], ctx["gt_path"])
+
+async def _etapa_genotipos(ctx):
+    if not ctx.get("gt_path"):
+        return
+    try:
+        await genotypes_service.publicar(ctx["profile"]["archivo_vcf"], ctx["gt_path"])
+    except Exception as e:
+        # No bloquea el análisis: el almacén se regenera al leerlo por primera vez
+        logger.warning("No se pudo guardar el almacén de genotipos: %s", e)
+
+async def _etapa_analisis_ia(ctx):
+    if ctx["previo"]:
+        ctx["ia_report"] = ctx["previo"]["contenido"]
+        return
+    ctx["ia_report"] = await analyze_vcf_with_ia(ctx["resumen"], ctx["content_hash"])
+
+async def _etapa_pdf(ctx):
+    if ctx["previo"]:
+        return
+    ctx["pdf_bytes"] = await pdf_renderer.render("informe_ia", {"texto": ctx["ia_report"]})
+
+def _previo_propio(ctx) -> bool:
+    return bool(ctx["previo"]) and str(ctx["previo"]["user_id"]) == str(ctx["paciente_id"])
+
+async def _etapa_subida_pdf(ctx):
+    if _previo_propio(ctx):
+        ctx["archivo_pdf"] = ctx["previo"]["archivo_pdf"]
+        return
+    filename_pdf = f"{ctx['paciente_id']}/{uuid4()}.pdf"
+    if ctx["previo"]:
+        # PDF de otro paciente: se copia a la carpeta de este (sin enlazar el objeto ajeno)
+        try:
+            await supabase.storage.from_("reportes").copy(ctx["previo"]["archivo_pdf"], filename_pdf)
+            ctx["archivo_pdf"] = filename_pdf
+            return
+        except Exception as e:
+            logger.warning("No se pudo copiar el PDF previo (%s); se vuelve a generar", e)
+            ctx["pdf_bytes"] = await pdf_renderer.render("informe_ia", {"texto": ctx["ia_report"]})
     # Subir PDF a Supabase Storage (bucket: reportes)
-    res_pdf = supabase.storage.from_("reportes").upload(filename_pdf, pdf_bytes)
+    res_pdf = await supabase.storage.from_("reportes").upload(filename_pdf, ctx.pop("pdf_bytes"))
     if hasattr(res_pdf, "error") and res_pdf.error:
-        archivo_pdf = None
+        ctx["archivo_pdf"] = None
     else:
-        archivo_pdf = filename_pdf
+        ctx["archivo_pdf"] = filename_pdf
 
-    # --------------------------------------------------
-    supabase.table("informes").insert({
-        "user_id": paciente_id,
+async def _etapa_informe(ctx):
+    previo = ctx["previo"]
+    if _previo_propio(ctx):
+        # El paciente ya tiene este informe: no se duplica
+        ctx["resultado"] = {
+            "profile_id": ctx["profile"]["id"],
+            "informe_id": previo["id"],
+            "archivo_pdf": previo["archivo_pdf"],
+            "reutilizado": True,
+        }
+        return
+    res = await supabase.table("informes").insert({
+        "user_id": ctx["paciente_id"],
         "descripcion": "Informe automático generado por IA tras subida de perfil genético.",
         "status": "completado",
         "created_at": datetime.utcnow().isoformat(),
         "fecha_generado": datetime.utcnow().isoformat(),
-        "archivo_pdf": archivo_pdf,   # <- GUARDAMOS LA RUTA DEL PDF
-        "contenido": ia_report
+        "archivo_pdf": ctx["archivo_pdf"],   # <- GUARDAMOS LA RUTA DEL PDF
+        "contenido": ctx["ia_report"],
+        "content_hash": ctx["content_hash"],
     }).execute()
-    return profile
+    informe = res.data[0] if res.data else {}
+    patient_context.invalidate(ctx["paciente_id"])
+    ctx["resultado"] = {
+        "profile_id": ctx["profile"]["id"],
+        "informe_id": informe.get("id"),
+        "archivo_pdf": ctx["archivo_pdf"],
+        "reutilizado": previo is not None,
+    }
+
+async def _limpiar_temporal(ctx):
+    for key in ("vcf_path", "gt_path"):
+        if ctx.get(key) and os.path.exists(ctx[key]):
+            os.remove(ctx[key])
+
+ANALISIS_VCF_STAGES = [
+    ("parseo_vcf", _etapa_parseo),
+    ("genotipos", _etapa_genotipos),
+    ("analisis_ia", _etapa_analisis_ia),
+    ("pdf", _etapa_pdf),
+    ("subida_pdf", _etapa_subida_pdf),
+    ("informe", _etapa_informe),
+]
+
+def get_job_status(job_id, user):
+    job = jobs_service.get_job(job_id)
+    if not job and not jobs_service.es_local(job_id):
+        # Estado en memoria: un reinicio (u otra réplica) no lo conoce
+        raise HTTPException(status_code=410, detail="El trabajo no está en este servidor: se reinició o lo procesó "
+                                                    "otra instancia. Vuelve a enviar el archivo")
+    if not job:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado o caducado")
+    if job["owner_id"] != user["id"] and user["rol"] != "admin":
+        raise HTTPException(status_code=403, detail="Sin acceso a este trabajo")
+    return job
 
-def get_my_genetic_files(user):
-    res = supabase.table("genetic_profiles").select("*").eq("user_id", user["id"]).order("fecha_subida", desc=True).execute()
-    return res.data or []
+async def get_my_genetic_files(user, page):
+    query = supabase.table("genetic_profiles").select("*").eq("user_id", user["id"])
+    return await paginate(query, page, "fecha_subida")
 
-def get_genetic_file_detail(id, user):
-    res = supabase.table("genetic_profiles").select("*").eq("id", id).single().execute()
+async def get_genetic_file_detail(id, user):
+    res = await supabase.table("genetic_profiles").select("*").eq("id", id).single().execute()
     file = res.data
-    if not file or (file["user_id"] != user["id"] and user["rol"] != "medico"):
+    if not file or not await can_access(user, file["user_id"]):
         raise HTTPException(status_code=403, detail="Sin acceso a este archivo")
     return file
@@ -0,0 +1,181 @@
+"""
+Almacén columnar de genotipos de cada perfil (`app.utils.genotype_store`).
+
+Se genera en el pipeline de subida, en la misma pasada que el resumen del
+VCF, y se guarda en Storage junto al original (`<ruta>.gt`). Los lectores lo
+descargan una vez a una caché LRU en disco y lo abren con `mmap`: consultar
+variantes ya no obliga a bajar y parsear el VCF en texto. Los perfiles
+anteriores al almacén se convierten la primera vez que se leen.
+
+Los VCF de las subidas por partes no se guardan en un solo objeto: son sus
+partes, copiadas en Storage, y un manifiesto (`<ruta>.partes.json`) con el
+orden en que se concatenan.
+
+Los almacenes abiertos se comparten (`abierto`); cada uso lleva la cuenta
+y el que sale de la caché se cierra cuando termina el último que lo usa.
+"""
+import json
+import logging
+import os
+import tempfile
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.cache import DiskLRUCache, TTLCache
+from app.core.config import settings
+from app.db.supabase import supabase
+from app.utils.genotype_store import GenotypeStore, write_store
+from app.utils.vcf_parser import VcfReader, DEFAULT_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+BUCKET = "vcf-files"
+
+genotype_cache = DiskLRUCache(settings.GENOTYPE_CACHE_DIR, settings.GENOTYPE_CACHE_MAX_BYTES)
+
+
+class _Abierto:
+    """Almacén abierto con la cuenta de quién lo está usando."""
+
+    def __init__(self, store: GenotypeStore):
+        self.store = store
+        self.usos = 0
+        self.desalojado = False
+
+    def soltar(self):
+        self.usos -= 1
+        self._cerrar_si_libre()
+
+    def desalojar(self):
+        self.desalojado = True
+        self._cerrar_si_libre()
+
+    def _cerrar_si_libre(self):
+        if self.desalojado and not self.usos:
+            self.store.close()
+
+
+# Almacenes ya abiertos (mmap), por ruta; al salir de la caché se cierran
+_abiertos = TTLCache(maxsize=64, ttl=3600, on_evict=_Abierto.desalojar)
+
+
+def ruta_genotipos(archivo_vcf: str) -> str:
+    base, ext = os.path.splitext(archivo_vcf)
+    if ext == ".gz":
+        base = os.path.splitext(base)[0]
+    return base + ".gt"
+
+
+def ruta_manifiesto(archivo_vcf: str) -> str:
+    """Manifiesto de un VCF guardado por partes: `{"partes": [rutas, en orden]}`."""
+    return f"{archivo_vcf}.partes.json"
+
+
+def construir(vcf_path: str, gt_path: str) -> None:
+    """Genera el almacén a partir de un VCF local (plano o gzip)."""
+    with open(vcf_path, "rb") as f:
+        reader = VcfReader(f)
+        write_store(reader, reader.samples, gt_path)
+
+
+def temp_path() -> str:
+    """Temporal para generar un almacén que luego se pasa a `publicar`."""
+    return genotype_cache.temp_path()
+
+
+async def publicar(archivo_vcf: str, gt_path: str) -> None:
+    """Sube el almacén junto al VCF y lo deja en la caché local (mueve `gt_path`)."""
+    ruta = ruta_genotipos(archivo_vcf)
+    with open(gt_path, "rb") as f:
+        await supabase.storage.from_(BUCKET).upload(ruta, f, {"upsert": "true"})
+    genotype_cache.put(ruta, gt_path)
+
+
+async def _volcar(ruta: str, f) -> bool:
+    upstream = await supabase.open_object(BUCKET, ruta)
+    try:
+        if upstream.status_code >= 400:
+            return False
+        async for chunk in upstream.aiter_bytes(DEFAULT_CHUNK_SIZE):
+            await run_in_threadpool(f.write, chunk)
+        return True
+    finally:
+        await upstream.aclose()
+
+
+async def _descargar(ruta: str, destino: str) -> bool:
+    with open(destino, "wb") as f:
+        return await _volcar(ruta, f)
+
+
+async def _descargar_vcf(archivo_vcf: str, destino: str) -> bool:
+    if await _descargar(archivo_vcf, destino):
+        return True
+    # Subida por partes: se concatenan las partes que lista el manifiesto
+    try:
+        manifiesto = json.loads(await supabase.storage.from_(BUCKET).download(ruta_manifiesto(archivo_vcf)))
+    except Exception:
+        return False
+    with open(destino, "wb") as f:
+        for ruta in manifiesto["partes"]:
+            if not await _volcar(ruta, f):
+                raise FileNotFoundError(f"Parte del VCF no encontrada en Storage: {ruta}")
+    return True
+
+
+async def _convertir(archivo_vcf: str, destino: str) -> None:
+    # Perfil sin almacén: se baja el VCF, se convierte y se publica
+    fd, vcf_path = tempfile.mkstemp(suffix=".vcf")
+    os.close(fd)
+    try:
+        if not await _descargar_vcf(archivo_vcf, vcf_path):
+            raise FileNotFoundError(f"VCF no encontrado en Storage: {archivo_vcf}")
+        await run_in_threadpool(construir, vcf_path, destino)
+    finally:
+        os.remove(vcf_path)
+    with open(destino, "rb") as f:
+        await supabase.storage.from_(BUCKET).upload(ruta_genotipos(archivo_vcf), f, {"upsert": "true"})
+
+
+async def _abrir(ruta: str, archivo_vcf: str) -> GenotypeStore:
+    cached = genotype_cache.get(ruta)
+    if cached is not None:
+        store = GenotypeStore(cached[0])
+    else:
+        tmp = genotype_cache.temp_path()
+        try:
+            if not await _descargar(ruta, tmp):
+                logger.info("Generando almacén de genotipos para %s", archivo_vcf)
+                await _convertir(archivo_vcf, tmp)
+            # Abierto antes de publicarlo: el mmap sigue siendo válido aunque
+            # la caché lo descarte
+            store = GenotypeStore(tmp)
+        except BaseException:
+            os.remove(tmp)
+            raise
+        genotype_cache.put(ruta, tmp)
+    return store
+
+
+@asynccontextmanager
+async def abierto(archivo_vcf: str) -> AsyncIterator[GenotypeStore]:
+    """
+    Almacén de genotipos del VCF `archivo_vcf`, abierto con mmap. Solo es
+    válido dentro del `async with` (después se puede cerrar).
+    """
+    ruta = ruta_genotipos(archivo_vcf)
+    entrada = _abiertos.get(ruta)
+    if entrada is None:
+        entrada = _Abierto(await _abrir(ruta, archivo_vcf))
+        _abiertos.set(ruta, entrada)
+    entrada.usos += 1
+    try:
+        yield entrada.store
+    finally:
+        entrada.soltar()
+
+
+def stats() -> dict:
+    return {**genotype_cache.stats(), "abiertos": _abiertos.stats()["size"]}
@@ -0,0 +1,161 @@
+"""
+Pipeline de trabajos en segundo plano.
+
+Los endpoints registran un trabajo con una lista de etapas y devuelven su id
+al momento; un pool de workers con concurrencia acotada ejecuta las etapas en
+orden y va dejando el progreso de cada una para el endpoint de estado.
+
+Cola y estado viven en la memoria del proceso: el despliegue es de un solo
+proceso de API (ver Dockerfile). Los ids llevan un prefijo de la instancia
+que los creó, para distinguir un trabajo caducado de uno que se perdió en un
+reinicio o que atendió otro proceso (`es_local`).
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+from uuid import uuid4
+
+from app.core.config import settings
+from app.core.logging import request_id_var, upstream_breakdown, upstream_context
+
+logger = logging.getLogger(__name__)
+
+PENDIENTE = "pendiente"
+EN_PROCESO = "en_proceso"
+COMPLETADO = "completado"
+ERROR = "error"
+
+Stage = tuple[str, Callable[[dict], Awaitable[None]]]
+
+_jobs: dict[str, dict] = {}
+_queue: Optional[asyncio.Queue] = None
+_workers: list[asyncio.Task] = []
+_INSTANCIA = uuid4().hex[:8]
+
+
+def _now() -> str:
+    return datetime.utcnow().isoformat()
+
+
+def es_local(job_id: str) -> bool:
+    """Si `job_id` lo creó este proceso (aunque ya se haya olvidado)."""
+    return job_id.startswith(f"{_INSTANCIA}-")
+
+
+def _prune() -> None:
+    # Olvida los trabajos terminados hace más de JOB_RETENTION_SECONDS
+    limite = time.time() - settings.JOB_RETENTION_SECONDS
+    for job_id in [j for j, job in _jobs.items() if job["_terminado"] and job["_terminado"] < limite]:
+        del _jobs[job_id]
+
+
+async def start():
+    """Arranca JOB_WORKERS workers sobre la cola (lifespan de la app)."""
+    global _queue
+    if _queue is not None:
+        return
+    _queue = asyncio.Queue()
+    for n in range(settings.JOB_WORKERS):
+        _workers.append(asyncio.create_task(_worker(), name=f"job-worker-{n}"))
+
+
+async def stop():
+    global _queue
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    _queue = None
+
+
+async def _worker():
+    while True:
+        job, stages, context, on_finish = await _queue.get()
+        # Los logs y spans del trabajo llevan el request id de la subida
+        token = request_id_var.set(job["_request_id"])
+        try:
+            with upstream_context():
+                await _run(job, stages, context, on_finish)
+                logger.info("job %s %s", job["tipo"], job["status"], extra={
+                    "job_id": job["id"],
+                    "job_status": job["status"],
+                    "etapas_ms": {e["nombre"]: e["duracion_ms"] for e in job["etapas"]},
+                    "upstream_ms": upstream_breakdown(),
+                })
+        finally:
+            request_id_var.reset(token)
+            _queue.task_done()
+
+
+def submit(tipo: str, stages: list[Stage], context: dict, owner_id: str,
+           on_finish: Optional[Callable[[dict], Awaitable[None]]] = None) -> dict:
+    """
+    Registra un trabajo y lo encola. `context` se pasa a cada etapa, que puede
+    leerlo y ampliarlo para las siguientes. `on_finish` se ejecuta siempre al
+    terminar (limpieza de temporales, etc.).
+    """
+    if _queue is None:
+        raise RuntimeError("Pool de trabajos no inicializado (lifespan de la app)")
+    job_id = f"{_INSTANCIA}-{uuid4()}"
+    job = {
+        "id": job_id,
+        "tipo": tipo,
+        "status": PENDIENTE,
+        "owner_id": owner_id,
+        "created_at": _now(),
+        "etapas": [{"nombre": name, "status": PENDIENTE, "inicio": None, "fin": None,
+                    "duracion_ms": None, "error": None}
+                   for name, _ in stages],
+        "resultado": None,
+        "error": None,
+        "_terminado": None,
+        "_request_id": request_id_var.get(),
+    }
+    _prune()
+    _jobs[job_id] = job
+    _queue.put_nowait((job, stages, context, on_finish))
+    return get_job(job_id)
+
+
+async def _run(job: dict, stages: list[Stage], context: dict, on_finish) -> None:
+    job["status"] = EN_PROCESO
+    try:
+        for etapa, (_, fn) in zip(job["etapas"], stages):
+            etapa["status"] = EN_PROCESO
+            etapa["inicio"] = _now()
+            inicio = time.perf_counter()
+            try:
+                await fn(context)
+            except Exception as e:
+                etapa["status"] = ERROR
+                etapa["error"] = str(e)
+                etapa["fin"] = _now()
+                etapa["duracion_ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+                job["status"] = ERROR
+                return
+            etapa["status"] = COMPLETADO
+            etapa["fin"] = _now()
+            etapa["duracion_ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+        job["status"] = COMPLETADO
+        job["resultado"] = context.get("resultado")
+    finally:
+        job["_terminado"] = time.time()
+        if on_finish:
+            try:
+                await on_finish(context)
+            except Exception as e:
+                # Un fallo al cerrar (p. ej. limpiar o reabrir la sesión) no se da por bueno
+                logger.exception("on_finish del job %s falló", job["id"], extra={"job_id": job["id"]})
+                job["status"] = ERROR
+                job["error"] = f"Error al finalizar: {e}"
+
+
+def get_job(job_id: str) -> Optional[dict]:
+    job = _jobs.get(job_id)
+    if not job:
+        return None
+    out = {k: v for k, v in job.items() if not k.startswith("_")}
+    out["etapas"] = [dict(e) for e in job["etapas"]]
+    return out
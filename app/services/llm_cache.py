@@ -0,0 +1,146 @@
+"""
+Caché persistente (SQLite local) de respuestas del LLM.
+
+La clave es un hash de modelo + parámetros + prompt normalizado + hash del
+contenido de entrada, así que el mismo VCF o la misma pregunta sobre el
+mismo paciente no vuelve a llamar a OpenAI mientras la entrada no caduque.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from app.core.config import settings
+
+_WS = re.compile(r"\s+")
+
+
+def normalize_prompt(text: str) -> str:
+    return _WS.sub(" ", text).strip().casefold()
+
+
+def cache_key(model: str, system: str, prompt: str, params: dict, content_hash: Optional[str] = None) -> str:
+    payload = json.dumps({
+        "model": model,
+        "system": normalize_prompt(system),
+        "prompt": normalize_prompt(prompt),
+        "params": params,
+        "content": content_hash,
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    def __init__(self, path: str, ttl: float, max_entries: int, max_bytes: int):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                " key TEXT PRIMARY KEY, model TEXT, value TEXT NOT NULL,"
+                " size INTEGER NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed_at)")
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None or row[1] < now - self.ttl:
+                if row is not None:
+                    db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                    db.commit()
+                self.misses += 1
+                return None
+            db.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            db.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, key: str, model: str, value: str) -> None:
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, model, value, size, created_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, value, len(value.encode("utf-8")), now, now),
+            )
+            self._evict(db, now)
+            db.commit()
+
+    def _evict(self, db: sqlite3.Connection, now: float) -> None:
+        db.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl,))
+        count, size = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        # LRU: se borran las menos usadas hasta volver a los límites
+        while count > self.max_entries or size > self.max_bytes:
+            batch = max(count - self.max_entries, 1)
+            rows = db.execute(
+                "SELECT key, size FROM llm_cache ORDER BY accessed_at LIMIT ?", (batch,)
+            ).fetchall()
+            if not rows:
+                break
+            db.executemany("DELETE FROM llm_cache WHERE key = ?", [(k,) for k, _ in rows])
+            count -= len(rows)
+            size -= sum(s for _, s in rows)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db().execute("DELETE FROM llm_cache")
+            self._db().commit()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    async def aget(self, key: str) -> Optional[str]:
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, model: str, value: str) -> None:
+        await asyncio.to_thread(self.set, key, model, value)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        with self._lock:
+            entries, size = self._db().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache"
+            ).fetchone()
+        return {
+            "entries": entries,
+            "bytes": size,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+llm_cache = LLMCache(
+    path=settings.LLM_CACHE_PATH,
+    ttl=settings.LLM_CACHE_TTL_SECONDS,
+    max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+    max_bytes=settings.LLM_CACHE_MAX_BYTES,
+)
@@ -0,0 +1,112 @@
+"""
+Acceso a OpenAI con un cliente async compartido (pool httpx con keep-alive).
+
+El cliente (y el paquete `openai`, que tarda en importarse) se crea en la
+primera llamada, no al arrancar; el lifespan de la app lo cierra.
+"""
+from typing import TYPE_CHECKING, AsyncIterator
+
+import httpx
+
+from app.core.config import settings
+from app.db.supabase import pooled_transport
+from app.services.llm_cache import llm_cache, cache_key
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+_client: "AsyncOpenAI | None" = None
+
+
+async def close():
+    global _client
+    if _client is not None:
+        await _client.close()
+    _client = None
+    llm_cache.close()
+
+
+def client() -> "AsyncOpenAI":
+    global _client
+    if _client is None:
+        from openai import AsyncOpenAI
+
+        _client = AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            http_client=httpx.AsyncClient(
+                timeout=settings.OPENAI_TIMEOUT,
+                transport=pooled_transport("openai"),
+            ),
+        )
+    return _client
+
+
+async def chat_completion(model: str, system: str, prompt: str, max_tokens: int,
+                          temperature: float | None = None, cache: bool = False,
+                          content_hash: str | None = None) -> str:
+    """
+    Completion de un solo turno. Con `cache=True` la respuesta se guarda en la
+    caché persistente (clave: modelo, parámetros, prompt normalizado y
+    `content_hash` del contenido de entrada, si lo hay).
+    """
+    kwargs = {"temperature": temperature} if temperature is not None else {}
+    use_cache = cache and settings.LLM_CACHE_ENABLED
+    if use_cache:
+        key = cache_key(model, system, prompt, {"max_tokens": max_tokens, **kwargs}, content_hash)
+        cached = await llm_cache.aget(key)
+        if cached is not None:
+            return cached
+    respuesta = await _create(model, system, prompt, max_tokens, **kwargs)
+    if use_cache:
+        await llm_cache.aset(key, model, respuesta)
+    return respuesta
+
+
+async def stream_completion(model: str, system: str, prompt: str, max_tokens: int,
+                            temperature: float | None = None, cache: bool = False,
+                            content_hash: str | None = None) -> AsyncIterator[str]:
+    """
+    Igual que `chat_completion` pero va devolviendo los tokens según los
+    genera el modelo. Un acierto de caché se devuelve en un único fragmento.
+    """
+    kwargs = {"temperature": temperature} if temperature is not None else {}
+    use_cache = cache and settings.LLM_CACHE_ENABLED
+    if use_cache:
+        key = cache_key(model, system, prompt, {"max_tokens": max_tokens, **kwargs}, content_hash)
+        cached = await llm_cache.aget(key)
+        if cached is not None:
+            yield cached
+            return
+    stream = await client().chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": system},
+            {"role": "user", "content": prompt}
+        ],
+        max_tokens=max_tokens,
+        stream=True,
+        **kwargs,
+    )
+    partes = []
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            partes.append(delta)
+            yield delta
+    if use_cache:
+        await llm_cache.aset(key, model, "".join(partes).strip())
+
+
+async def _create(model: str, system: str, prompt: str, max_tokens: int, **kwargs) -> str:
+    response = await client().chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": system},
+            {"role": "user", "content": prompt}
+        ],
+        max_tokens=max_tokens,
+        **kwargs,
+    )
+    return response.choices[0].message.content.strip()
@@ -0,0 +1,101 @@
+"""
+Contexto compacto del paciente para los prompts de chat.
+
+En vez de volcar filas completas (`password_hash`, UUIDs, timestamps, informes
+enteros) se construye un resumen por paciente: datos básicos, fenotipos de la
+última evaluación, variantes clave del último VCF y el inicio del último
+informe. Se cachea por paciente y se invalida cuando cambian sus datos; al
+usarlo se ajusta a un presupuesto exacto de tokens.
+"""
+import asyncio
+import json
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.db.supabase import supabase
+from app.services import genetics_service, recomendaciones_service
+from app.utils.tokens import fit_sections
+
+_CAMPOS_USUARIO = ("nombre", "apellidos")
+_MAX_VARIANTES = 40
+# Detalle por gen de la evaluación: en el contexto basta con `fenotipos`
+_CAMPOS_OMITIDOS = ("farmacogenes",)
+
+_contextos = TTLCache(maxsize=settings.PATIENT_CONTEXT_CACHE_SIZE, ttl=settings.PATIENT_CONTEXT_TTL_SECONDS)
+
+
+def invalidate(paciente_id: str):
+    """Llamar tras escribir perfiles, evaluaciones o informes del paciente."""
+    _contextos.invalidate(str(paciente_id))
+
+
+def _valor(value) -> str:
+    if isinstance(value, list):
+        return ", ".join(str(v) for v in value) or "-"
+    if isinstance(value, dict):
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+    return str(value)
+
+
+async def _variantes(perfil: dict | None) -> list[str]:
+    if not perfil or not perfil.get("archivo_vcf"):
+        return []
+    try:
+        # `muestra`: columna del paciente si el VCF es de una cohorte
+        resumen = await genetics_service.resumen_archivo_vcf(perfil["archivo_vcf"], _MAX_VARIANTES, perfil.get("muestra"))
+    except Exception:
+        return ["(perfil genético no disponible temporalmente)"]
+    return [f"Variantes no referencia: {resumen['variantes']}"] + resumen["muestra"]
+
+
+async def _build_sections(paciente_id: str) -> list[str]:
+    usuario, evaluacion, perfil, informe = await asyncio.gather(
+        supabase.table("users").select("*").eq("id", paciente_id).limit(1).execute(),
+        supabase.table("evaluaciones_ia").select("resultado_json")
+            .eq("user_id", paciente_id).order("fecha_evaluacion", desc=True).limit(1).execute(),
+        supabase.table("genetic_profiles").select("archivo_vcf,muestra")
+            .eq("user_id", paciente_id).order("fecha_subida", desc=True).limit(1).execute(),
+        supabase.table("informes").select("contenido")
+            .eq("user_id", paciente_id).not_.is_("contenido", "null")
+            .order("fecha_generado", desc=True).limit(1).execute(),
+    )
+
+    sections = []
+    if usuario.data:
+        datos = [f"{k}: {usuario.data[0][k]}" for k in _CAMPOS_USUARIO if usuario.data[0].get(k)]
+        if datos:
+            sections.append("## Paciente\n" + "\n".join(datos))
+
+    if evaluacion.data and evaluacion.data[0].get("resultado_json"):
+        lineas = [f"- {k}: {_valor(v)}" for k, v in evaluacion.data[0]["resultado_json"].items()
+                  if k not in _CAMPOS_OMITIDOS]
+        sections.append("## Fenotipos y evaluación farmacogenómica\n" + "\n".join(lineas))
+        # Recomendaciones de la base local: el LLM no tiene que recordar las guías
+        fenotipos = recomendaciones_service.fenotipos_de(evaluacion.data[0]["resultado_json"])
+        recomendaciones = [
+            f"- {r['farmaco']} ({r['gen']}, {r['fenotipo']}): {r['recomendacion']} [{r['guia']}]"
+            for r in recomendaciones_service.indice().por_fenotipos(fenotipos) if r["accion"] != "dosis_estandar"
+        ]
+        if recomendaciones:
+            sections.append("## Recomendaciones farmacogenómicas (CPIC)\n" + "\n".join(recomendaciones))
+
+    variantes = await _variantes(perfil.data[0] if perfil.data else None)
+    sections.append("## Variantes clave\n" + ("\n".join(variantes) if variantes else "Sin perfil genético disponible."))
+
+    if informe.data and informe.data[0].get("contenido"):
+        sections.append("## Último informe (extracto)\n" + informe.data[0]["contenido"].strip())
+    return sections
+
+
+async def get_patient_context(paciente_id: str, budget: int, model: str) -> str:
+    """Contexto del paciente en como mucho `budget` tokens del `model`."""
+    key = str(paciente_id)
+    sections = _contextos.get(key)
+    if sections is None:
+        sections = await _build_sections(key)
+        _contextos.set(key, sections)
+    return fit_sections(sections, budget, model)
+
+
+def stats() -> dict:
+    return _contextos.stats()
@@ -0,0 +1,184 @@
+"""
+Renderizado de informes PDF en memoria.
+
+Los PDFs se generan en un pool de procesos (el maquetado con fpdf2 es CPU
+puro y bloquearía el event loop o el threadpool) y se devuelven como bytes,
+sin pasar por disco. Cada worker carga el logo (`PDF_LOGO_PATH`) una sola vez
+al arrancar; las plantillas de maquetación se registran con `@template`.
+
+Se usan las fuentes estándar de PDF (Helvetica): no hay que cargarlas ni
+incrustarlas. fpdf2 hace el subset de las fuentes TTF sobre el propio objeto,
+así que una fuente TTF no se puede compartir entre documentos.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import TYPE_CHECKING, Callable
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.core.logging import span
+
+if TYPE_CHECKING:
+    from fpdf import FPDF
+
+logger = logging.getLogger(__name__)
+
+FONT = "Helvetica"
+
+# Caracteres habituales en textos del LLM que no existen en latin-1
+_SUSTITUCIONES = str.maketrans({
+    "‘": "'", "’": "'", "“": '"', "”": '"',
+    "–": "-", "—": "-", "…": "...", "•": "-",
+    "≤": "<=", "≥": ">=",
+})
+
+_TEMPLATES: dict[str, Callable[["FPDF", dict], None]] = {}
+_pool: ProcessPoolExecutor | None = None
+
+# Estado de cada proceso worker
+_logo = None
+
+
+def template(name: str):
+    """Registra una plantilla de maquetación: `fn(pdf, data)`."""
+    def decorator(fn):
+        _TEMPLATES[name] = fn
+        return fn
+    return decorator
+
+
+def _texto(value) -> str:
+    return str(value).translate(_SUSTITUCIONES).encode("latin-1", "replace").decode("latin-1")
+
+
+def _init_worker(logo_path: str | None):
+    global _logo
+    if not logo_path or not os.path.exists(logo_path):
+        return
+    try:
+        from PIL import Image
+        with Image.open(logo_path) as img:
+            img.load()
+            _logo = img.copy()
+    except Exception as e:
+        logger.warning("No se pudo cargar el logo %s: %s", logo_path, e)
+
+
+def _cabecera(pdf: "FPDF", titulo: str):
+    if _logo is not None:
+        pdf.image(_logo, x=10, y=8, h=14)
+        pdf.ln(12)
+    pdf.set_font(FONT, "B", 16)
+    pdf.cell(0, 10, _texto(titulo), 0, 1, "C")
+
+
+def _pie(pdf: "FPDF"):
+    pdf.ln(10)
+    pdf.set_font(FONT, "I", 10)
+    pdf.cell(0, 10, "Este informe es confidencial y generado automáticamente.", 0, 1)
+
+
+@template("informe_ia")
+def _layout_informe_ia(pdf: "FPDF", data: dict):
+    _cabecera(pdf, "INFORME GENÉTICO (IA)")
+    pdf.set_font(FONT, size=12)
+    pdf.multi_cell(0, 10, _texto(data["texto"]), new_x="LMARGIN", new_y="NEXT")
+    _pie(pdf)
+
+
+@template("evaluacion")
+def _layout_evaluacion(pdf: "FPDF", data: dict):
+    paciente, medico = data["paciente"], data["medico"]
+    _cabecera(pdf, "INFORME GENÉTICO PERSONALIZADO")
+
+    pdf.set_font(FONT, "", 12)
+    pdf.cell(0, 10, _texto(f"Paciente: {paciente['nombre']}  |  Email: {paciente['email']}"), 0, 1)
+    pdf.cell(0, 10, f"Fecha: {data['fecha']}", 0, 1)
+    pdf.cell(0, 10, _texto(f"Elaborado por: Dr/a. {medico['nombre']} ({medico['email']})"), 0, 1)
+
+    pdf.ln(10)
+    pdf.set_font(FONT, "B", 14)
+    pdf.cell(0, 10, "Resultados IA:", 0, 1)
+
+    pdf.set_font(FONT, "", 12)
+    resultado = dict(data.get("resultado") or {})
+    # `farmacogenes` es el detalle interno del genotipado: solo se usa para
+    # escribir una línea por gen en lugar de `fenotipos`
+    farmacogenes = resultado.pop("farmacogenes", None) or {}
+    fenotipos = resultado.pop("fenotipos", None) or {}
+    if farmacogenes or fenotipos:
+        pdf.multi_cell(0, 10, "Farmacogenes:", new_x="LMARGIN", new_y="NEXT")
+        for linea in _lineas_farmacogenes(farmacogenes, fenotipos):
+            pdf.multi_cell(0, 8, _texto(f"   {linea}"), new_x="LMARGIN", new_y="NEXT")
+    for key, value in resultado.items():
+        if isinstance(value, list):
+            value = ", ".join(str(v) for v in value)
+        elif isinstance(value, dict):
+            value = ", ".join(f"{k}: {v}" for k, v in value.items())
+        pdf.multi_cell(0, 10, _texto(f"{key}: {value}"), new_x="LMARGIN", new_y="NEXT")
+    _pie(pdf)
+
+
+def _lineas_farmacogenes(farmacogenes: dict, fenotipos) -> list[str]:
+    """`CYP2D6: *1/*4 - Metabolizador intermedio`, una por gen."""
+    if farmacogenes:
+        return [
+            f"{gen}: {r['diplotipo']} - {r['fenotipo']}" if r.get("diplotipo") else f"{gen}: {r.get('fenotipo')}"
+            for gen, r in farmacogenes.items()
+        ]
+    # Evaluaciones anteriores al genotipado: `fenotipos` ya es `{gen: texto}` (o texto libre)
+    if isinstance(fenotipos, dict):
+        return [f"{gen}: {valor}" for gen, valor in fenotipos.items()]
+    return [str(fenotipos)]
+
+
+def render_sync(name: str, data: dict) -> bytes:
+    """Maqueta `data` con la plantilla `name` y devuelve el PDF en bytes."""
+    try:
+        layout = _TEMPLATES[name]
+    except KeyError:
+        raise ValueError(f"Plantilla PDF desconocida: {name}")
+    from fpdf import FPDF  # solo en quien renderiza (workers del pool)
+
+    pdf = FPDF()
+    pdf.add_page()
+    data = {"fecha": datetime.now().strftime("%Y-%m-%d %H:%M"), **data}
+    layout(pdf, data)
+    return bytes(pdf.output())
+
+
+def start():
+    """Arranca el pool de procesos (lifespan). Con `PDF_WORKERS=0` se renderiza en el threadpool."""
+    global _pool
+    if _pool is not None:
+        return
+    if settings.PDF_WORKERS <= 0:
+        _init_worker(settings.PDF_LOGO_PATH)
+    else:
+        # Los procesos se lanzan con el primer envío, no al arrancar
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.PDF_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(settings.PDF_LOGO_PATH,),
+        )
+
+
+def stop():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+    _pool = None
+
+
+async def render(name: str, data: dict) -> bytes:
+    with span("pdf", name):
+        if _pool is None:
+            return await run_in_threadpool(render_sync, name, data)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_pool, render_sync, name, data)
@@ -0,0 +1,107 @@
+"""
+Índice en memoria de las asignaciones médico–paciente.
+
+Centraliza la comprobación de `medicos_pacientes` (solo relaciones con
+status "activo") para que los endpoints clínicos no tengan que consultar
+Supabase en cada petición.
+"""
+import asyncio
+import time
+from collections import defaultdict
+
+from app.core.config import settings
+from app.db.supabase import supabase
+
+ACTIVO = "activo"
+_PAGE_SIZE = 1000  # límite de filas por respuesta de PostgREST
+
+
+class AssignmentIndex:
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._por_medico: dict[str, set[str]] = defaultdict(set)
+        self._por_paciente: dict[str, set[str]] = defaultdict(set)
+        self._cargado_en = 0.0
+        self._warm_lock = asyncio.Lock()
+
+    async def warm(self):
+        """Carga todas las asignaciones activas (recarga completa)."""
+        por_medico: dict[str, set[str]] = defaultdict(set)
+        por_paciente: dict[str, set[str]] = defaultdict(set)
+        # Orden estable entre páginas: sin él, PostgREST puede saltarse o repetir filas
+        start = 0
+        while True:
+            res = await supabase.table("medicos_pacientes") \
+                .select("medico_id, paciente_id") \
+                .eq("status", ACTIVO) \
+                .order("id") \
+                .range(start, start + _PAGE_SIZE - 1) \
+                .execute()
+            rows = res.data or []
+            for r in rows:
+                por_medico[str(r["medico_id"])].add(str(r["paciente_id"]))
+                por_paciente[str(r["paciente_id"])].add(str(r["medico_id"]))
+            if len(rows) < _PAGE_SIZE:
+                break
+            start += _PAGE_SIZE
+        self._por_medico = por_medico
+        self._por_paciente = por_paciente
+        self._cargado_en = time.monotonic()
+
+    def _stale(self) -> bool:
+        return not self._cargado_en or time.monotonic() - self._cargado_en > self.ttl
+
+    async def _ensure(self):
+        if self._stale():
+            # Una sola recarga aunque lleguen muchas peticiones a la vez
+            async with self._warm_lock:
+                if self._stale():
+                    await self.warm()
+
+    def add(self, medico_id: str, paciente_id: str):
+        self._por_medico[str(medico_id)].add(str(paciente_id))
+        self._por_paciente[str(paciente_id)].add(str(medico_id))
+
+    def remove(self, medico_id: str, paciente_id: str):
+        self._por_medico.get(str(medico_id), set()).discard(str(paciente_id))
+        self._por_paciente.get(str(paciente_id), set()).discard(str(medico_id))
+
+    async def invalidate(self, medico_id: str, paciente_id: str):
+        """Vuelve a leer una sola pareja tras escribirla en `medicos_pacientes`."""
+        res = await supabase.table("medicos_pacientes") \
+            .select("id") \
+            .eq("medico_id", medico_id) \
+            .eq("paciente_id", paciente_id) \
+            .eq("status", ACTIVO) \
+            .execute()
+        if res.data:
+            self.add(medico_id, paciente_id)
+        else:
+            self.remove(medico_id, paciente_id)
+
+    async def pacientes_de(self, medico_id: str) -> set[str]:
+        await self._ensure()
+        return set(self._por_medico.get(str(medico_id), ()))
+
+    async def medicos_de(self, paciente_id: str) -> set[str]:
+        await self._ensure()
+        return set(self._por_paciente.get(str(paciente_id), ()))
+
+    async def tiene_paciente(self, medico_id: str, paciente_id: str) -> bool:
+        await self._ensure()
+        return str(paciente_id) in self._por_medico.get(str(medico_id), ())
+
+
+index = AssignmentIndex(ttl=settings.RBAC_INDEX_TTL_SECONDS)
+
+
+async def can_access(user: dict, patient_id: str, allow_self: bool = True) -> bool:
+    """Admin, el propio paciente (si `allow_self`) o un médico asignado activo."""
+    rol = user.get("rol")
+    if rol == "admin":
+        return True
+    if allow_self and str(user["id"]).strip() == str(patient_id).strip():
+        return True
+    if rol == "medico":
+        return await index.tiene_paciente(user["id"], patient_id)
+    return False
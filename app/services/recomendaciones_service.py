@@ -0,0 +1,113 @@
+"""
+Base de conocimiento fármaco–gen–fenotipo (recomendaciones CPIC).
+
+La tabla versionada está en `app/assets/recomendaciones_pgx.json`. Se carga
+una vez al arrancar en índices hash por (gen, fenotipo), por fármaco y por
+(fármaco, gen, fenotipo): las recomendaciones de un paciente o de un
+fármaco salen de búsquedas en diccionarios, sin consultas ni LLM.
+"""
+import json
+import os
+import unicodedata
+from collections import defaultdict
+from typing import Optional
+
+from fastapi import HTTPException
+
+from app.db.supabase import supabase
+
+RUTA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "assets", "recomendaciones_pgx.json")
+
+EVITAR = "evitar"
+
+
+def normalizar(farmaco: str) -> str:
+    """Nombre de fármaco sin tildes ni mayúsculas: `Fenitoína` -> `fenitoina`."""
+    sin_tildes = unicodedata.normalize("NFKD", farmaco).encode("ascii", "ignore").decode()
+    return " ".join(sin_tildes.lower().split())
+
+
+class Indice:
+    def __init__(self, data: dict):
+        self.version: str = data["version"]
+        self.fuente: str = data.get("fuente", "")
+        self.recomendaciones: list[dict] = data["recomendaciones"]
+        self._por_fenotipo: dict[tuple, list[dict]] = defaultdict(list)
+        self._por_farmaco: dict[str, list[dict]] = defaultdict(list)
+        self._por_farmaco_fenotipo: dict[tuple, list[dict]] = defaultdict(list)
+        for r in self.recomendaciones:
+            farmaco = normalizar(r["farmaco"])
+            self._por_fenotipo[(r["gen"], r["fenotipo"])].append(r)
+            self._por_farmaco[farmaco].append(r)
+            self._por_farmaco_fenotipo[(farmaco, r["gen"], r["fenotipo"])].append(r)
+        # Genes que afectan a cada fármaco (para cruzarlo con los fenotipos)
+        self._genes_farmaco = {f: list(dict.fromkeys(r["gen"] for r in recs)) for f, recs in self._por_farmaco.items()}
+
+    @property
+    def farmacos(self) -> list[str]:
+        return sorted({r["farmaco"] for r in self.recomendaciones})
+
+    def por_fenotipos(self, fenotipos: dict[str, str]) -> list[dict]:
+        """Todas las recomendaciones que aplican a `{gen: fenotipo}`."""
+        return [r for gen, fenotipo in fenotipos.items() for r in self._por_fenotipo.get((gen, fenotipo), ())]
+
+    def por_farmaco(self, farmaco: str, fenotipos: Optional[dict[str, str]] = None) -> list[dict]:
+        """Recomendaciones del fármaco; con `fenotipos`, solo las que aplican."""
+        farmaco = normalizar(farmaco)
+        if fenotipos is None:
+            return list(self._por_farmaco.get(farmaco, ()))
+        return [
+            r for gen in self._genes_farmaco.get(farmaco, ()) if gen in fenotipos
+            for r in self._por_farmaco_fenotipo.get((farmaco, gen, fenotipos[gen]), ())
+        ]
+
+    def no_recomendados(self, fenotipos: dict[str, str]) -> list[str]:
+        return list(dict.fromkeys(r["farmaco"] for r in self.por_fenotipos(fenotipos) if r["accion"] == EVITAR))
+
+
+_indice: Optional[Indice] = None
+
+
+def cargar(ruta: str = RUTA) -> Indice:
+    global _indice
+    with open(ruta, encoding="utf-8") as f:
+        _indice = Indice(json.load(f))
+    return _indice
+
+
+def indice() -> Indice:
+    return _indice or cargar()
+
+
+def fenotipos_de(resultado_json: Optional[dict]) -> dict[str, str]:
+    """`{gen: fenotipo}` de una evaluación (solo genes con fenotipo determinado)."""
+    farmacogenes = (resultado_json or {}).get("farmacogenes") or {}
+    return {gen: r["fenotipo"] for gen, r in farmacogenes.items() if r.get("diplotipo") and r.get("fenotipo")}
+
+
+async def fenotipos_paciente(paciente_id: str) -> dict[str, str]:
+    res = await supabase.table("evaluaciones_ia").select("resultado_json") \
+        .eq("user_id", paciente_id).order("fecha_evaluacion", desc=True).limit(1).execute()
+    return fenotipos_de(res.data[0]["resultado_json"] if res.data else None)
+
+
+async def recomendaciones_paciente(paciente_id: str) -> dict:
+    fenotipos = await fenotipos_paciente(paciente_id)
+    kb = indice()
+    return {
+        "version": kb.version,
+        "fenotipos": fenotipos,
+        "recomendaciones": kb.por_fenotipos(fenotipos),
+    }
+
+
+async def recomendaciones_farmaco(farmaco: str, paciente_id: Optional[str] = None) -> dict:
+    kb = indice()
+    if not kb.por_farmaco(farmaco):
+        raise HTTPException(status_code=404, detail="Fármaco sin recomendaciones farmacogenómicas")
+    fenotipos = await fenotipos_paciente(paciente_id) if paciente_id else None
+    return {
+        "version": kb.version,
+        "fenotipos": fenotipos or {},
+        "recomendaciones": kb.por_farmaco(farmaco, fenotipos),
+    }
@@ -0,0 +1,165 @@
+"""
+Descarga de los PDFs de informes.
+
+El PDF se transmite por bloques desde Storage al cliente (sin cargarlo en
+memoria), con soporte de `Range` y de `ETag` / `If-None-Match`. Las
+descargas completas se guardan en una caché LRU en disco, así que volver a
+abrir el mismo informe no toca Storage. Opcionalmente se redirige a una URL
+firmada de corta duración y el cliente descarga directamente de Storage.
+
+Las rutas de los PDFs llevan un uuid nuevo en cada generación y nunca se
+sobrescriben: la ruta identifica el contenido y sirve como ETag.
+"""
+import hashlib
+import os
+from typing import Optional
+
+from fastapi import HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import RedirectResponse, StreamingResponse
+
+from app.core.cache import DiskLRUCache
+from app.core.config import settings
+from app.db.supabase import supabase
+
+BUCKET = "reportes"
+CHUNK_SIZE = 64 * 1024
+
+report_cache = DiskLRUCache(settings.REPORT_CACHE_DIR, settings.REPORT_CACHE_MAX_BYTES)
+
+
+def etag_for(ruta: str) -> str:
+    return '"' + hashlib.sha256(ruta.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(t.strip().removeprefix("W/") == etag for t in if_none_match.split(","))
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[tuple[int, int]]:
+    """
+    Rango (inicio, fin), ambos incluidos, de una cabecera `Range` de un solo
+    rango. Devuelve None si no hay rango servible (sin cabecera, otra unidad o
+    varios rangos): se responde el archivo completo.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_s, _, end_s = header[len("bytes="):].strip().partition("-")
+    try:
+        if start_s:
+            start = int(start_s)
+            end = min(int(end_s), size - 1) if end_s else size - 1
+        elif end_s:
+            start, end = max(size - int(end_s), 0), size - 1
+        else:
+            return None
+    except ValueError:
+        return None
+    if start > end or start >= size:
+        raise HTTPException(status_code=416, detail="Rango no satisfacible",
+                            headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+
+def _iter_file(path: str, start: int, end: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _from_cache(path: str, size: int, range_header: Optional[str], headers: dict) -> Response:
+    rango = parse_range(range_header, size)
+    if rango is None:
+        return StreamingResponse(_iter_file(path, 0, size - 1), media_type="application/pdf",
+                                 headers={**headers, "Content-Length": str(size)})
+    start, end = rango
+    return StreamingResponse(_iter_file(path, start, end), status_code=206, media_type="application/pdf",
+                             headers={**headers,
+                                      "Content-Range": f"bytes {start}-{end}/{size}",
+                                      "Content-Length": str(end - start + 1)})
+
+
+async def _relay(upstream, cache_key: Optional[str]):
+    # Reenvía los bloques de Storage y, si es una descarga completa, los va
+    # escribiendo en la caché; solo se publica si el cuerpo llegó entero.
+    tmp = report_cache.temp_path() if cache_key else None
+    f = open(tmp, "wb") if tmp else None
+    completo = False
+    try:
+        async for chunk in upstream.aiter_bytes(CHUNK_SIZE):
+            if f:
+                await run_in_threadpool(f.write, chunk)
+            yield chunk
+        completo = True
+    finally:
+        await upstream.aclose()
+        if f:
+            f.close()
+            try:
+                if completo:
+                    report_cache.put(cache_key, tmp)
+                else:
+                    os.remove(tmp)
+            except OSError:
+                pass
+
+
+async def _from_storage(ruta: str, cache_key: str, range_header: Optional[str], headers: dict) -> Response:
+    upstream = await supabase.open_object(BUCKET, ruta, {"Range": range_header} if range_header else None)
+    if upstream.status_code == 416:
+        await upstream.aclose()
+        raise HTTPException(status_code=416, detail="Rango no satisfacible",
+                            headers={"Content-Range": upstream.headers.get("content-range", "bytes */*")})
+    if upstream.status_code >= 400:
+        await upstream.aclose()
+        raise HTTPException(status_code=404, detail=f"No se pudo descargar: Storage respondió {upstream.status_code}")
+
+    out = dict(headers)
+    if "content-encoding" not in upstream.headers:
+        for name in ("content-length", "content-range"):
+            if name in upstream.headers:
+                out[name] = upstream.headers[name]
+    completo = upstream.status_code == 200
+    return StreamingResponse(_relay(upstream, cache_key if completo else None),
+                             status_code=upstream.status_code, media_type="application/pdf", headers=out)
+
+
+async def _signed_redirect(ruta: str, filename: str) -> Response:
+    try:
+        data = await supabase.storage.from_(BUCKET).create_signed_url(
+            ruta, settings.REPORT_SIGNED_URL_TTL_SECONDS, {"download": filename}
+        )
+    except Exception as e:
+        raise HTTPException(status_code=404, detail=f"No se pudo firmar la URL: {str(e)}")
+    return RedirectResponse(data["signedURL"], status_code=307, headers={"Cache-Control": "no-store"})
+
+
+async def report_download_response(ruta: str, request: Request, redirect: bool = False) -> Response:
+    filename = os.path.basename(ruta)
+    etag = etag_for(ruta)
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, max-age=3600",
+        "Content-Disposition": f'attachment; filename="{filename}"',
+    }
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": headers["Cache-Control"]})
+    if redirect:
+        return await _signed_redirect(ruta, filename)
+
+    cache_key = f"{BUCKET}/{ruta}"
+    cached = report_cache.get(cache_key)
+    if cached:
+        return _from_cache(*cached, request.headers.get("range"), headers)
+    return await _from_storage(ruta, cache_key, request.headers.get("range"), headers)
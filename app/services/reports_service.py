@@ -1,56 +1,126 @@
-from fpdf import FPDF
+import asyncio
+from fastapi import HTTPException
+from app.core.config import settings
 from app.db.supabase import supabase
+from app.services import pdf_renderer
+from app.services.rbac import can_access
 from datetime import datetime
-from uuid import uuid4
-
-def generate_report_pdf(paciente_id, evaluacion_id, medico):
-    # 1. Traer datos del paciente
-    paciente = supabase.table("users").select("*").eq("id", paciente_id).single().execute().data
-    if not paciente:
-        raise Exception("Paciente no encontrado")
-
-    # 2. Traer la evaluación
-    evaluacion = supabase.table("evaluaciones_ia").select("*").eq("id", evaluacion_id).single().execute().data
-    if not evaluacion:
-        raise Exception("Evaluación no encontrada")
-
-    # 3. Construir el PDF (tú puedes customizarlo)
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", "B", 16)
-    pdf.cell(0, 10, "INFORME GENÉTICO PERSONALIZADO", 0, 1, "C")
-
-    pdf.set_font("Arial", "", 12)
-    pdf.cell(0, 10, f"Paciente: {paciente['nombre']}  |  Email: {paciente['email']}", 0, 1)
-    pdf.cell(0, 10, f"Fecha: {datetime.now().strftime('%Y-%m-%d %H:%M')}", 0, 1)
-    pdf.cell(0, 10, f"Elaborado por: Dr/a. {medico['nombre']} ({medico['email']})", 0, 1)
-
-    pdf.ln(10)
-    pdf.set_font("Arial", "B", 14)
-    pdf.cell(0, 10, "Resultados IA:", 0, 1)
-
-    resultado = evaluacion["resultado_json"]
-    pdf.set_font("Arial", "", 12)
-    for key, value in resultado.items():
-        if isinstance(value, list):
-            value = ", ".join(value)
-        pdf.cell(0, 10, f"{key}: {value}", 0, 1)
-
-    pdf.ln(10)
-    pdf.set_font("Arial", "I", 10)
-    pdf.cell(0, 10, "Este informe es confidencial y generado automáticamente.", 0, 1)
-
-    # 4. Guardar temporal y subir a Supabase Storage
-    pdf_file = pdf.output(dest="S").encode("latin1")
-    filename = f"{paciente_id}/{uuid4()}.pdf"
-    supabase.storage.from_("reportes").upload(filename, pdf_file)
-
-    # 5. Guardar URL en tabla informes
-    data = {
-        "id": str(uuid4()),
-        "user_id": paciente_id,
-        "archivo_pdf": filename,
-        "fecha_generado": datetime.utcnow().isoformat()
-    }
-    supabase.table("informes").insert(data).execute()
-    return data
+from uuid import UUID, uuid4
+
+async def generate_report_pdf(paciente_id, evaluacion_id, medico):
+    resultado = (await generate_reports_batch([(paciente_id, evaluacion_id)], medico))[0]
+    if not resultado["ok"]:
+        raise Exception(resultado["error"])
+    return resultado["informe"]
+
+def _ids_validos(ids):
+    # Un id mal formado haría fallar el `in_` entero contra columnas uuid
+    validos = set()
+    for id in ids:
+        try:
+            UUID(str(id))
+        except ValueError:
+            continue
+        validos.add(str(id))
+    return list(validos)
+
+async def generate_reports_batch(items, medico):
+    """
+    Genera un informe PDF por cada par (paciente_id, evaluacion_id).
+
+    Pacientes y evaluaciones se traen con una consulta `in_` cada uno, los
+    PDFs se renderizan en paralelo, se suben concurrentemente y las filas de
+    `informes` se insertan de una vez. Devuelve un resultado por item, en el
+    mismo orden: `{paciente_id, evaluacion_id, ok, informe, error}`.
+    """
+    if len(items) > settings.REPORT_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Máximo {settings.REPORT_BATCH_MAX_ITEMS} informes por lote")
+    resultados = [
+        {"paciente_id": p, "evaluacion_id": e, "ok": False, "informe": None, "error": None}
+        for p, e in items
+    ]
+    if not resultados:
+        return resultados
+
+    # 1. Precarga de pacientes y evaluaciones
+    pacientes_res, evaluaciones_res = await asyncio.gather(
+        supabase.table("users").select("id,nombre,email")
+            .in_("id", _ids_validos(r["paciente_id"] for r in resultados)).execute(),
+        supabase.table("evaluaciones_ia").select("id,user_id,resultado_json")
+            .in_("id", _ids_validos(r["evaluacion_id"] for r in resultados)).execute(),
+    )
+    pacientes = {str(p["id"]): p for p in pacientes_res.data or []}
+    evaluaciones = {str(e["id"]): e for e in evaluaciones_res.data or []}
+
+    # 2. Validación y autorización por item
+    pendientes = []
+    for r in resultados:
+        paciente = pacientes.get(r["paciente_id"])
+        evaluacion = evaluaciones.get(r["evaluacion_id"])
+        if not paciente:
+            r["error"] = "Paciente no encontrado"
+        elif not evaluacion or str(evaluacion["user_id"]) != r["paciente_id"]:
+            r["error"] = "Evaluación no encontrada"
+        elif not await can_access(medico, r["paciente_id"]):
+            r["error"] = "No tienes acceso a este paciente"
+        else:
+            pendientes.append((r, paciente, evaluacion))
+
+    # 3. Render en paralelo (el pool de procesos limita la concurrencia)
+    pdfs = await asyncio.gather(*[
+        pdf_renderer.render("evaluacion", {
+            "paciente": {k: paciente.get(k) for k in ("nombre", "email")},
+            "medico": {k: medico.get(k) for k in ("nombre", "email")},
+            "resultado": evaluacion["resultado_json"],
+        })
+        for _, paciente, evaluacion in pendientes
+    ], return_exceptions=True)
+
+    # 4. Subidas concurrentes, acotadas
+    semaforo = asyncio.Semaphore(settings.REPORT_UPLOAD_CONCURRENCY)
+
+    async def subir(r, pdf_file):
+        filename = f"{r['paciente_id']}/{uuid4()}.pdf"
+        async with semaforo:
+            await supabase.storage.from_("reportes").upload(filename, pdf_file)
+        return filename
+
+    subidos = []
+    for (r, _, _), pdf_file in zip(pendientes, pdfs):
+        if isinstance(pdf_file, Exception):
+            r["error"] = f"Error generando el PDF: {pdf_file}"
+        else:
+            subidos.append((r, pdf_file))
+    rutas = await asyncio.gather(*[subir(r, pdf_file) for r, pdf_file in subidos], return_exceptions=True)
+
+    # 5. Un único insert con todas las filas de informes
+    filas = []
+    for (r, _), ruta in zip(subidos, rutas):
+        if isinstance(ruta, Exception):
+            r["error"] = f"Error subiendo el PDF: {ruta}"
+            continue
+        r["informe"] = {
+            "id": str(uuid4()),
+            "user_id": r["paciente_id"],
+            "archivo_pdf": ruta,
+            "fecha_generado": datetime.utcnow().isoformat()
+        }
+        filas.append(r)
+    if filas:
+        try:
+            res = await supabase.table("informes").insert([r["informe"] for r in filas]).execute()
+            if hasattr(res, "error") and res.error:
+                raise Exception(res.error)
+        except Exception as e:
+            # Sin fila en informes los PDFs quedarían huérfanos en el bucket
+            try:
+                await supabase.storage.from_("reportes").remove([r["informe"]["archivo_pdf"] for r in filas])
+            except Exception:
+                pass
+            for r in filas:
+                r["informe"] = None
+                r["error"] = f"Error guardando el informe: {e}"
+        else:
+            for r in filas:
+                r["ok"] = True
+    return resultados
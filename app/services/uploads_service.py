@@ -0,0 +1,266 @@
+"""
+Subidas de VCF por partes, reanudables.
+
+1. `POST /genetics/uploads` abre una sesión para un paciente.
+2. `PUT /genetics/uploads/{id}/parts/{n}` envía la parte n (cuerpo en bruto,
+   cabecera opcional `X-Part-SHA256`). La parte se vuelca por bloques a un
+   temporal, se verifica y se sube a Storage en cuanto llega; reenviar una
+   parte la sustituye.
+3. `GET /genetics/uploads/{id}` lista las partes recibidas, para reanudar.
+4. `POST /genetics/uploads/{id}/commit` encola el ensamblado y el análisis.
+
+Si el proceso que ensambla muere (reinicio, caída), la sesión se queda en
+`ensamblando`; pasados `UPLOAD_ASSEMBLY_TIMEOUT_SECONDS` desde el commit
+se vuelve a abrir al usarla, para repetir el commit o cancelarla.
+
+La sesión y sus partes viven en Supabase (tablas `vcf_uploads` y
+`vcf_upload_parts`, objetos `uploads/<id>/<n>` del bucket), así que
+cualquier réplica puede recibir cualquier parte. La memoria por subida es
+la de un bloque, sea cual sea el tamaño del archivo. Al registrar el VCF,
+las partes se copian dentro de Storage: el archivo no se vuelve a subir.
+"""
+import hashlib
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from fastapi import HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.db.supabase import supabase
+from app.services import genetics_service, jobs_service
+from app.utils.vcf_parser import DEFAULT_CHUNK_SIZE
+
+BUCKET = "vcf-files"
+
+ABIERTA = "abierta"
+ENSAMBLANDO = "ensamblando"
+COMPLETADA = "completada"
+CANCELADA = "cancelada"
+
+
+def ruta_parte(upload_id: str, numero: int) -> str:
+    return f"uploads/{upload_id}/{numero:05d}"
+
+
+def _session_out(sesion: dict, partes: list[dict]) -> dict:
+    return {
+        "upload_id": sesion["id"],
+        "paciente_id": sesion["paciente_id"],
+        "filename": sesion.get("filename"),
+        "status": sesion["status"],
+        "part_size": settings.UPLOAD_PART_SIZE,
+        "partes": [{"numero": p["numero"], "sha256": p["sha256"], "size": p["size"]} for p in partes],
+    }
+
+
+def _ensamblado_caducado(sesion: dict) -> bool:
+    if sesion["status"] != ENSAMBLANDO:
+        return False
+    if not sesion.get("ensamblado_en"):
+        return True  # commit anterior a la columna: no hay forma de saber si sigue vivo
+    inicio = datetime.fromisoformat(str(sesion["ensamblado_en"]).replace("Z", "+00:00"))
+    if inicio.tzinfo is not None:
+        inicio = inicio.astimezone(timezone.utc).replace(tzinfo=None)
+    return datetime.utcnow() - inicio > timedelta(seconds=settings.UPLOAD_ASSEMBLY_TIMEOUT_SECONDS)
+
+
+async def _get_session(upload_id: str, user: dict, abierta: bool = False) -> dict:
+    res = await supabase.table("vcf_uploads").select("*").eq("id", upload_id).limit(1).execute()
+    sesion = res.data[0] if res.data else None
+    if not sesion:
+        raise HTTPException(status_code=404, detail="Subida no encontrada")
+    if str(sesion["medico_id"]) != str(user["id"]):
+        raise HTTPException(status_code=403, detail="Sin acceso a esta subida")
+    if _ensamblado_caducado(sesion):
+        # Ensamblado abandonado: las partes siguen en Storage, se reabre la sesión
+        if await _set_status(upload_id, ABIERTA, desde=ENSAMBLANDO):
+            sesion["status"] = ABIERTA
+    if abierta and sesion["status"] != ABIERTA:
+        raise HTTPException(status_code=409, detail=f"La subida no admite cambios (estado: {sesion['status']})")
+    return sesion
+
+
+async def _partes(upload_id: str) -> list[dict]:
+    res = await supabase.table("vcf_upload_parts") \
+        .select("numero,sha256,size") \
+        .eq("upload_id", upload_id) \
+        .order("numero") \
+        .limit(settings.UPLOAD_MAX_PARTS) \
+        .execute()
+    return res.data or []
+
+
+async def _set_status(upload_id: str, status: str, desde: Optional[str] = None, **campos) -> bool:
+    query = supabase.table("vcf_uploads").update({"status": status, **campos}).eq("id", upload_id)
+    if desde:
+        query = query.eq("status", desde)
+    res = await query.execute()
+    return bool(res.data)
+
+
+async def create_session(paciente_id: str, filename: Optional[str], user: dict) -> dict:
+    res = await supabase.table("vcf_uploads").insert({
+        "medico_id": user["id"],
+        "paciente_id": paciente_id,
+        "filename": filename,
+        "status": ABIERTA,
+        "created_at": datetime.utcnow().isoformat(),
+    }).execute()
+    if hasattr(res, "error") and res.error:
+        raise HTTPException(status_code=400, detail=f"No se pudo abrir la subida: {res.error}")
+    return _session_out(res.data[0], [])
+
+
+async def get_session(upload_id: str, user: dict) -> dict:
+    sesion = await _get_session(upload_id, user)
+    return _session_out(sesion, await _partes(upload_id))
+
+
+async def _spool_part(request: Request) -> tuple[str, str, int]:
+    # Cuerpo de la parte a un temporal por bloques, con SHA-256 y tope de tamaño
+    sha = hashlib.sha256()
+    size = 0
+    fd, path = tempfile.mkstemp(suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            async for chunk in request.stream():
+                size += len(chunk)
+                if size > settings.UPLOAD_PART_MAX_BYTES:
+                    raise HTTPException(status_code=413,
+                                        detail=f"Parte demasiado grande (máximo {settings.UPLOAD_PART_MAX_BYTES} bytes)")
+                sha.update(chunk)
+                await run_in_threadpool(f.write, chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, sha.hexdigest(), size
+
+
+async def put_part(upload_id: str, numero: int, request: Request, sha256: Optional[str], user: dict) -> dict:
+    if not 1 <= numero <= settings.UPLOAD_MAX_PARTS:
+        raise HTTPException(status_code=400, detail=f"Número de parte fuera de rango (1-{settings.UPLOAD_MAX_PARTS})")
+    await _get_session(upload_id, user, abierta=True)
+
+    path, digest, size = await _spool_part(request)
+    try:
+        if size == 0:
+            raise HTTPException(status_code=400, detail="Parte vacía")
+        if sha256 and sha256.lower() != digest:
+            raise HTTPException(status_code=400, detail="El SHA-256 de la parte no coincide")
+        try:
+            with open(path, "rb") as f:
+                await supabase.storage.from_(BUCKET).upload(ruta_parte(upload_id, numero), f, {"upsert": "true"})
+        except Exception as e:
+            raise HTTPException(status_code=502, detail=f"No se pudo guardar la parte: {str(e)}")
+    finally:
+        os.remove(path)
+
+    parte = {"upload_id": upload_id, "numero": numero, "sha256": digest, "size": size}
+    await supabase.table("vcf_upload_parts").upsert(parte, on_conflict="upload_id,numero").execute()
+    return {"numero": numero, "sha256": digest, "size": size}
+
+
+async def _borrar_partes(upload_id: str, partes: list[dict]):
+    rutas = [ruta_parte(upload_id, p["numero"]) for p in partes]
+    for i in range(0, len(rutas), 1000):
+        await supabase.storage.from_(BUCKET).remove(rutas[i:i + 1000])
+    await supabase.table("vcf_upload_parts").delete().eq("upload_id", upload_id).execute()
+
+
+async def abort(upload_id: str, user: dict) -> dict:
+    await _get_session(upload_id, user, abierta=True)
+    await _borrar_partes(upload_id, await _partes(upload_id))
+    await _set_status(upload_id, CANCELADA)
+    return {"upload_id": upload_id, "status": CANCELADA}
+
+
+async def commit(upload_id: str, partes_esperadas: Optional[int], sha256: Optional[str], user: dict) -> dict:
+    """
+    Comprueba que están todas las partes (1..N, sin huecos) y encola el
+    trabajo: ensamblado, registro del perfil y el análisis de siempre.
+    """
+    sesion = await _get_session(upload_id, user, abierta=True)
+    partes = await _partes(upload_id)
+    if not partes:
+        raise HTTPException(status_code=400, detail="La subida no tiene partes")
+    total = partes_esperadas or partes[-1]["numero"]
+    recibidas = {p["numero"] for p in partes}
+    faltan = [n for n in range(1, total + 1) if n not in recibidas]
+    if faltan:
+        raise HTTPException(status_code=400, detail=f"Faltan partes: {', '.join(map(str, faltan[:50]))}")
+    if len(partes) != total:
+        raise HTTPException(status_code=400, detail=f"Hay partes de más: se esperaban {total}, hay {len(partes)}")
+    # Solo un commit por sesión, aunque lleguen dos a la vez
+    if not await _set_status(upload_id, ENSAMBLANDO, desde=ABIERTA, ensamblado_en=datetime.utcnow().isoformat()):
+        raise HTTPException(status_code=409, detail="La subida ya se está procesando")
+
+    job = jobs_service.submit(
+        "analisis_vcf",
+        SUBIDA_POR_PARTES_STAGES,
+        {"upload_id": upload_id, "paciente_id": sesion["paciente_id"], "partes": partes,
+         "sha256": sha256.lower() if sha256 else None},
+        owner_id=user["id"],
+        on_finish=_terminar,
+    )
+    return {"job_id": job["id"], "status": job["status"], "upload_id": upload_id}
+
+
+# ----------- Etapas -----------------
+
+async def _etapa_ensamblado(ctx):
+    # Descarga las partes en orden a un temporal, por bloques, verificándolas
+    fd, path = tempfile.mkstemp(suffix=".vcf")
+    ctx["vcf_path"] = path
+    sha = hashlib.sha256()
+    with os.fdopen(fd, "wb") as f:
+        for parte in ctx["partes"]:
+            upstream = await supabase.open_object(BUCKET, ruta_parte(ctx["upload_id"], parte["numero"]))
+            sha_parte = hashlib.sha256()
+            try:
+                if upstream.status_code >= 400:
+                    raise Exception(f"Parte {parte['numero']} no disponible (Storage respondió {upstream.status_code})")
+                async for chunk in upstream.aiter_bytes(DEFAULT_CHUNK_SIZE):
+                    sha_parte.update(chunk)
+                    sha.update(chunk)
+                    await run_in_threadpool(f.write, chunk)
+            finally:
+                await upstream.aclose()
+            if sha_parte.hexdigest() != parte["sha256"]:
+                raise Exception(f"La parte {parte['numero']} no coincide con su SHA-256")
+    ctx["content_hash"] = sha.hexdigest()
+    if ctx["sha256"] and ctx["sha256"] != ctx["content_hash"]:
+        raise Exception("El SHA-256 del archivo ensamblado no coincide")
+
+
+async def _etapa_registro(ctx):
+    # El temporal ensamblado solo se usa para analizar: el VCF se guarda a
+    # partir de las partes que ya están en Storage
+    partes = [(ruta_parte(ctx["upload_id"], p["numero"]), p["sha256"]) for p in ctx["partes"]]
+    ctx["profile"], ctx["previo"] = await genetics_service.registrar_vcf(
+        ctx["vcf_path"], ctx["content_hash"], ctx["paciente_id"], partes)
+
+
+async def _etapa_limpieza(ctx):
+    await _borrar_partes(ctx["upload_id"], ctx["partes"])
+    await _set_status(ctx["upload_id"], COMPLETADA)
+    ctx["completada"] = True
+
+
+async def _terminar(ctx):
+    for key in ("vcf_path", "gt_path"):
+        if ctx.get(key) and os.path.exists(ctx[key]):
+            os.remove(ctx[key])
+    if not ctx.get("completada"):
+        # Las partes siguen en Storage: se puede corregir y repetir el commit
+        await _set_status(ctx["upload_id"], ABIERTA, desde=ENSAMBLANDO)
+
+
+SUBIDA_POR_PARTES_STAGES = [
+    ("ensamblado", _etapa_ensamblado),
+    ("registro", _etapa_registro),
+    *genetics_service.ANALISIS_VCF_STAGES,
+    ("limpieza", _etapa_limpieza),
+]
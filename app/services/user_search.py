@@ -0,0 +1,248 @@
+"""
+Índice en memoria para la búsqueda de usuarios (nombre, apellidos, email).
+
+Trigramas al estilo de `pg_trgm`: cada palabra normalizada (minúsculas, sin
+tildes) se rellena con espacios (`"  maria "`) y se parte en trigramas; los
+que empiezan por espacio hacen que escribir el principio de una palabra
+(`"mar"`) ya encuentre `María`. Cada trigrama apunta a un `array` compacto
+de números de documento, así que cientos de miles de usuarios caben en
+pocas decenas de MB.
+
+Una búsqueda cuenta, para los trigramas de la consulta, cuántos comparte
+cada documento (similitud = compartidos / trigramas de la consulta) y
+devuelve los `limit` mejores. Los candidatos salen de los trigramas raros
+de la consulta (los que están en casi todos, como `com` o `gma`, solo se
+comprueban para ellos) y se puntúan como mucho `_MAX_CANDIDATOS`, así que
+una búsqueda cuesta milisegundos aunque haya cientos de miles de usuarios.
+
+Altas y cambios se aplican al momento (`upsert`); como cada worker tiene su
+copia, además se recarga entera cada `USER_SEARCH_TTL_SECONDS`, en segundo
+plano y sin bloquear las búsquedas.
+La API no borra usuarios: si se borran a mano en la BD, desaparecen del
+índice en la siguiente recarga.
+"""
+import asyncio
+import heapq
+import logging
+import re
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from functools import lru_cache
+from itertools import islice
+from typing import Optional
+
+from app.core.config import settings
+from app.db.supabase import supabase
+
+# Campos públicos que se guardan y devuelven (nunca `password_hash`)
+CAMPOS = ("id", "nombre", "apellidos", "email", "rol", "created_at")
+_PAGE_SIZE = 1000  # límite de filas por respuesta de PostgREST
+_SIMILITUD_MIN = 0.3  # mismo umbral por defecto que pg_trgm
+_FRACCION_COMUN = 0.05  # trigrama "común": aparece en más de esta fracción de documentos
+_MAX_CANDIDATOS = 1000  # documentos que se puntúan como mucho por búsqueda
+_MAX_ENTRADAS = 20 * _MAX_CANDIDATOS  # entradas de listas que se cuentan como mucho
+_VACIA = array("I")
+logger = logging.getLogger(__name__)
+
+_NO_ALFANUM = re.compile(r"[^a-z0-9]+")
+
+
+def normalizar(texto: Optional[str]) -> str:
+    """`José  Núñez-Pérez` -> `jose nunez perez`."""
+    sin_tildes = unicodedata.normalize("NFKD", texto or "").encode("ascii", "ignore").decode()
+    return _NO_ALFANUM.sub(" ", sin_tildes.lower()).strip()
+
+
+def trigramas(texto: str, prefijo: bool = False) -> set[str]:
+    """
+    Trigramas de cada palabra de `texto` (ya normalizado). Con `prefijo`, la
+    última palabra no se cierra: la consulta `"mar"` es prefijo de `"maria"`.
+    """
+    palabras = texto.split()
+    out = set()
+    for i, palabra in enumerate(palabras):
+        out.update(_trigramas_palabra(palabra, prefijo and i == len(palabras) - 1))
+    return out
+
+
+@lru_cache(maxsize=65536)
+def _trigramas_palabra(palabra: str, abierta: bool) -> tuple[str, ...]:
+    # Nombres, apellidos y dominios se repiten mucho: acelera la carga del índice
+    p = f"  {palabra}" + ("" if abierta else " ")
+    return tuple(p[j:j + 3] for j in range(len(p) - 2))
+
+
+def _contiene(posting: array, n: int) -> bool:
+    # Las listas están ordenadas: los documentos se numeran al añadirlos
+    i = bisect_left(posting, n)
+    return i < len(posting) and posting[i] == n
+
+
+def _texto(user: dict) -> str:
+    email = user.get("email") or ""
+    # El email entero y su parte local por palabras ("ana.lopez" -> "ana lopez")
+    return normalizar(" ".join((user.get("nombre") or "", user.get("apellidos") or "", email.split("@")[0], email)))
+
+
+class UserSearchIndex:
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._reset()
+        self._cargado_en = 0.0
+        self._warm_lock = asyncio.Lock()
+        self._recarga: Optional[asyncio.Task] = None
+        self._pendientes: Optional[list] = None  # cambios llegados durante una recarga
+
+    def _reset(self):
+        self._docs: list[Optional[dict]] = []  # nº de documento -> usuario (None si se reemplazó)
+        self._textos: list[str] = []
+        self._tamanos = array("I")  # trigramas por documento (desempate: más corto primero)
+        self._por_id: dict[str, int] = {}
+        self._postings: dict[str, array] = {}
+
+    def __len__(self) -> int:
+        return len(self._por_id)
+
+    def upsert(self, user: dict):
+        """Alta o cambio de un usuario; la versión anterior deja de contar."""
+        if self._pendientes is not None:
+            self._pendientes.append(user)
+        uid = str(user["id"])
+        previo = self._por_id.get(uid)
+        if previo is not None:
+            # Se completa con lo que ya había (los updates parciales no traen todo)
+            user = {**self._docs[previo], **{k: user[k] for k in CAMPOS if k in user}}
+            self._docs[previo] = None
+        doc = {k: user.get(k) for k in CAMPOS}
+        n = len(self._docs)
+        texto = _texto(doc)
+        grams = trigramas(texto)
+        self._docs.append(doc)
+        self._textos.append(texto)
+        self._tamanos.append(len(grams))
+        self._por_id[uid] = n
+        for g in grams:
+            posting = self._postings.get(g)
+            if posting is None:
+                posting = self._postings[g] = array("I")
+            posting.append(n)
+
+    async def warm(self):
+        """Recarga completa desde `users` (se construye aparte y se cambia al final)."""
+        nuevo = UserSearchIndex(self.ttl)
+        self._pendientes = []
+        try:
+            start = 0
+            while True:
+                res = await supabase.table("users") \
+                    .select(",".join(CAMPOS)) \
+                    .order("id") \
+                    .range(start, start + _PAGE_SIZE - 1) \
+                    .execute()
+                rows = res.data or []
+                for r in rows:
+                    nuevo.upsert(r)
+                if len(rows) < _PAGE_SIZE:
+                    break
+                start += _PAGE_SIZE
+            # Lo que cambió mientras se leía puede no estar en las páginas ya leídas
+            for user in self._pendientes:
+                nuevo.upsert(user)
+        finally:
+            self._pendientes = None
+        self._docs, self._textos, self._tamanos = nuevo._docs, nuevo._textos, nuevo._tamanos
+        self._por_id, self._postings = nuevo._por_id, nuevo._postings
+        self._cargado_en = time.monotonic()
+
+    def _stale(self) -> bool:
+        return not self._cargado_en or time.monotonic() - self._cargado_en > self.ttl
+
+    async def refresh(self):
+        """`warm` si hace falta; las llamadas concurrentes esperan a la misma carga."""
+        async with self._warm_lock:
+            if self._stale():
+                await self.warm()
+
+    async def _refresh_en_segundo_plano(self):
+        try:
+            await self.refresh()
+        except Exception:
+            logger.exception("no se pudo recargar el índice de búsqueda de usuarios")
+
+    def precargar(self):
+        if self._recarga is None or self._recarga.done():
+            self._recarga = asyncio.create_task(self._refresh_en_segundo_plano())
+        return self._recarga
+
+    async def _ensure(self):
+        if not self._cargado_en:
+            # Primera carga: hay que esperarla
+            await self.refresh()
+        elif self._stale():
+            # Índice viejo: se sigue usando mientras se recarga
+            self.precargar()
+
+    def _buscar(self, query: str, limit: int, rol: Optional[str]) -> list[dict]:
+        texto = normalizar(query)
+        grams = trigramas(texto, prefijo=True)
+        if not grams:
+            return []
+        docs, textos, tamanos = self._docs, self._textos, self._tamanos
+        listas = sorted((self._postings.get(g, _VACIA) for g in grams), key=len)
+        minimo = max(1, int(len(grams) * _SIMILITUD_MIN + 0.999))
+
+        # Los candidatos salen solo de los trigramas más raros: los que tiene
+        # buena parte de los usuarios (`com`, `gma`, `ail`...) apenas filtran
+        # y son los más caros de contar; para los candidatos se comprueban aparte.
+        tope = max(_MAX_CANDIDATOS, int(len(docs) * _FRACCION_COMUN))
+        if len(listas[0]) > _MAX_ENTRADAS:
+            # Hasta el más raro es muy común: valen los primeros que encajen
+            validos = (n for n in listas[0] if docs[n] is not None and (not rol or docs[n].get("rol") == rol))
+            seleccion = [(n, 1) for n in islice(validos, _MAX_CANDIDATOS)]
+            comunes = listas[1:]
+        else:
+            conteo = Counter(listas[0])
+            contadas, total = 1, len(listas[0])
+            for posting in listas[1:]:
+                if len(posting) > tope or total + len(posting) > _MAX_ENTRADAS:
+                    break
+                conteo.update(posting)
+                contadas, total = contadas + 1, total + len(posting)
+            comunes = listas[contadas:]
+            seleccion = conteo.items()
+            if rol:
+                # Otros roles fuera antes de recortar
+                seleccion = [(n, c) for n, c in seleccion if (docs[n] or {}).get("rol") == rol]
+            if len(seleccion) > _MAX_CANDIDATOS:
+                # Los que más trigramas raros comparten; a igualdad, los que contienen la consulta
+                seleccion = heapq.nlargest(_MAX_CANDIDATOS, seleccion, key=lambda c: (c[1], texto in textos[c[0]]))
+        candidatos = []
+        for n, compartidos in seleccion:
+            if docs[n] is None:
+                continue
+            # Los trigramas comunes solo se comprueban para los candidatos
+            compartidos += sum(_contiene(posting, n) for posting in comunes)
+            if compartidos < minimo:
+                continue
+            # Bonus si la consulta aparece tal cual (p. ej. un email completo o un apellido)
+            exacto = texto in textos[n]
+            candidatos.append((compartidos / len(grams) + exacto, -tamanos[n], -n, n))
+        return [docs[n] for *_, n in heapq.nlargest(limit, candidatos)]
+
+    async def search(self, query: str, limit: int = 20, rol: Optional[str] = None) -> list[dict]:
+        await self._ensure()
+        return self._buscar(query, limit, rol)
+
+    def stats(self) -> dict:
+        return {
+            "usuarios": len(self._por_id),
+            "documentos": len(self._docs),
+            "trigramas": len(self._postings),
+            "entradas": sum(len(p) for p in self._postings.values()),
+        }
+
+
+index = UserSearchIndex(ttl=settings.USER_SEARCH_TTL_SECONDS)
@@ -1,15 +1,18 @@
 from app.db.supabase import supabase
-from app.core.security import hash_password, verify_password, create_access_token
+from app.core.security import create_access_token, create_refresh_token
+from app.core import passwords
 from app.db.schemas import UserCreate, UserLogin
 from fastapi import HTTPException, status
+from app.utils.pagination import paginate
+from app.services import user_search
 
-def create_user(user: UserCreate):
+async def create_user(user: UserCreate):
     # Check if email exists
-    exists = supabase.table("users").select("id").eq("email", user.email).execute().data
+    exists = (await supabase.table("users").select("id").eq("email", user.email).execute()).data
     if exists:
         raise HTTPException(status_code=400, detail="Email ya registrado")
     # Hash password
-    hashed = hash_password(user.password)
+    hashed = await passwords.hash_password(user.password)
     # Insert user
     new_user = {
         "nombre": user.nombre,
@@ -17,22 +20,43 @@ def create_user(user: UserCreate):
         "password_hash": hashed,
         "rol": user.rol
     }
-    res = supabase.table("users").insert(new_user).execute()
+    res = await supabase.table("users").insert(new_user).execute()
     # El cambio es aquí:
     if res.data is None or len(res.data) == 0:
         raise HTTPException(status_code=500, detail="Error creando usuario")
+    user_search.index.upsert(res.data[0])
     return res.data[0]
 
-def authenticate_user(login: UserLogin):
-    user = supabase.table("users").select("*").eq("email", login.email).single().execute().data
-    if not user or not verify_password(login.password, user["password_hash"]):
+async def authenticate_user(login: UserLogin):
+    res = await supabase.table("users").select("*").eq("email", login.email).limit(1).execute()
+    user = res.data[0] if res.data else None
+    if not user:
         raise HTTPException(status_code=401, detail="Email o password incorrectos")
+    valido, nuevo_hash = await passwords.verify_and_update(login.password, user["password_hash"])
+    if not valido:
+        raise HTTPException(status_code=401, detail="Email o password incorrectos")
+    if nuevo_hash:
+        # Cambió BCRYPT_ROUNDS: se guarda el hash con el coste actual
+        try:
+            await supabase.table("users").update({"password_hash": nuevo_hash}).eq("id", user["id"]).execute()
+            user["password_hash"] = nuevo_hash
+        except Exception:
+            pass
     return user
 
+async def update_password(user_id: str, new_password: str):
+    hashed = await passwords.hash_password(new_password)
+    res = await supabase.table("users").update({"password_hash": hashed}).eq("id", user_id).execute()
+    if not res.data:
+        raise HTTPException(status_code=500, detail="Error actualizando contraseña")
+
 def create_jwt_for_user(user):
     token = create_access_token({"id": user["id"], "rol": user["rol"]})
     return token
 
-def get_all_patients():
-    res = supabase.table("users").select("id, nombre, email, rol, created_at").eq("rol", "paciente").execute()
-    return res.data or []
+def create_refresh_for_user(user):
+    return create_refresh_token({"id": user["id"]})
+
+async def get_all_patients(page):
+    query = supabase.table("users").select("id, nombre, email, rol, created_at").eq("rol", "paciente")
+    return await paginate(query, page, "created_at")
@@ -0,0 +1,323 @@
+"""
+Benchmarks de carga sin red.
+
+Levanta la app FastAPI real (lifespan incluido) contra los dobles en proceso
+de Supabase y OpenAI de `app.tests.fakes`, con latencia inyectada, y lanza
+escenarios guionizados: ráfaga de logins, ráfaga de chat, subidas de VCF en
+bloque y descargas de informes. Cada escenario informa del throughput y de
+los percentiles p50/p95/p99 de latencia.
+
+Uso:
+    python -m app.tests.bench                              # todos los escenarios
+    python -m app.tests.bench chat_burst --requests 500 --concurrency 50 --latency-ms 30
+    python -m app.tests.bench --json > bench.json           # para comparar entre versiones
+"""
+import os
+import tempfile
+
+# La configuración se lee al importar la app: valores por defecto antes de importarla
+_BENCH_DIR = os.path.join(tempfile.gettempdir(), "neuropharm-bench")
+for _key, _value in {
+    "JWT_SECRET": "bench-secret",
+    "SUPABASE_URL": "http://supabase.local",
+    "SUPABASE_ANON_KEY": "anon",
+    "SUPABASE_SERVICE_ROLE_KEY": "service",
+    "SUPABASE_DB_URL": "postgresql://bench",
+    "SUPABASE_BUCKET_VCF": "vcf-files",
+    "SUPABASE_BUCKET_REPORTS": "reportes",
+    "OPENAI_API_KEY": "bench",
+    "OPENAI_MODEL_ANALYSIS": "gpt-4o",
+    "OPENAI_MODEL_CHATBOT": "gpt-3.5-turbo",
+    "PDF_LOGO_PATH": "",
+    "LOG_LEVEL": "WARNING",
+    "LLM_CACHE_ENABLED": "false",
+    "LLM_CACHE_PATH": os.path.join(_BENCH_DIR, "llm_cache.sqlite3"),
+    "TOKEN_REVOCATION_DB_PATH": os.path.join(_BENCH_DIR, "revoked_tokens.sqlite3"),
+    "REPORT_CACHE_DIR": os.path.join(_BENCH_DIR, "reportes"),
+}.items():
+    os.environ.setdefault(_key, _value)
+
+import argparse
+import asyncio
+import json
+import math
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+import httpx
+
+from app.tests.fakes import FakeOpenAI, FakeSupabase
+
+PASSWORD = "bench-password"
+
+VCF_SAMPLE = (
+    "##fileformat=VCFv4.2\n"
+    "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tS1\n"
+    + "".join(f"chr10\t{94938000 + i}\trs{1000 + i}\tC\tT\t.\tPASS\t.\tGT\t0/1\n" for i in range(200))
+).encode()
+
+
+@dataclass
+class Stats:
+    nombre: str
+    latencias: list[float] = field(default_factory=list)
+    errores: int = 0
+    duracion: float = 0.0
+
+    def percentil(self, q: float) -> float:
+        """Percentil `q` (0-100) en ms, por rango más cercano."""
+        if not self.latencias:
+            return 0.0
+        ordenadas = sorted(self.latencias)
+        rango = max(math.ceil(q / 100 * len(ordenadas)), 1)
+        return ordenadas[rango - 1] * 1000
+
+    def resumen(self) -> dict:
+        total = len(self.latencias) + self.errores
+        return {
+            "escenario": self.nombre,
+            "peticiones": total,
+            "errores": self.errores,
+            "duracion_s": round(self.duracion, 3),
+            "rps": round(total / self.duracion, 1) if self.duracion else 0.0,
+            "p50_ms": round(self.percentil(50), 1),
+            "p95_ms": round(self.percentil(95), 1),
+            "p99_ms": round(self.percentil(99), 1),
+        }
+
+
+async def drive(nombre: str, total: int, concurrency: int, fn: Callable[[int], Awaitable[bool]]) -> Stats:
+    """
+    Ejecuta `fn(i)` para i en [0, total) con `concurrency` clientes en
+    paralelo. `fn` devuelve si la petición fue correcta; las excepciones
+    cuentan como error.
+    """
+    stats = Stats(nombre)
+    indices = iter(range(total))
+
+    async def cliente():
+        for i in indices:
+            inicio = time.perf_counter()
+            try:
+                ok = await fn(i)
+            except Exception:
+                ok = False
+            if ok:
+                stats.latencias.append(time.perf_counter() - inicio)
+            else:
+                stats.errores += 1
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(cliente() for _ in range(max(concurrency, 1))))
+    stats.duracion = time.perf_counter() - inicio
+    return stats
+
+
+class BenchApp:
+    """
+    La app real sobre los dobles: `async with BenchApp(...) as bench` siembra
+    los datos, arranca el lifespan y deja en `bench.client` un cliente httpx
+    contra la app ASGI.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0,
+                 llm_latency: float = 0.0, token_latency: float = 0.0, pacientes: int = 20):
+        self.supabase = FakeSupabase(latency=latency, jitter=jitter)
+        self.openai = FakeOpenAI(latency=llm_latency, token_latency=token_latency, jitter=jitter)
+        self.medico_id = str(uuid.uuid4())
+        self.pacientes = [str(uuid.uuid4()) for _ in range(pacientes)]
+        self.client: httpx.AsyncClient | None = None
+        self._lifespan = None
+
+    def _seed(self):
+        from app.core.security import hash_password
+
+        password_hash = hash_password(PASSWORD)
+        users = self.supabase.tables["users"]
+        users.append({"id": self.medico_id, "nombre": "Médico Bench", "email": "medico@bench.neuropharm.dev",
+                      "rol": "medico", "password_hash": password_hash})
+        for i, paciente_id in enumerate(self.pacientes):
+            users.append({"id": paciente_id, "nombre": f"Paciente {i}", "email": f"paciente{i}@bench.neuropharm.dev",
+                          "rol": "paciente", "password_hash": password_hash})
+            self.supabase.tables["medicos_pacientes"].append(
+                {"medico_id": self.medico_id, "paciente_id": paciente_id, "status": "activo"})
+
+    def token(self, user_id: str, rol: str) -> dict:
+        from app.core.security import create_access_token
+        return {"Authorization": "Bearer " + create_access_token({"id": user_id, "rol": rol})}
+
+    async def __aenter__(self) -> "BenchApp":
+        from app.db import supabase as supabase_module
+        import main
+
+        for service in ("supabase_rest", "supabase_storage"):
+            supabase_module.override_transport(service, self.supabase.transport())
+        supabase_module.override_transport("openai", self.openai.transport())
+        self._seed()
+        self._lifespan = main.app.router.lifespan_context(main.app)
+        await self._lifespan.__aenter__()
+        self.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app),
+                                        base_url="http://bench", timeout=60)
+        return self
+
+    async def __aexit__(self, *exc):
+        from app.db import supabase as supabase_module
+
+        await self.client.aclose()
+        await self._lifespan.__aexit__(*exc)
+        for service in ("supabase_rest", "supabase_storage", "openai"):
+            supabase_module.override_transport(service, None)
+
+
+# ---------------- Escenarios ----------------
+
+_SCENARIOS: dict[str, Callable[[BenchApp, int, int], Awaitable[list[Stats]]]] = {}
+
+
+def scenario(name: str):
+    """Registra un escenario: `fn(bench, requests, concurrency) -> [Stats]`."""
+    def decorator(fn):
+        _SCENARIOS[name] = fn
+        return fn
+    return decorator
+
+
+@scenario("login_storm")
+async def login_storm(bench: BenchApp, requests: int, concurrency: int) -> list[Stats]:
+    async def login(i: int) -> bool:
+        r = await bench.client.post("/users/login", json={
+            "email": f"paciente{i % len(bench.pacientes)}@bench.neuropharm.dev", "password": PASSWORD})
+        return r.status_code == 200
+    return [await drive("login_storm", requests, concurrency, login)]
+
+
+@scenario("chat_burst")
+async def chat_burst(bench: BenchApp, requests: int, concurrency: int) -> list[Stats]:
+    headers = [bench.token(p, "paciente") for p in bench.pacientes]
+
+    async def chat(i: int) -> bool:
+        r = await bench.client.post("/chatbot/chat", json={"mensaje": f"¿Puedo tomar ibuprofeno? ({i})"},
+                                    headers=headers[i % len(headers)])
+        return r.status_code == 200
+
+    async def chat_stream(i: int) -> bool:
+        r = await bench.client.post("/chatbot/chat", params={"stream": "true"},
+                                    json={"mensaje": f"¿Y el omeprazol? ({i})"}, headers=headers[i % len(headers)])
+        return r.status_code == 200 and "event: done" in r.text
+
+    return [await drive("chat_burst", requests, concurrency, chat),
+            await drive("chat_burst_stream", requests, concurrency, chat_stream)]
+
+
+@scenario("bulk_uploads")
+async def bulk_uploads(bench: BenchApp, requests: int, concurrency: int) -> list[Stats]:
+    headers = bench.token(bench.medico_id, "medico")
+    jobs: list[tuple[str, float]] = []
+
+    async def upload(i: int) -> bool:
+        inicio = time.perf_counter()
+        r = await bench.client.post(
+            "/genetics/upload",
+            files={"file": (f"muestra_{i}.vcf", VCF_SAMPLE, "text/plain")},
+            data={"paciente_id": bench.pacientes[i % len(bench.pacientes)]},
+            headers=headers,
+        )
+        if r.status_code != 202:
+            return False
+        jobs.append((r.json()["job_id"], inicio))
+        return True
+
+    subidas = await drive("bulk_uploads", requests, concurrency, upload)
+
+    # Latencia de extremo a extremo: desde la subida hasta el job terminado
+    completados = Stats("bulk_uploads_jobs")
+
+    async def esperar(job_id: str, inicio: float):
+        while True:
+            r = await bench.client.get(f"/genetics/jobs/{job_id}", headers=headers)
+            estado = r.json().get("status") if r.status_code == 200 else "error"
+            if estado == "completado":
+                completados.latencias.append(time.perf_counter() - inicio)
+                return
+            if estado == "error":
+                completados.errores += 1
+                return
+            await asyncio.sleep(0.01)
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(esperar(job_id, t) for job_id, t in jobs))
+    completados.duracion = time.perf_counter() - inicio
+    return [subidas, completados]
+
+
+@scenario("report_downloads")
+async def report_downloads(bench: BenchApp, requests: int, concurrency: int,
+                           informes: int = 20, size: int = 256 * 1024) -> list[Stats]:
+    ids = []
+    for i in range(informes):
+        paciente_id = bench.pacientes[i % len(bench.pacientes)]
+        ruta = f"{paciente_id}/bench_{uuid.uuid4()}.pdf"
+        bench.supabase.objects[("reportes", ruta)] = os.urandom(size)
+        informe = {"id": str(uuid.uuid4()), "user_id": paciente_id, "archivo_pdf": ruta}
+        bench.supabase.tables["informes"].append(informe)
+        ids.append(informe["id"])
+    headers = bench.token(bench.medico_id, "medico")
+
+    async def download(i: int) -> bool:
+        r = await bench.client.get(f"/reports/download/{ids[i % len(ids)]}", headers=headers)
+        return r.status_code == 200 and len(r.content) == size
+
+    async def download_range(i: int) -> bool:
+        r = await bench.client.get(f"/reports/download/{ids[i % len(ids)]}",
+                                   headers={**headers, "Range": "bytes=0-65535"})
+        return r.status_code == 206 and len(r.content) == 65536
+
+    return [await drive("report_downloads", requests, concurrency, download),
+            await drive("report_downloads_range", requests, concurrency, download_range)]
+
+
+async def run(names: list[str], requests: int, concurrency: int, latency: float = 0.0, jitter: float = 0.0,
+              llm_latency: float = 0.0, token_latency: float = 0.0) -> list[dict]:
+    resultados = []
+    async with BenchApp(latency, jitter, llm_latency, token_latency) as bench:
+        for name in names:
+            for stats in await _SCENARIOS[name](bench, requests, concurrency):
+                resultados.append(stats.resumen())
+    return resultados
+
+
+def _tabla(resultados: list[dict]) -> str:
+    columnas = list(resultados[0]) if resultados else []
+    filas = [[str(r[c]) for c in columnas] for r in resultados]
+    anchos = [max(len(c), *(len(f[i]) for f in filas)) for i, c in enumerate(columnas)]
+    lineas = ["  ".join(c.ljust(a) for c, a in zip(columnas, anchos))]
+    lineas += ["  ".join(v.ljust(a) for v, a in zip(f, anchos)) for f in filas]
+    return "\n".join(lineas)
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Benchmarks de carga contra dobles locales de Supabase y OpenAI")
+    parser.add_argument("scenarios", nargs="*", help=f"escenarios a lanzar (por defecto, todos): {', '.join(_SCENARIOS)}")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=10.0, help="latencia de Supabase por llamada")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="latencia extra aleatoria por llamada")
+    parser.add_argument("--llm-latency-ms", type=float, default=200.0, help="latencia de OpenAI por llamada")
+    parser.add_argument("--token-latency-ms", type=float, default=0.0, help="latencia entre tokens en streaming")
+    parser.add_argument("--json", action="store_true", help="salida en JSON")
+    args = parser.parse_args(argv)
+    desconocidos = [s for s in args.scenarios if s not in _SCENARIOS]
+    if desconocidos:
+        parser.error(f"escenario desconocido: {', '.join(desconocidos)}")
+
+    resultados = asyncio.run(run(
+        args.scenarios or list(_SCENARIOS), args.requests, args.concurrency,
+        args.latency_ms / 1000, args.jitter_ms / 1000, args.llm_latency_ms / 1000, args.token_latency_ms / 1000,
+    ))
+    print(json.dumps(resultados, indent=2) if args.json else _tabla(resultados))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import os
+
+# Los tests de carga usan la app real: costes bajos para que sean rápidos
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("PDF_WORKERS", "0")
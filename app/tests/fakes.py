@@ -0,0 +1,310 @@
+"""
+Dobles en proceso de PostgREST / Supabase Storage y de la API de chat de
+OpenAI, montados como transportes httpx (sin red) con latencia configurable.
+
+Implementan solo el subconjunto de la API que usa la app. Se conectan con
+`app.db.supabase.override_transport` antes de abrir los clientes.
+"""
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from email.parser import BytesParser
+from email.policy import default as email_policy
+from urllib.parse import unquote
+
+import httpx
+
+
+class FakeSupabase:
+    """PostgREST + Storage en memoria (subconjunto usado por la app)."""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.tables: dict[str, list[dict]] = defaultdict(list)
+        self.objects: dict[tuple[str, str], bytes] = {}
+        self.calls: dict[str, int] = defaultdict(int)
+
+    # ---------------- transporte ----------------
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        await _sleep(self.latency, self.jitter)
+        path = request.url.path
+        if path.startswith("/rest/v1/"):
+            self.calls["rest"] += 1
+            return self._rest(request, unquote(path[len("/rest/v1/"):]))
+        if path.startswith("/storage/v1/"):
+            self.calls["storage"] += 1
+            return self._storage(request, unquote(path[len("/storage/v1/"):]))
+        return httpx.Response(404, json={"message": "not found"})
+
+    # ---------------- PostgREST ----------------
+
+    def _rest(self, request: httpx.Request, table: str) -> httpx.Response:
+        rows = self.tables[table]
+        params = request.url.params
+        method = request.method
+        prefer = request.headers.get("prefer", "")
+        if method == "GET":
+            result = [r for r in rows if _match_all(r, params)]
+            for spec in reversed(params.get_list("order")):
+                for part in reversed(spec.split(",")):
+                    col, _, direction = part.partition(".")
+                    desc = direction.startswith("desc")
+                    result.sort(key=lambda r: (r.get(col) is None, r.get(col) or ""), reverse=desc)
+            offset = int(params.get("offset", 0))
+            if "limit" in params:
+                result = result[offset:offset + int(params["limit"])]
+            elif offset:
+                result = result[offset:]
+            result = [_project(r, params.get("select", "*")) for r in result]
+            return _single_or_list(request, result)
+        if method == "POST":
+            body = json.loads(request.content or b"[]")
+            items = body if isinstance(body, list) else [body]
+            conflict = [c for c in params.get("on_conflict", "").split(",") if c]
+            out = []
+            for item in items:
+                item = dict(item)
+                if conflict or "resolution=" in prefer:
+                    keys = conflict or ["id"]
+                    existing = next((r for r in rows if all(str(r.get(k)) == str(item.get(k)) for k in keys)
+                                     and all(item.get(k) is not None for k in keys)), None)
+                    if existing is not None:
+                        if "ignore-duplicates" in prefer:
+                            continue
+                        existing.update(item)
+                        out.append(dict(existing))
+                        continue
+                item.setdefault("id", str(uuid.uuid4()))
+                item.setdefault("created_at", datetime.utcnow().isoformat())
+                rows.append(item)
+                out.append(dict(item))
+            return _single_or_list(request, out, status=201)
+        if method == "PATCH":
+            body = json.loads(request.content or b"{}")
+            out = []
+            for r in rows:
+                if _match_all(r, params):
+                    r.update(body)
+                    out.append(dict(r))
+            return _single_or_list(request, out)
+        if method == "DELETE":
+            keep, out = [], []
+            for r in rows:
+                (out if _match_all(r, params) else keep).append(r)
+            self.tables[table] = keep
+            return _single_or_list(request, out)
+        return httpx.Response(405)
+
+    # ---------------- Storage ----------------
+
+    def _storage(self, request: httpx.Request, path: str) -> httpx.Response:
+        method = request.method
+        if path == "object/move" and method == "POST":
+            body = json.loads(request.content)
+            src = (body["bucketId"], body["sourceKey"])
+            if src not in self.objects:
+                return httpx.Response(404, json={"statusCode": "404", "error": "not_found", "message": "Object not found"})
+            self.objects[(body["bucketId"], body["destinationKey"])] = self.objects.pop(src)
+            return httpx.Response(200, json={"message": "Successfully moved"})
+        if path == "object/copy" and method == "POST":
+            body = json.loads(request.content)
+            src = (body["bucketId"], body["sourceKey"])
+            if src not in self.objects:
+                return httpx.Response(404, json={"statusCode": "404", "error": "not_found", "message": "Object not found"})
+            dst = (body["bucketId"], body["destinationKey"])
+            if dst in self.objects:
+                return httpx.Response(400, json={"statusCode": "409", "error": "Duplicate", "message": "The resource already exists"})
+            self.objects[dst] = self.objects[src]
+            return httpx.Response(200, json={"Key": f"{body['bucketId']}/{body['destinationKey']}"})
+        if path.startswith("object/sign/") and method == "POST":
+            bucket, _, key = path[len("object/sign/"):].partition("/")
+            if (bucket, key) not in self.objects:
+                return httpx.Response(400, json={"statusCode": "404", "error": "not_found", "message": "Object not found"})
+            return httpx.Response(200, json={"signedURL": f"/object/sign/{bucket}/{key}?token=fake"})
+        if path.startswith("object/"):
+            rest = path[len("object/"):]
+            if method == "DELETE":
+                body = json.loads(request.content or b"{}")
+                bucket = rest
+                removed = [k for k in body.get("prefixes", []) if self.objects.pop((bucket, k), None) is not None]
+                return httpx.Response(200, json=[{"name": k} for k in removed])
+            bucket, _, key = rest.partition("/")
+            if method in ("POST", "PUT"):
+                if method == "POST" and (bucket, key) in self.objects and request.headers.get("x-upsert") != "true":
+                    return httpx.Response(400, json={"statusCode": "409", "error": "Duplicate", "message": "The resource already exists"})
+                self.objects[(bucket, key)] = _multipart_file(request)
+                return httpx.Response(200, json={"Key": f"{bucket}/{key}"})
+            if method in ("GET", "HEAD"):
+                data = self.objects.get((bucket, key))
+                if data is None:
+                    return httpx.Response(400, json={"statusCode": "404", "error": "not_found", "message": "Object not found"})
+                etag = f'"{uuid.uuid5(uuid.NAMESPACE_URL, f"{bucket}/{key}/{len(data)}").hex}"'
+                headers = {"content-type": "application/octet-stream", "etag": etag, "accept-ranges": "bytes"}
+                rng = request.headers.get("range")
+                if rng:
+                    m = re.match(r"bytes=(\d*)-(\d*)", rng)
+                    start = int(m.group(1)) if m.group(1) else max(len(data) - int(m.group(2)), 0)
+                    end = int(m.group(2)) if m.group(1) and m.group(2) else len(data) - 1
+                    end = min(end, len(data) - 1)
+                    headers["content-range"] = f"bytes {start}-{end}/{len(data)}"
+                    return httpx.Response(206, content=data[start:end + 1], headers=headers)
+                return httpx.Response(200, content=data, headers=headers)
+        return httpx.Response(404, json={"statusCode": "404", "error": "not_found", "message": path})
+
+
+class FakeOpenAI:
+    """Chat completions con respuesta fija, en JSON o en streaming SSE."""
+
+    def __init__(self, latency: float = 0.0, reply: str = "Respuesta simulada del asistente.",
+                 token_latency: float = 0.0, jitter: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.token_latency = token_latency
+        self.reply = reply
+        self.calls = 0
+        self.requests = []
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.calls += 1
+        await _sleep(self.latency, self.jitter)
+        body = json.loads(request.content)
+        self.requests.append(body)
+        model = body.get("model", "gpt-test")
+        if body.get("stream"):
+            return httpx.Response(200, headers={"content-type": "text/event-stream"},
+                                  content=self._stream(model))
+        return httpx.Response(200, json={
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": self.reply}}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 10, "total_tokens": 20},
+        })
+
+    async def _stream(self, model: str):
+        for word in self.reply.split(" "):
+            if self.token_latency:
+                await asyncio.sleep(self.token_latency)
+            chunk = {"id": "chatcmpl-stream", "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": model, "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}]}
+            yield f"data: {json.dumps(chunk)}\n\n".encode()
+        yield b"data: [DONE]\n\n"
+
+
+async def _sleep(latency: float, jitter: float):
+    delay = latency + (random.uniform(0, jitter) if jitter else 0.0)
+    if delay > 0:
+        await asyncio.sleep(delay)
+
+
+# ---------------- utilidades PostgREST ----------------
+
+def _split_top(expr: str) -> list[str]:
+    parts, depth, cur = [], 0, ""
+    for ch in expr:
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        if ch == "," and depth == 0:
+            parts.append(cur)
+            cur = ""
+        else:
+            cur += ch
+    if cur:
+        parts.append(cur)
+    return parts
+
+
+def _cmp(value, op: str, arg: str) -> bool:
+    if len(arg) >= 2 and arg[0] == arg[-1] == '"':
+        arg = arg[1:-1]
+    if op == "is":
+        return value is None if arg == "null" else str(value).lower() == arg
+    if value is None:
+        return False
+    sv = str(value)
+    if op == "eq":
+        return sv == arg
+    if op == "neq":
+        return sv != arg
+    if op in ("gt", "gte", "lt", "lte"):
+        a, b = (value, type(value)(arg)) if isinstance(value, (int, float)) else (sv, arg)
+        return {"gt": a > b, "gte": a >= b, "lt": a < b, "lte": a <= b}[op]
+    if op == "in":
+        return sv in [x.strip('"') for x in _split_top(arg.strip("()"))]
+    if op in ("like", "ilike"):
+        pattern = "^" + re.escape(arg).replace("%", ".*").replace(r"\*", ".*") + "$"
+        return re.match(pattern, sv, re.I if op == "ilike" else 0) is not None
+    raise ValueError(f"operador no soportado: {op}")
+
+
+def _match_cond(row: dict, cond: str) -> bool:
+    if cond.startswith("and(") or cond.startswith("or("):
+        kind, inner = cond.split("(", 1)
+        subs = [_match_cond(row, c) for c in _split_top(inner[:-1])]
+        return all(subs) if kind == "and" else any(subs)
+    col, op, arg = cond.split(".", 2)
+    neg = op == "not"
+    if neg:
+        op, arg = arg.split(".", 1)
+    res = _cmp(row.get(col), op, arg)
+    return not res if neg else res
+
+
+def _match_all(row: dict, params) -> bool:
+    for key, value in params.multi_items():
+        if key in ("select", "order", "limit", "offset", "on_conflict", "columns"):
+            continue
+        if key in ("or", "and"):
+            if not _match_cond(row, f"{key}{value}"):
+                return False
+            continue
+        if not _match_cond(row, f"{key}.{value}"):
+            return False
+    return True
+
+
+def _project(row: dict, select: str) -> dict:
+    cols = [c.strip() for c in select.split(",") if c.strip()]
+    if not cols or "*" in cols:
+        return dict(row)
+    return {c: row.get(c) for c in cols}
+
+
+def _single_or_list(request: httpx.Request, rows: list, status: int = 200) -> httpx.Response:
+    if "vnd.pgrst.object" in request.headers.get("accept", ""):
+        if len(rows) != 1:
+            return httpx.Response(406, json={
+                "code": "PGRST116", "details": f"The result contains {len(rows)} rows",
+                "hint": None, "message": "JSON object requested, multiple (or no) rows returned"})
+        return httpx.Response(status, json=rows[0])
+    return httpx.Response(status, json=rows)
+
+
+def _multipart_file(request: httpx.Request) -> bytes:
+    ctype = request.headers.get("content-type", "")
+    body = request.read()
+    if not ctype.startswith("multipart/"):
+        return body
+    msg = BytesParser(policy=email_policy).parsebytes(
+        f"Content-Type: {ctype}\r\n\r\n".encode() + body)
+    for part in msg.iter_parts():
+        if part.get_filename() is not None or part.get_param("name", header="content-disposition") == "file":
+            return part.get_payload(decode=True)
+    return b""
@@ -0,0 +1,26 @@
+"""
+Humo de los escenarios de `app.tests.bench`: cada uno corre con pocas
+peticiones contra los dobles locales y no debe devolver errores.
+"""
+import asyncio
+
+import pytest
+
+from app.tests import bench
+
+
+@pytest.mark.parametrize("scenario", list(bench._SCENARIOS))
+def test_scenario_runs_without_errors(scenario):
+    resultados = asyncio.run(bench.run([scenario], requests=6, concurrency=3, latency=0.001))
+    assert resultados
+    for r in resultados:
+        assert r["errores"] == 0, r
+        assert r["peticiones"] == 6
+        assert r["p50_ms"] <= r["p95_ms"] <= r["p99_ms"]
+
+
+def test_percentiles():
+    stats = bench.Stats("x", latencias=[i / 1000 for i in range(1, 101)])
+    assert stats.percentil(50) == pytest.approx(50)
+    assert stats.percentil(95) == pytest.approx(95)
+    assert stats.percentil(99) == pytest.approx(99)
@@ -0,0 +1,75 @@
+"""
+Llamada de alelos estrella con las tablas reales de `app/assets/pgx`:
+genotipo -> diplotipo -> fenotipo sobre un VCF de varias muestras.
+"""
+import io
+
+import pytest
+
+from app.utils.genotype_store import GenotypeStore, write_store
+from app.utils.star_alleles import INDETERMINADO, call_store
+from app.utils.vcf_parser import VcfReader
+
+# Columnas: CYP2D6 *1/*4 sin fase, CYP2D6 *4/*4, CYP2C19 *1/*2 sin fase,
+# CYP2C19 *2/*17 en fase y CYP2C19 con rs4244285 sin llamar
+_VCF = """##fileformat=VCFv4.2
+#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tS1\tS2\tS3\tS4\tS5
+10\t94761900\trs12248560\tC\tT\t.\tPASS\t.\tGT\t0/0\t0/0\t0/0\t0|1\t0/0
+10\t94781859\trs4244285\tG\tA\t.\tPASS\t.\tGT\t0/0\t0/0\t0/1\t1|0\t./.
+22\t42126611\trs1135840\tC\tG\t.\tPASS\t.\tGT\t0/1\t1/1\t0/0\t0/0\t0/0
+22\t42128945\trs3892097\tC\tT\t.\tPASS\t.\tGT\t0/1\t1/1\t0/0\t0/0\t0/0
+22\t42130692\trs1065852\tG\tA\t.\tPASS\t.\tGT\t0/1\t1/1\t0/0\t0/0\t0/0
+"""
+
+
+@pytest.fixture(scope="module")
+def llamadas(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("gt") / "cohorte.gt")
+    reader = VcfReader(io.BytesIO(_VCF.encode()))
+    write_store(reader, reader.samples, path)
+    with GenotypeStore(path) as store:
+        yield call_store(store)
+
+
+def test_heterocigoto_sin_fase(llamadas):
+    r = llamadas["S1"]["CYP2D6"]
+    assert r["diplotipo"] == "*1/*4"
+    assert r["exacto"] and r["alternativas"] == []
+    assert r["puntuacion_actividad"] == 1.0
+    assert r["fenotipo"] == "Metabolizador intermedio"
+
+    r = llamadas["S3"]["CYP2C19"]
+    assert r["diplotipo"] == "*1/*2"
+    assert r["fenotipo"] == "Metabolizador intermedio"
+
+
+def test_homocigoto(llamadas):
+    r = llamadas["S2"]["CYP2D6"]
+    assert r["diplotipo"] == "*4/*4"
+    assert r["puntuacion_actividad"] == 0.0
+    assert r["fenotipo"] == "Metabolizador lento"
+    # Sin variantes en el cromosoma 10 listadas para S2: referencia
+    assert llamadas["S2"]["CYP2C19"]["diplotipo"] == "*1/*1"
+
+
+def test_en_fase(llamadas):
+    r = llamadas["S4"]["CYP2C19"]
+    assert sorted(r["alelos"]) == ["*17", "*2"]
+    assert r["fenotipo"] == "Metabolizador intermedio"
+
+
+def test_sitio_sin_llamar(llamadas):
+    r = llamadas["S5"]["CYP2C19"]
+    assert r["sitios_no_llamados"] == ["rs4244285"]
+    # *1/*1 y *1/*2 encajan igual: no se decide el fenotipo
+    assert r["fenotipo"] == INDETERMINADO
+    assert r["puntuacion_actividad"] is None
+    assert {"Metabolizador normal", "Metabolizador intermedio"} <= set(r["fenotipos_posibles"])
+
+
+def test_cromosoma_sin_registros(llamadas):
+    # El VCF no trae el cromosoma 6 (TPMT): el gen queda sin cubrir
+    r = llamadas["S1"]["TPMT"]
+    assert r["diplotipo"] is None
+    assert r["fenotipo"] == INDETERMINADO
+    assert "cromosoma" in r["notas"]
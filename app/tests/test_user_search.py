@@ -0,0 +1,135 @@
+"""
+Índice de búsqueda de usuarios: normalización, prefijos, orden de los
+resultados y cambios que llegan mientras se recarga el índice.
+"""
+import asyncio
+
+import httpx
+
+from app.tests import bench  # noqa: F401  (configuración por defecto antes de importar la app)
+from app.db import supabase as supabase_module
+from app.services import user_search
+from app.services.user_search import UserSearchIndex, normalizar, trigramas
+from app.tests.fakes import FakeSupabase
+
+
+def _user(n: int, nombre: str, apellidos: str, email: str, rol: str = "paciente") -> dict:
+    return {"id": f"00000000-0000-0000-0000-{n:012d}", "nombre": nombre, "apellidos": apellidos,
+            "email": email, "rol": rol}
+
+
+def _index(*users: dict) -> UserSearchIndex:
+    index = UserSearchIndex(ttl=3600)
+    for user in users:
+        index.upsert(user)
+    return index
+
+
+def _nombres(resultados: list[dict]) -> list[str]:
+    return [f"{r['nombre']} {r['apellidos']}" for r in resultados]
+
+
+def test_normalizar():
+    assert normalizar("José  Núñez-Pérez") == "jose nunez perez"
+    assert normalizar("ANA.López@Correo.ES") == "ana lopez correo es"
+    assert normalizar(None) == ""
+
+
+def test_trigramas_con_prefijo():
+    assert trigramas("ana") == {"  a", " an", "ana", "na "}
+    # La última palabra de la consulta queda abierta
+    assert trigramas("ana", prefijo=True) == {"  a", " an", "ana"}
+    assert "na " in trigramas("ana mar", prefijo=True)
+
+
+def test_prefijo_encuentra_la_palabra():
+    index = _index(
+        _user(1, "María", "García", "mgarcia@correo.es"),
+        _user(2, "Pedro", "Sanz", "psanz@correo.es"),
+    )
+    assert _nombres(index._buscar("mar", 10, None)) == ["María García"]
+    assert _nombres(index._buscar("GARCÍA", 10, None)) == ["María García"]
+    assert index._buscar("zzz", 10, None) == []
+
+
+def test_orden_y_filtro_por_rol():
+    index = _index(
+        _user(1, "Ana", "López Martínez", "ana.lopez@correo.es"),
+        _user(2, "Ana", "Martínez López", "ana.martinez@correo.es"),
+        _user(3, "Anabel", "López Martínez Ruiz", "anabel@correo.es"),
+        _user(4, "Ana", "López Martínez", "ana.medica@correo.es", rol="medico"),
+    )
+    # Quien contiene la consulta tal cual va antes; a igualdad, el texto más corto
+    assert _nombres(index._buscar("ana lopez martinez", 3, None))[:2] == ["Ana López Martínez"] * 2
+    assert [r["email"] for r in index._buscar("ana lopez martinez", 10, "medico")] == ["ana.medica@correo.es"]
+
+
+def test_trigramas_comunes_y_tope_de_candidatos():
+    # Todos comparten `gmail com`: esos trigramas no filtran, pero el email
+    # exacto tiene que salir el primero aunque haya más usuarios que candidatos
+    users = [_user(n, f"Usuario{n}", "Pérez", f"usuario{n}@gmail.com") for n in range(3 * user_search._MAX_CANDIDATOS)]
+    index = _index(*users)
+    buscado = users[-1]
+    assert index._buscar(buscado["email"], 5, None)[0]["id"] == buscado["id"]
+    assert len(index._buscar("gmail", 5, None)) == 5
+    # El rol se filtra antes de recortar: el único médico no se pierde
+    index.upsert(_user(10**6, "Usuario", "Médico", "medico@gmail.com", rol="medico"))
+    assert [r["email"] for r in index._buscar("usuario", 5, "medico")] == ["medico@gmail.com"]
+
+
+def test_upsert_reemplaza_la_version_anterior():
+    index = _index(_user(1, "Ana", "López", "ana@correo.es"))
+    index.upsert({"id": _user(1, "", "", "")["id"], "apellidos": "Ruiz"})
+    assert index._buscar("lopez", 10, None) == []
+    [ana] = index._buscar("ana ruiz", 10, None)
+    assert ana["email"] == "ana@correo.es"  # lo que no trae el cambio se conserva
+    assert len(index) == 1
+
+
+class _SupabaseConCambios(FakeSupabase):
+    """Llama a `durante_warm` mientras se lee la segunda página de `users`."""
+
+    def __init__(self, durante_warm):
+        super().__init__()
+        self.durante_warm = durante_warm
+        self.paginas = 0
+
+    def _rest(self, request: httpx.Request, table: str) -> httpx.Response:
+        if table == "users" and request.method == "GET":
+            self.paginas += 1
+            if self.paginas == 2:
+                self.durante_warm()
+        return super()._rest(request, table)
+
+
+def test_upsert_durante_warm(monkeypatch):
+    monkeypatch.setattr(user_search, "_PAGE_SIZE", 2)
+    index = UserSearchIndex(ttl=3600)
+    renombrado = _user(1, "Zoe", "Castro", "zoe@correo.es")
+    nuevo = _user(9, "Íker", "Nuevo", "iker@correo.es")
+
+    def cambios():
+        # El usuario 1 ya se leyó en la primera página; el 9 aún no existe en la BD
+        index.upsert(renombrado)
+        index.upsert(nuevo)
+
+    fake = _SupabaseConCambios(cambios)
+    fake.tables["users"] += [_user(n, f"Nombre{n}", "Apellido", f"u{n}@correo.es") for n in range(1, 6)]
+
+    async def warm():
+        for service in ("supabase_rest", "supabase_storage"):
+            supabase_module.override_transport(service, fake.transport())
+        await supabase_module.supabase.open()
+        try:
+            await index.warm()
+        finally:
+            await supabase_module.supabase.close()
+            for service in ("supabase_rest", "supabase_storage"):
+                supabase_module.override_transport(service, None)
+
+    asyncio.run(warm())
+    assert fake.paginas >= 2
+    assert _nombres(index._buscar("zoe", 10, None)) == ["Zoe Castro"]
+    assert renombrado["id"] not in [r["id"] for r in index._buscar("nombre1", 10, None)]
+    assert _nombres(index._buscar("iker", 10, None)) == ["Íker Nuevo"]
+    assert len(index) == 6
@@ -0,0 +1,367 @@
+"""
+Almacén columnar y binario de genotipos, derivado de un VCF.
+
+Por cromosoma guarda columnas de enteros: posición, códigos de alelo REF y
+ALT (índices en un diccionario de alelos), número de rsID y un byte de
+genotipo por muestra, más un índice ordenado de rsIDs. Las columnas van
+alineadas y en little-endian, así que el lector hace `mmap` del archivo y
+las usa sin copiarlas (`memoryview.cast`): buscar una posición o un rsID
+es una búsqueda binaria que solo toca unas pocas páginas.
+
+Formato: `MAGIC`, los segmentos (uno por tramo contiguo de cromosoma), un
+pie JSON con las muestras, el diccionario de alelos y la posición de cada
+columna, y al final el offset del pie (u64) y de nuevo `MAGIC`.
+
+Solo se guardan rsIDs (`rs<n>`); otros identificadores del VCF se pierden.
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Iterable, Iterator, Optional
+
+from app.utils.vcf_parser import VcfRecord
+
+MAGIC = b"NPGTS\x00\x00\x01"
+VERSION = 1
+_ALIGN = 8
+_TRAILER = struct.Struct("<Q8s")
+
+# Byte de genotipo: bits 0-2 alelo 1, bits 3-5 alelo 2 (7 = no llamado),
+# bit 6 fase ("|"), bit 7 haploide (solo alelo 1)
+_NO_LLAMADO = 7
+_FASE = 0x40
+_HAPLOIDE = 0x80
+
+# Byte de genotipo -> 1 si tiene algún alelo alternativo llamado
+_ES_VARIANTE = bytes(
+    int((c & 7) not in (0, _NO_LLAMADO) or (not c & _HAPLOIDE and (c >> 3) & 7 not in (0, _NO_LLAMADO)))
+    for c in range(256)
+)
+
+def encode_gt(gt: Optional[str]) -> int:
+    if not gt or gt == ".":
+        return _HAPLOIDE | _NO_LLAMADO
+    fase = "|" in gt
+    alelos = gt.replace("|", "/").split("/")
+
+    def codigo(a: str) -> int:
+        # Índices de alelo > 6 no caben en 3 bits: se guardan como no llamados
+        return int(a) if a.isdigit() and int(a) < _NO_LLAMADO else _NO_LLAMADO
+
+    if len(alelos) == 1:
+        return _HAPLOIDE | codigo(alelos[0])
+    return codigo(alelos[0]) | (codigo(alelos[1]) << 3) | (_FASE if fase else 0)
+
+
+def decode_gt(code: int) -> str:
+    a1 = code & 0x7
+    s1 = "." if a1 == _NO_LLAMADO else str(a1)
+    if code & _HAPLOIDE:
+        return s1
+    a2 = (code >> 3) & 0x7
+    s2 = "." if a2 == _NO_LLAMADO else str(a2)
+    return f"{s1}{'|' if code & _FASE else '/'}{s2}"
+
+
+class _CodigosGT(dict):
+    # GT -> byte, memoizado: en un VCF hay pocos GT distintos ("0/0", "0|1"...)
+    def __missing__(self, gt):
+        code = self[gt] = encode_gt(gt)
+        return code
+
+
+def rsid_number(rsid) -> int:
+    """`rs1799853` -> 1799853; 0 si no es un rsID."""
+    if isinstance(rsid, int):
+        return rsid
+    if not rsid:
+        return 0
+    rsid = str(rsid).strip().lower()
+    if rsid.startswith("rs") and rsid[2:].isdigit():
+        n = int(rsid[2:])
+        return n if n < 1 << 32 else 0
+    return 0
+
+
+def chrom_key(chrom: str) -> str:
+    """Nombre de cromosoma normalizado: `chr10` y `10` son el mismo."""
+    c = chrom.strip()
+    if c[:3].lower() == "chr":
+        c = c[3:]
+    c = c.upper()
+    return "MT" if c == "M" else c
+
+
+def _little(values: array) -> bytes:
+    if sys.byteorder != "little":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+class GenotypeStoreWriter:
+    """
+    Escribe el almacén en streaming: `add(rec)` registro a registro (o
+    `tee(records)` para ir añadiendo mientras otro consumidor los recorre).
+    En memoria solo se acumula el cromosoma en curso.
+    """
+
+    def __init__(self, path: str, samples: Iterable[str]):
+        self.path = path
+        self.samples = list(samples)
+        self._f = open(path, "wb")
+        self._f.write(MAGIC)
+        self._alelos: dict[str, int] = {}
+        self._codigos = _CodigosGT()
+        self._segmentos: list[dict] = []
+        self._total = 0
+        self._chrom: Optional[str] = None
+        self._reset()
+
+    def _reset(self):
+        self._pos = array("I")
+        self._ref = array("I")
+        self._alt = array("I")
+        self._rsid = array("I")
+        self._gt = bytearray()
+
+    def _alelo(self, value: str) -> int:
+        code = self._alelos.get(value)
+        if code is None:
+            code = self._alelos[value] = len(self._alelos)
+        return code
+
+    def add(self, rec: VcfRecord) -> None:
+        if rec.chrom != self._chrom:
+            self._flush()
+            self._chrom = rec.chrom
+        self._pos.append(rec.pos)
+        self._ref.append(self._alelo(rec.ref))
+        self._alt.append(self._alelo(",".join(rec.alt)))
+        self._rsid.append(rsid_number(rec.id))
+        n = len(self.samples)
+        gts = rec.gts[:n] + (None,) * (n - len(rec.gts))
+        self._gt.extend(map(self._codigos.__getitem__, gts))
+        self._total += 1
+
+    def tee(self, records: Iterable[VcfRecord]) -> Iterator[VcfRecord]:
+        for rec in records:
+            self.add(rec)
+            yield rec
+
+    def _write(self, data: bytes) -> list[int]:
+        offset = self._f.tell()
+        pad = -offset % _ALIGN
+        if pad:
+            self._f.write(b"\x00" * pad)
+            offset += pad
+        self._f.write(data)
+        return [offset, len(data)]
+
+    def _flush(self):
+        n = len(self._pos)
+        if not n:
+            return
+        if any(self._pos[i] > self._pos[i + 1] for i in range(n - 1)):
+            # VCF sin ordenar dentro del cromosoma: se ordena el segmento
+            orden = sorted(range(n), key=self._pos.__getitem__)
+            ns = len(self.samples)
+            self._pos, self._ref, self._alt, self._rsid = (
+                array("I", (col[i] for i in orden)) for col in (self._pos, self._ref, self._alt, self._rsid)
+            )
+            self._gt = bytearray(b"".join(bytes(self._gt[i * ns:(i + 1) * ns]) for i in orden))
+        por_rsid = sorted((r, i) for i, r in enumerate(self._rsid) if r)
+        self._segmentos.append({
+            "chrom": self._chrom,
+            "n": n,
+            "columns": {
+                "pos": self._write(_little(self._pos)),
+                "ref": self._write(_little(self._ref)),
+                "alt": self._write(_little(self._alt)),
+                "rsid": self._write(_little(self._rsid)),
+                "gt": self._write(bytes(self._gt)),
+                "rsid_sorted": self._write(_little(array("I", (r for r, _ in por_rsid)))),
+                "rsid_rows": self._write(_little(array("I", (i for _, i in por_rsid)))),
+            },
+        })
+        self._reset()
+
+    def close(self) -> None:
+        if self._f.closed:
+            return
+        self._flush()
+        pie = json.dumps({
+            "version": VERSION,
+            "samples": self.samples,
+            "records": self._total,
+            "alleles": list(self._alelos),
+            "segments": self._segmentos,
+        }, separators=(",", ":")).encode()
+        offset = self._f.tell()
+        self._f.write(pie)
+        self._f.write(_TRAILER.pack(offset, MAGIC))
+        self._f.close()
+
+    def __enter__(self) -> "GenotypeStoreWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+            return
+        self._f.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def write_store(records: Iterable[VcfRecord], samples: Iterable[str], path: str) -> None:
+    with GenotypeStoreWriter(path, samples) as writer:
+        for rec in records:
+            writer.add(rec)
+
+
+class _Segmento:
+    def __init__(self, buf: memoryview, meta: dict, n_samples: int):
+        self.chrom = meta["chrom"]
+        self.n = meta["n"]
+        self.n_samples = n_samples
+        cols = meta["columns"]
+
+        def col(name: str, fmt: str):
+            offset, size = cols[name]
+            return buf[offset:offset + size].cast(fmt)
+
+        self.pos = col("pos", "I")
+        self.ref = col("ref", "I")
+        self.alt = col("alt", "I")
+        self.rsid = col("rsid", "I")
+        self.gt = col("gt", "B")
+        self.rsid_sorted = col("rsid_sorted", "I")
+        self.rsid_rows = col("rsid_rows", "I")
+
+    def release(self):
+        for view in (self.pos, self.ref, self.alt, self.rsid, self.gt, self.rsid_sorted, self.rsid_rows):
+            view.release()
+
+
+class GenotypeStore:
+    """Lector por `mmap`; las consultas devuelven `VcfRecord`."""
+
+    def __init__(self, path: str):
+        if sys.byteorder != "little":
+            raise RuntimeError("El almacén de genotipos solo se lee en plataformas little-endian")
+        self.path = path
+        self._segmentos: list[_Segmento] = []
+        self._buf: Optional[memoryview] = None
+        self._file = open(path, "rb")
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError("Almacén de genotipos vacío")
+        if len(self._mm) < len(MAGIC) + _TRAILER.size or self._mm[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError("No es un almacén de genotipos")
+        offset, magic = _TRAILER.unpack(self._mm[-_TRAILER.size:])
+        if magic != MAGIC:
+            self.close()
+            raise ValueError("Almacén de genotipos incompleto")
+        pie = json.loads(self._mm[offset:len(self._mm) - _TRAILER.size])
+        if pie["version"] != VERSION:
+            self.close()
+            raise ValueError(f"Versión de almacén no soportada: {pie['version']}")
+        self.samples: list[str] = pie["samples"]
+        self.records: int = pie["records"]
+        self._alelos: list[str] = pie["alleles"]
+        self._buf = memoryview(self._mm)
+        self._segmentos = [_Segmento(self._buf, s, len(self.samples)) for s in pie["segments"]]
+        self._por_chrom: dict[str, list[_Segmento]] = {}
+        for seg in self._segmentos:
+            self._por_chrom.setdefault(chrom_key(seg.chrom), []).append(seg)
+
+    @property
+    def chromosomes(self) -> list[str]:
+        return list(dict.fromkeys(seg.chrom for seg in self._segmentos))
+
+    def __len__(self) -> int:
+        return self.records
+
+    def _record(self, seg: _Segmento, i: int) -> VcfRecord:
+        alt = self._alelos[seg.alt[i]]
+        rsid = seg.rsid[i]
+        ns = seg.n_samples
+        return VcfRecord(
+            chrom=seg.chrom,
+            pos=seg.pos[i],
+            id=f"rs{rsid}" if rsid else None,
+            ref=self._alelos[seg.ref[i]],
+            alt=tuple(alt.split(",")) if alt else (),
+            gts=tuple(decode_gt(c) for c in seg.gt[i * ns:(i + 1) * ns]),
+        )
+
+    def lookup(self, chrom: str, pos: int) -> list[VcfRecord]:
+        """Registros en `chrom:pos` (puede haber varios, p. ej. SNV e indel)."""
+        return list(self.region(chrom, pos, pos))
+
+    def region(self, chrom: str, start: int, end: int) -> Iterator[VcfRecord]:
+        """Registros con `start <= pos <= end`, en orden de posición."""
+        for seg in self._por_chrom.get(chrom_key(chrom), []):
+            i = bisect_left(seg.pos, start)
+            j = bisect_right(seg.pos, end)
+            for k in range(i, j):
+                yield self._record(seg, k)
+
+    def by_rsid(self, rsid) -> list[VcfRecord]:
+        n = rsid_number(rsid)
+        if not n:
+            return []
+        out = []
+        for seg in self._segmentos:
+            i = bisect_left(seg.rsid_sorted, n)
+            while i < len(seg.rsid_sorted) and seg.rsid_sorted[i] == n:
+                out.append(self._record(seg, seg.rsid_rows[i]))
+                i += 1
+        return out
+
+    def variant_counts(self) -> list[int]:
+        """
+        Registros con algún alelo alternativo, por muestra. Trabaja sobre la
+        matriz de genotipos de cada segmento entera (`translate` + conteo por
+        columna), sin decodificar registros.
+        """
+        ns = len(self.samples)
+        cuentas = [0] * ns
+        for seg in self._segmentos:
+            marcas = seg.gt.tobytes().translate(_ES_VARIANTE)
+            for s in range(ns):
+                cuentas[s] += marcas[s::ns].count(1)
+        return cuentas
+
+    def iter_records(self) -> Iterator[VcfRecord]:
+        for seg in self._segmentos:
+            for i in range(seg.n):
+                yield self._record(seg, i)
+
+    def close(self) -> None:
+        # Las vistas exportadas impiden cerrar el mmap: primero se liberan
+        for seg in self._segmentos:
+            seg.release()
+        self._segmentos = []
+        self._por_chrom = {}
+        if self._buf is not None:
+            self._buf.release()
+            self._buf = None
+        self._mm.close()
+        self._file.close()
+
+    def __enter__(self) -> "GenotypeStore":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
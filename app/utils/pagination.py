@@ -0,0 +1,88 @@
+"""
+Paginación por cursor (keyset) para los listados.
+
+Los listados se ordenan por una columna de fecha descendente con `id` como
+desempate, y cada página se pide con un filtro "después de la última fila
+vista" en vez de un OFFSET, así que el coste por página no crece con la
+tabla. El cursor es opaco (JSON en base64url) y va en la cabecera
+`X-Next-Cursor`; si no viene, no hay más páginas.
+"""
+import base64
+import binascii
+import json
+from typing import Any, NamedTuple, Optional
+
+from fastapi import HTTPException, Query, Response
+
+from app.core.config import settings
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class PageParams(NamedTuple):
+    limit: int
+    cursor: Optional[str]
+
+
+class Page(NamedTuple):
+    items: list[dict]
+    next_cursor: Optional[str]
+
+
+def page_params(
+    limit: int = Query(settings.PAGE_SIZE_DEFAULT, ge=1, le=settings.PAGE_SIZE_MAX, description="Tamaño de página"),
+    cursor: Optional[str] = Query(None, description=f"Valor de la cabecera {NEXT_CURSOR_HEADER} de la página anterior"),
+) -> PageParams:
+    """Dependencia FastAPI con los parámetros de paginación."""
+    return PageParams(limit, cursor)
+
+
+def encode_cursor(order: str, value: Any, id: Any) -> str:
+    raw = json.dumps({"o": order, "v": value, "id": str(id)}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, order: str) -> tuple[Any, str]:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if data["o"] != order:
+            raise ValueError(order)
+        return data["v"], data["id"]
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor de paginación inválido")
+
+
+def _quote(value: Any) -> str:
+    # Los valores con caracteres reservados (`,` `.` `:` `()`) van entre comillas
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _after(order: str, value: Any, id: str, tie: str) -> str:
+    # Orden descendente, nulos primero (por defecto en Postgres con DESC)
+    if value is None:
+        return f"and({order}.is.null,{tie}.lt.{_quote(id)}),{order}.not.is.null"
+    return f"{order}.lt.{_quote(value)},and({order}.eq.{_quote(value)},{tie}.lt.{_quote(id)})"
+
+
+async def paginate(query, page: PageParams, order: str, tie: str = "id") -> Page:
+    """
+    Ejecuta `query` (un select de postgrest sin ordenar) devolviendo una página
+    ordenada por `order` descendente y `tie` como desempate.
+    """
+    if page.cursor:
+        value, id = decode_cursor(page.cursor, order)
+        query = query.or_(_after(order, value, id, tie))
+    # Un único parámetro `order` con las dos columnas
+    rows = (await query.order(f"{order}.desc,{tie}", desc=True).limit(page.limit + 1).execute()).data or []
+    if len(rows) <= page.limit:
+        return Page(rows, None)
+    rows = rows[:page.limit]
+    last = rows[-1]
+    return Page(rows, encode_cursor(order, last.get(order), last[tie]))
+
+
+def with_cursor(response: Response, page: Page) -> list[dict]:
+    """Pone la cabecera del cursor siguiente y devuelve los elementos."""
+    if page.next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = page.next_cursor
+    return page.items
@@ -0,0 +1,47 @@
+"""
+Respuestas Server-Sent Events para los endpoints de chat en streaming.
+"""
+import json
+import logging
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+from fastapi.responses import StreamingResponse
+
+logger = logging.getLogger(__name__)
+
+
+def _event(data: dict, event: Optional[str] = None) -> str:
+    head = f"event: {event}\n" if event else ""
+    return f"{head}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def sse_response(tokens: AsyncIterator[str],
+                 on_complete: Optional[Callable[[str], Awaitable[None]]] = None) -> StreamingResponse:
+    """
+    Reenvía cada fragmento como `data: {"delta": ...}` y cierra con un evento
+    `done` con la respuesta completa. `on_complete` recibe el texto final una
+    vez terminado el stream (p. ej. para guardar el historial de chat).
+    """
+    async def body():
+        partes = []
+        try:
+            async for delta in tokens:
+                partes.append(delta)
+                yield _event({"delta": delta})
+        except Exception as e:
+            yield _event({"detail": f"Error IA: {e}"}, event="error")
+            return
+        respuesta = "".join(partes).strip()
+        if on_complete:
+            # El cliente ya tiene la respuesta entera: si falla el guardado, se avisa en el log
+            try:
+                await on_complete(respuesta)
+            except Exception:
+                logger.exception("no se pudo completar el stream (on_complete)")
+        yield _event({"respuesta": respuesta}, event="done")
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,226 @@
+"""
+Alelos estrella, diplotipo y fenotipo de los farmacogenes principales.
+
+Las definiciones de alelos están en `app/assets/pgx/<GEN>.json`, una tabla
+versionada por gen: sitios (rsID, posición GRCh38, REF/ALT en la hebra +),
+alelos con su función y valor de actividad, y la regla de fenotipo (rangos
+de puntuación de actividad o pares de funciones).
+
+Cada alelo se codifica como máscara de bits sobre los sitios del gen y el
+genotipo de la muestra como dos máscaras (heterocigoto y homocigoto
+alternativo). Comparar un par de alelos con el genotipo es un AND/XOR de
+enteros más un popcount, para todos los sitios a la vez: probar todos los
+pares de la tabla cuesta microsegundos.
+
+Los sitios que no aparecen en el VCF se dan por referencia (los VCF de un
+paciente suelen listar solo variantes), salvo que el VCF no tenga ningún
+registro en ese cromosoma: entonces el gen queda sin cubrir.
+"""
+import json
+import os
+from functools import lru_cache
+from typing import Iterable, NamedTuple, Optional
+
+from app.utils.genotype_store import GenotypeStore, chrom_key
+from app.utils.vcf_parser import VcfRecord
+
+TABLES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "assets", "pgx")
+
+INDETERMINADO = "Indeterminado"
+
+
+class Sitio(NamedTuple):
+    rsid: str
+    pos: int
+    ref: str
+    alt: str
+
+
+class Alelo(NamedTuple):
+    nombre: str
+    funcion: str
+    actividad: Optional[float]
+    mascara: int
+
+
+class Genotipo(NamedTuple):
+    het: int
+    hom: int
+    llamados: int  # sitios con genotipo (o ausentes del VCF, tomados como referencia)
+    hap1: Optional[int]  # máscaras por haplotipo si todos los sitios variantes están en fase
+    hap2: Optional[int]
+
+
+class GeneTable:
+    def __init__(self, data: dict):
+        self.gen: str = data["gen"]
+        self.version: str = data["version"]
+        self.ensamblaje: str = data.get("ensamblaje", "GRCh38")
+        self.cromosoma: str = data["cromosoma"]
+        self.notas: Optional[str] = data.get("notas")
+        self.fenotipo: dict = data["fenotipo"]
+        self.sitios = [Sitio(s["rsid"], s["pos"], s["ref"], s["alt"]) for s in data["sitios"]]
+        indice = {s.rsid: i for i, s in enumerate(self.sitios)}
+        self.alelos: list[Alelo] = []
+        for a in data["alelos"]:
+            faltan = [rs for rs in a["variantes"] if rs not in indice]
+            if faltan:
+                raise ValueError(f"{self.gen} {a['nombre']}: sitios sin definir {faltan}")
+            mascara = sum(1 << indice[rs] for rs in a["variantes"])
+            self.alelos.append(Alelo(a["nombre"], a["funcion"], a.get("actividad"), mascara))
+        # Todos los pares (i <= j), con lo que su suma aporta en cada sitio:
+        # AND = sitios con dos copias, XOR = sitios con una
+        n = len(self.alelos)
+        self._pares = [
+            (i, j, self.alelos[i].mascara & self.alelos[j].mascara, self.alelos[i].mascara ^ self.alelos[j].mascara)
+            for i in range(n) for j in range(i, n)
+        ]
+
+    def diplotipos(self, g: Genotipo) -> tuple[int, list[tuple[int, int]]]:
+        """Pares de alelos con menos discrepancias (número de sitios) con `g`."""
+        mejor, candidatos = None, []
+        for i, j, dos, una in self._pares:
+            errores = (((dos ^ g.hom) | (una ^ g.het)) & g.llamados).bit_count()
+            if mejor is None or errores < mejor:
+                mejor, candidatos = errores, [(i, j)]
+            elif errores == mejor:
+                candidatos.append((i, j))
+        if g.hap1 is not None and len(candidatos) > 1:
+            # Con fase, solo valen los pares que reproducen cada haplotipo
+            en_fase = [
+                (i, j) for i, j in candidatos
+                if {self.alelos[i].mascara & g.llamados, self.alelos[j].mascara & g.llamados} == {g.hap1, g.hap2}
+            ]
+            candidatos = en_fase or candidatos
+        return mejor, candidatos
+
+    def fenotipo_de(self, a: Alelo, b: Alelo) -> tuple[Optional[float], str]:
+        if self.fenotipo["tipo"] == "actividad":
+            actividad = a.actividad + b.actividad
+            for rango in self.fenotipo["rangos"]:
+                if rango["min"] <= actividad <= rango["max"]:
+                    return actividad, rango["fenotipo"]
+            return actividad, INDETERMINADO
+        funciones = sorted((a.funcion, b.funcion))
+        for regla in self.fenotipo["reglas"]:
+            if sorted(regla["funciones"]) == funciones:
+                return None, regla["fenotipo"]
+        return None, INDETERMINADO
+
+
+@lru_cache(maxsize=1)
+def load_tables(directory: str = TABLES_DIR) -> tuple[GeneTable, ...]:
+    tablas = []
+    for nombre in sorted(os.listdir(directory)):
+        if nombre.endswith(".json"):
+            with open(os.path.join(directory, nombre), encoding="utf-8") as f:
+                tablas.append(GeneTable(json.load(f)))
+    return tuple(tablas)
+
+
+def _registro(store: GenotypeStore, tabla: GeneTable, sitio: Sitio) -> Optional[VcfRecord]:
+    # Primero por rsID; si el VCF no trae IDs, por posición y alelos
+    for candidatos in (store.by_rsid(sitio.rsid), store.lookup(tabla.cromosoma, sitio.pos)):
+        for rec in candidatos:
+            if chrom_key(rec.chrom) == chrom_key(tabla.cromosoma) and rec.ref == sitio.ref and sitio.alt in rec.alt:
+                return rec
+    return None
+
+
+def _copias(gt: str, alt_index: str) -> Optional[tuple[int, int, bool]]:
+    """(alelo 1 es ALT, alelo 2 es ALT, en fase) o None si no está llamado."""
+    alelos = gt.replace("|", "/").split("/")
+    if len(alelos) != 2 or "." in alelos:
+        return None
+    return int(alelos[0] == alt_index), int(alelos[1] == alt_index), "|" in gt
+
+
+def _genotipo(tabla: GeneTable, registros: list[Optional[VcfRecord]], muestra: int,
+              no_llamados: list[str]) -> Genotipo:
+    het = hom = llamados = hap1 = hap2 = 0
+    en_fase = True
+    for k, (sitio, rec) in enumerate(zip(tabla.sitios, registros)):
+        bit = 1 << k
+        if rec is None:
+            llamados |= bit
+            continue
+        copias = _copias(rec.gts[muestra] if muestra < len(rec.gts) else ".", str(rec.alt.index(sitio.alt) + 1))
+        if copias is None:
+            no_llamados.append(sitio.rsid)
+            continue
+        a1, a2, fase = copias
+        llamados |= bit
+        if a1 and a2:
+            hom |= bit
+        elif a1 or a2:
+            het |= bit
+            en_fase = en_fase and fase
+        hap1 |= bit * a1
+        hap2 |= bit * a2
+    if not en_fase:
+        hap1 = hap2 = None
+    return Genotipo(het, hom, llamados, hap1, hap2)
+
+
+def _resultado(tabla: GeneTable, registros: list[Optional[VcfRecord]], muestra: int, cubierto: bool) -> dict:
+    resultado = {
+        "gen": tabla.gen,
+        "diplotipo": None,
+        "alelos": [],
+        "funciones": [],
+        "puntuacion_actividad": None,
+        "fenotipo": INDETERMINADO,
+        "exacto": False,
+        "alternativas": [],
+        "sitios_no_llamados": [],
+        "sitios_ausentes": [s.rsid for s, rec in zip(tabla.sitios, registros) if rec is None],
+        "version_tabla": tabla.version,
+    }
+    if tabla.notas:
+        resultado["notas"] = tabla.notas
+    if not cubierto:
+        resultado["notas"] = f"El VCF no tiene registros en el cromosoma {tabla.cromosoma}"
+        return resultado
+
+    g = _genotipo(tabla, registros, muestra, resultado["sitios_no_llamados"])
+    if not g.llamados:
+        return resultado
+    errores, candidatos = tabla.diplotipos(g)
+    a, b = (tabla.alelos[x] for x in candidatos[0])
+    resultado.update(
+        diplotipo=f"{a.nombre}/{b.nombre}",
+        alelos=[a.nombre, b.nombre],
+        funciones=[a.funcion, b.funcion],
+        exacto=errores == 0,
+        alternativas=[f"{tabla.alelos[i].nombre}/{tabla.alelos[j].nombre}" for i, j in candidatos[1:]],
+    )
+    if errores:
+        return resultado
+    resultado["puntuacion_actividad"], resultado["fenotipo"] = tabla.fenotipo_de(a, b)
+    posibles = list(dict.fromkeys(tabla.fenotipo_de(tabla.alelos[i], tabla.alelos[j])[1] for i, j in candidatos))
+    if len(posibles) > 1:
+        if resultado["sitios_no_llamados"]:
+            # La ambigüedad viene de sitios sin llamar: no se puede decidir
+            resultado["puntuacion_actividad"], resultado["fenotipo"] = None, INDETERMINADO
+        # Si solo falta la fase, se da el diplotipo más frecuente (orden de la tabla)
+        resultado["fenotipos_posibles"] = posibles
+    return resultado
+
+
+def call_store(store: GenotypeStore, muestras: Optional[Iterable[int]] = None,
+               tablas: Optional[Iterable[GeneTable]] = None) -> dict[str, dict[str, dict]]:
+    """
+    `{muestra: {gen: resultado}}` para las muestras indicadas (todas por
+    defecto). Los registros de cada sitio se buscan una sola vez.
+    """
+    tablas = load_tables() if tablas is None else tablas
+    muestras = range(len(store.samples)) if muestras is None else muestras
+    cromosomas = {chrom_key(c) for c in store.chromosomes}
+    por_gen = [
+        (t, [_registro(store, t, s) for s in t.sitios], chrom_key(t.cromosoma) in cromosomas)
+        for t in tablas
+    ]
+    return {
+        store.samples[m]: {t.gen: _resultado(t, registros, m, cubierto) for t, registros, cubierto in por_gen}
+        for m in muestras
+    }
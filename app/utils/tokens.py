@@ -0,0 +1,81 @@
+"""
+Conteo y recorte de tokens para ajustar prompts a un presupuesto.
+
+Usa tiktoken con la codificación del modelo. Si la codificación no se puede
+cargar (p. ej. sin red para descargarla), recurre a una aproximación
+conservadora: fragmentos de como mucho 4 caracteres.
+"""
+import logging
+import re
+from functools import lru_cache
+
+import tiktoken
+
+logger = logging.getLogger(__name__)
+
+_APPROX = re.compile(r"\s*\S{1,4}|\s+")
+
+
+class _ApproxEncoding:
+    name = "approx"
+
+    def encode(self, text: str) -> list[str]:
+        return _APPROX.findall(text)
+
+    def decode(self, tokens: list[str]) -> str:
+        return "".join(tokens)
+
+
+@lru_cache(maxsize=16)
+def get_encoding(model: str):
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            # Modelo que tiktoken no conoce: la codificación de los modelos actuales
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning("No se pudo cargar la codificación de %s (%s); se usa conteo aproximado", model, e)
+        return _ApproxEncoding()
+
+
+def count_tokens(text: str, model: str) -> int:
+    return len(get_encoding(model).encode(text))
+
+
+def truncate_tokens(text: str, max_tokens: int, model: str) -> str:
+    enc = get_encoding(model)
+    tokens = enc.encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    # Recodificar un prefijo puede dar un token más en el corte; se ajusta
+    n = max(max_tokens, 0)
+    out = enc.decode(tokens[:n])
+    while n > 0 and len(enc.encode(out)) > max_tokens:
+        n -= 1
+        out = enc.decode(tokens[:n])
+    return out
+
+
+def fit_sections(sections: list[str], budget: int, model: str, separator: str = "\n") -> str:
+    """
+    Concatena secciones por orden de prioridad sin pasar de `budget` tokens;
+    la primera que no cabe entera se recorta y las siguientes se descartan.
+    """
+    enc = get_encoding(model)
+    sep_tokens = len(enc.encode(separator))
+    out: list[str] = []
+    restante = budget
+    for section in sections:
+        if not section:
+            continue
+        cost = len(enc.encode(section)) + (sep_tokens if out else 0)
+        if cost <= restante:
+            out.append(section)
+            restante -= cost
+            continue
+        disponible = restante - (sep_tokens if out else 0)
+        if disponible > 0:
+            out.append(truncate_tokens(section, disponible, model))
+        break
+    return separator.join(out)
@@ -0,0 +1,205 @@
+"""
+Parser de VCF en streaming.
+
+Lee archivos VCF planos o comprimidos (gzip / bgzip) por bloques de tamaño
+fijo y va devolviendo registros tipados, así que un VCF de genoma completo se
+procesa con memoria constante.
+"""
+import hashlib
+import zlib
+from typing import BinaryIO, Iterable, Iterator, NamedTuple, Optional
+
+DEFAULT_CHUNK_SIZE = 1 << 20  # 1 MiB
+
+_GZIP_MAGIC = b"\x1f\x8b"
+_MISSING = "."
+
+
+class VcfRecord(NamedTuple):
+    chrom: str
+    pos: int
+    id: Optional[str]
+    ref: str
+    alt: tuple[str, ...]
+    gts: tuple[str, ...]  # GT de cada muestra, en el orden de la cabecera
+
+    @property
+    def gt(self) -> Optional[str]:
+        """GT de la primera muestra (VCF de un solo paciente)."""
+        return self.gts[0] if self.gts else None
+
+
+class VcfFormatError(ValueError):
+    pass
+
+
+class HashingReader:
+    """Envuelve un stream binario y calcula su SHA-256 a medida que se lee."""
+
+    def __init__(self, stream: BinaryIO):
+        self._stream = stream
+        self._sha = hashlib.sha256()
+        self.size = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._stream.read(size)
+        self._sha.update(data)
+        self.size += len(data)
+        return data
+
+    def hexdigest(self) -> str:
+        return self._sha.hexdigest()
+
+
+def _iter_chunks(stream: BinaryIO, chunk_size: int) -> Iterator[bytes]:
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _decompress(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    # bgzip es una concatenación de miembros gzip: al terminar uno se
+    # arranca un descompresor nuevo con los bytes sobrantes.
+    decomp = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        while chunk:
+            out = decomp.decompress(chunk)
+            if out:
+                yield out
+            if not decomp.eof:
+                break
+            chunk = decomp.unused_data
+            decomp = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    tail = decomp.flush()
+    if tail:
+        yield tail
+
+
+def iter_lines(stream: BinaryIO, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[str]:
+    """Devuelve las líneas (sin salto de línea) de un VCF plano o gzip/bgzip."""
+    chunks = _iter_chunks(stream, chunk_size)
+    first = next(chunks, b"")
+    if not first:
+        return
+
+    def _all() -> Iterator[bytes]:
+        yield first
+        yield from chunks
+
+    data = _decompress(_all()) if first[:2] == _GZIP_MAGIC else _all()
+
+    pending = b""
+    for block in data:
+        block = pending + block
+        lines = block.split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line.rstrip(b"\r").decode("utf-8", errors="ignore")
+    if pending:
+        yield pending.rstrip(b"\r").decode("utf-8", errors="ignore")
+
+
+def _parse_gts(fields: list[str]) -> tuple[str, ...]:
+    # fields = FORMAT + columnas de muestra
+    if len(fields) < 2:
+        return ()
+    keys = fields[0].split(":")
+    if "GT" not in keys:
+        return tuple(_MISSING for _ in fields[1:])
+    idx = keys.index("GT")
+    gts = []
+    for sample in fields[1:]:
+        values = sample.split(":")
+        gts.append(values[idx] if idx < len(values) else _MISSING)
+    return tuple(gts)
+
+
+class VcfReader:
+    """
+    Lector de VCF por bloques.
+
+    La cabecera se consume al crear el lector (`meta`, `samples`); iterar el
+    objeto devuelve los registros uno a uno sin cargar el archivo en memoria.
+    """
+
+    def __init__(self, stream: BinaryIO, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self._lines = iter_lines(stream, chunk_size)
+        self.meta: list[str] = []
+        self.samples: list[str] = []
+        self._read_header()
+
+    def _read_header(self) -> None:
+        for line in self._lines:
+            if line.startswith("##"):
+                self.meta.append(line)
+                continue
+            if line.startswith("#CHROM"):
+                self.samples = line.split("\t")[9:]
+                return
+            raise VcfFormatError("Cabecera VCF inválida: falta la línea #CHROM")
+        raise VcfFormatError("Archivo VCF vacío o sin cabecera")
+
+    def __iter__(self) -> Iterator[VcfRecord]:
+        for line in self._lines:
+            if not line or line.startswith("#"):
+                continue
+            fields = line.split("\t")
+            if len(fields) < 8:
+                raise VcfFormatError(f"Línea VCF con menos de 8 columnas: {line[:80]}")
+            try:
+                pos = int(fields[1])
+            except ValueError:
+                raise VcfFormatError(f"POS no numérico: {fields[1]}")
+            alt = fields[4]
+            yield VcfRecord(
+                chrom=fields[0],
+                pos=pos,
+                id=None if fields[2] == _MISSING else fields[2],
+                ref=fields[3],
+                alt=() if alt == _MISSING else tuple(alt.split(",")),
+                gts=_parse_gts(fields[8:]),
+            )
+
+
+def parse_vcf(stream: BinaryIO, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[VcfRecord]:
+    return iter(VcfReader(stream, chunk_size))
+
+
+def is_variant_gt(gt: Optional[str]) -> bool:
+    """True si el genotipo tiene al menos un alelo alternativo llamado."""
+    if not gt:
+        return False
+    return any(a not in ("0", _MISSING) for a in gt.replace("|", "/").split("/"))
+
+
+def format_record(rec: VcfRecord) -> str:
+    rsid = rec.id or "."
+    return f"{rec.chrom}:{rec.pos} {rsid} {rec.ref}>{','.join(rec.alt) or '.'} GT={rec.gt or '.'}"
+
+
+def summarize_variants(records: Iterable[VcfRecord], max_variants: int = 200) -> dict:
+    """
+    Resumen compacto de un VCF para prompts: recorre todos los registros
+    (memoria constante) y guarda como mucho `max_variants` variantes no
+    referencia, priorizando las que tienen rsID.
+    """
+    total = 0
+    variantes = 0
+    con_rsid: list[str] = []
+    sin_rsid: list[str] = []
+    for rec in records:
+        total += 1
+        if not is_variant_gt(rec.gt) and rec.gts:
+            continue
+        variantes += 1
+        if rec.id and len(con_rsid) < max_variants:
+            con_rsid.append(format_record(rec))
+        elif not rec.id and len(sin_rsid) < max_variants:
+            sin_rsid.append(format_record(rec))
+    return {
+        "registros": total,
+        "variantes": variantes,
+        "muestra": (con_rsid + sin_rsid)[:max_variants],
+    }
@@ -1,11 +1,58 @@
-from fastapi import FastAPI
+import time
+
+_IMPORT_START = time.perf_counter()
+
+import logging
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import users, genetics, admin, ai, reports, chatbot, chatbotmedico
+from app.routers import users, genetics, admin, ai, reports, chatbot, chatbotmedico, recomendaciones
+from app.db.supabase import supabase
+from app.services import rbac, jobs_service, llm_service, pdf_renderer, recomendaciones_service, user_search
 
 from app.core.cors import setup_cors
+from app.core import passwords
+from app.core.logging import REQUEST_ID_HEADER, RequestContextMiddleware, metrics_payload, setup_logging
+from app.core.revocation import revocation_store
+from app.utils.pagination import NEXT_CURSOR_HEADER
 from fastapi.openapi.utils import get_openapi
 
-app = FastAPI(title="NeuroPharm-AI Backend")
+
+setup_logging()
+logger = logging.getLogger("app.startup")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Clientes compartidos (pools httpx) y workers, uno por proceso. El de
+    # OpenAI y los procesos de PDF se crean en su primer uso.
+    inicio = time.perf_counter()
+    await supabase.open()
+    pdf_renderer.start()
+    await jobs_service.start()
+    recomendaciones_service.cargar()
+    # Precarga las asignaciones médico–paciente; si falla se cargan al primer uso
+    try:
+        await rbac.index.warm()
+    except Exception:
+        logger.exception("no se pudieron precargar las asignaciones médico–paciente")
+    # El índice de búsqueda de usuarios se carga en segundo plano (o en la primera búsqueda)
+    warm_busqueda = user_search.index.precargar()
+    logger.info("app lista", extra={
+        "import_ms": round(_IMPORT_MS, 1),
+        "startup_ms": round((time.perf_counter() - inicio) * 1000, 1),
+    })
+    yield
+    warm_busqueda.cancel()
+    await jobs_service.stop()
+    pdf_renderer.stop()
+    passwords.shutdown()
+    revocation_store.close()
+    await llm_service.close()
+    await supabase.close()
+
+
+app = FastAPI(title="NeuroPharm-AI Backend", lifespan=lifespan)
 
 origins = [
     "http://localhost:8030",  # Vite frontend
@@ -18,7 +65,10 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, REQUEST_ID_HEADER],
 )
+# Request id, latencia por ruta y log de acceso (la más externa)
+app.add_middleware(RequestContextMiddleware)
 
 # ---- Rutas y routers ----
 
@@ -26,15 +76,23 @@ app.include_router(users.router, prefix="/users", tags=["Users"])
 app.include_router(genetics.router, prefix="/genetics", tags=["Genetics"])
 app.include_router(admin.router, prefix="/admin", tags=["Admin"])
 app.include_router(ai.router, prefix="/ai", tags=["AI"])
-app.include_router(reports.router, prefix="/reports")  # <-- <---
+app.include_router(reports.router, prefix="/reports", tags=["Informes"])
+# Prefijo antiguo, para los clientes que aún llaman a /informes/...
+app.include_router(reports.router, prefix="/informes", include_in_schema=False)
 app.include_router(chatbot.router, prefix="/chatbot", tags=["Chatbot"])
 app.include_router(chatbotmedico.router, prefix="/chatbotmedico", tags=["chatbotmedico"])
-app.include_router(reports.router, prefix="/informes", tags=["Informes"])
+app.include_router(recomendaciones.router, prefix="/recomendaciones", tags=["Recomendaciones"])
 
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "¡NeuroPharm-AI Backend listo!"}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    # Formato de exposición de Prometheus
+    body, content_type = metrics_payload()
+    return Response(body, media_type=content_type)
+
 def custom_openapi():
     if app.openapi_schema:
         return app.openapi_schema
@@ -61,3 +119,6 @@ def custom_openapi():
 
 
 app.openapi = custom_openapi
+
+# Tiempo de importación de la app (routers, servicios y dependencias)
+_IMPORT_MS = (time.perf_counter() - _IMPORT_START) * 1000